@@ -39,6 +39,8 @@ class SlotsEqualityMixin:
     and theirs values are tested for equality.
     """
 
+    __slots__ = ()
+
     def __eq__(self, other: object) -> bool:
         return get_slots(self) == get_slots(other) and all(
             getattr(self, a) == getattr(other, a) for a in get_slots(self)
@@ -4,14 +4,17 @@ FFmpeg and FFprobe wrappers for media encoding and inspection.
 
 from __future__ import annotations
 
+from .cache import CacheKey, MediaInfoCache  # noqa: F401
+from .chunked import ChunkedEncoder  # noqa: F401
 from .encode import (  # noqa: F401
     ENCODING_REGEX,
     EncodeState,
     EncodeStatistics,
     FrameBasedRatioMixin,
+    ProcessOutput,
 )
-from .ffmpeg import FRAME_MD5_REGEX, FFmpeg  # noqa: F401
-from .ffprobe import DURATION_REGEX, FFprobe  # noqa: F401
+from .ffmpeg import FRAME_MD5_REGEX, FFmpeg, FrameChecksum  # noqa: F401
+from .ffprobe import DURATION_REGEX, EntriesType, FFprobe  # noqa: F401
 from .miscellaneous import (  # noqa: F401
     AudioStream,
     BaseInfo,
@@ -22,6 +25,7 @@ from .miscellaneous import (  # noqa: F401
     SubtitleStream,
     VideoStream,
 )
+from .scheduler import EncodeJob, EncodeScheduler, JobState  # noqa: F401
 from .utils import (  # noqa: F401
     BIT_RATE_COEFFICIENT_FOR_UNIT,
     BIT_RATE_REGEX,
@@ -0,0 +1,144 @@
+"""
+Cache of the media information returned by FFprobe, invalidated when the media file changes.
+"""
+
+from __future__ import annotations
+
+import collections
+import json
+import os
+import sqlite3
+import stat
+import threading
+from pathlib import Path
+from typing import Final, TypeAlias
+
+__all__ = ['CacheKey', 'MediaInfoCache']
+
+CacheKey: TypeAlias = tuple[str, str, int, int]
+
+SCHEMA: Final[str] = """
+CREATE TABLE IF NOT EXISTS media_info (
+    executable TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    info TEXT NOT NULL,
+    PRIMARY KEY (executable, path)
+)
+"""
+
+
+class MediaInfoCache:
+    """
+    Cache the output of FFprobe (JSON) by media file, in-process (LRU) and optionally on disk.
+
+    An entry is keyed by the FFprobe executable, the resolved path of the media file, its size and
+    modification time (nanoseconds): modifying the file invalidates its entry. Pipes, URLs and
+    missing files are not cached.
+
+    The on-disk tier is a SQLite database (at `path`) that can be shared by multiple processes,
+    e.g. the workers of a media library scan. Its entries are replaced when the file changes.
+
+    Every lookup returns a fresh dictionary (the cached JSON is decoded), the callers are free to
+    mutate it. The cache is thread-safe.
+    """
+
+    def __init__(self, maxsize: int = 4096, path: Path | str | None = None) -> None:
+        """
+        Construct a MediaInfoCache.
+
+        :param maxsize: Maximum amount of entries of the in-process tier (0 to disable it).
+        :param path: Path of the SQLite database of the on-disk tier (None to disable it).
+        """
+        self.maxsize = maxsize
+        self.path = None if path is None else Path(path)
+        self._entries: collections.OrderedDict[CacheKey, str] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()  # SQLite connections are not shared between threads
+        if self.path is not None:
+            with self._connect() as connection:
+                connection.execute(SCHEMA)
+        # Statistics
+        self.hits = 0  # Lookups served by the in-process tier counter
+        self.disk_hits = 0  # Lookups served by the on-disk tier counter
+        self.misses = 0  # Lookups not served counter
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def get_key(executable: Path | str, path: Path | str) -> CacheKey | None:
+        """Return the key of the media file at `path` or None if it cannot be cached."""
+        try:
+            path = os.path.realpath(path)
+            status = os.stat(path)
+        except (OSError, TypeError, ValueError):
+            return None
+        if not stat.S_ISREG(status.st_mode):
+            return None
+        return (str(executable), path, status.st_size, status.st_mtime_ns)
+
+    def get(self, key: CacheKey) -> dict | None:
+        """Return the media information cached for `key` or None."""
+        with self._lock:
+            if (info := self._entries.get(key)) is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(info)
+        if self.path is not None and (info := self._get_from_disk(key)) is not None:
+            with self._lock:
+                self.disk_hits += 1
+            self._set_in_memory(key, info)
+            return json.loads(info)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: CacheKey, info: str) -> None:
+        """Cache the media information (the JSON output of FFprobe) for `key`."""
+        self._set_in_memory(key, info)
+        if self.path is not None:
+            executable, path, size, mtime_ns = key
+            with self._connect() as connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO media_info VALUES (?, ?, ?, ?, ?)',
+                    (executable, path, size, mtime_ns, info),
+                )
+
+    def clear(self) -> None:
+        """Remove all the entries, including the on-disk ones."""
+        with self._lock:
+            self._entries.clear()
+        if self.path is not None:
+            with self._connect() as connection:
+                connection.execute('DELETE FROM media_info')
+
+    def _connect(self) -> sqlite3.Connection:
+        if (connection := getattr(self._local, 'connection', None)) is None:
+            connection = sqlite3.connect(self.path, timeout=30)  # type: ignore[arg-type]
+            connection.execute('PRAGMA journal_mode=WAL')  # Readers do not block the writer
+            self._local.connection = connection
+        return connection
+
+    def _get_from_disk(self, key: CacheKey) -> str | None:
+        executable, path, size, mtime_ns = key
+        row = (
+            self._connect()
+            .execute(
+                'SELECT info FROM media_info '
+                'WHERE executable = ? AND path = ? AND size = ? AND mtime_ns = ?',
+                (executable, path, size, mtime_ns),
+            )
+            .fetchone()
+        )
+        return None if row is None else row[0]
+
+    def _set_in_memory(self, key: CacheKey, info: str) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = info
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -0,0 +1,223 @@
+"""
+Encoding of a long input by segments encoded in parallel, then concatenated without re-encoding.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections.abc
+import datetime
+import tempfile
+from pathlib import Path
+
+from pytoolbox import subprocess as py_subprocess
+
+from . import encode, ffmpeg, scheduler
+
+__all__ = ['ChunkedEncoder']
+
+
+class ChunkedEncoder:
+    """
+    Encode a media by segments aligned on the key frames of its video stream (GOPs), encoded in
+    parallel by an :class:`~.scheduler.EncodeScheduler` then concatenated with the concat demuxer
+    (streams are copied).
+
+    A single FFmpeg process is limited by how the encoder scales with its threads, a feature-length
+    media split in segments of `segment_duration` seconds is encoded by as many processes as the CPU
+    budget allows.
+
+    The segments are cut at key frames of the input (every segment is starting with a key frame)
+    but the audio is encoded by segments too, depending on the audio codec, a few milliseconds of
+    silence may be heard at the boundaries. The options must not change the timeline of the media
+    (e.g. no sub-clipping with ``-ss`` or ``-t``).
+
+    **Example usage**
+
+    >> encoder = ChunkedEncoder(FFmpeg(), segment_duration=120, cpu_budget=64)
+    >> async for statistics in encoder.encode_async('movie.mkv', 'movie.mp4', None, '-c:v libx264'):
+    ..     print(statistics.ratio, statistics.eta_time)
+    """
+
+    concat_in_options: list[str] = ['-f', 'concat', '-safe', '0']
+    concat_out_options: list[str] = ['-map', '0', '-c', 'copy']
+    scheduler_class: type[scheduler.EncodeScheduler] = scheduler.EncodeScheduler
+
+    def __init__(
+        self,
+        encoder: ffmpeg.FFmpeg | None = None,
+        *,
+        segment_duration: float = 60.0,
+        cpu_budget: int | None = None,
+        threads_per_job: int = 4,
+        retries: int = 1,
+    ) -> None:
+        """
+        Construct a ChunkedEncoder.
+
+        :param encoder: The FFmpeg wrapper encoding the segments and concatenating them.
+        :param segment_duration: Minimum duration of a segment (seconds), the last one excepted.
+        :param cpu_budget: Total amount of threads of the segments encoded in parallel.
+        :param threads_per_job: Amount of threads of a segment.
+        :param retries: Amount of times the encoding of a segment is retried.
+        """
+        self.encoder = encoder or ffmpeg.FFmpeg()
+        self.segment_duration = segment_duration
+        self.cpu_budget = cpu_budget
+        self.threads_per_job = threads_per_job
+        self.retries = retries
+
+    def get_keyframes(self, media: object) -> list[float]:
+        """Return the timestamps of the key frames of `media`, relative to its start."""
+        probe = self.encoder.ffprobe
+        try:
+            start_time = float((probe.get_media_info(media) or {})['format']['start_time'])
+        except (KeyError, TypeError, ValueError):
+            start_time = 0.0
+        return [keyframe - start_time for keyframe in probe.get_video_keyframes(media)]
+
+    @staticmethod
+    def get_segments(
+        keyframes: collections.abc.Iterable[float],
+        duration: float,
+        segment_duration: float,
+    ) -> list[tuple[float, float | None]]:
+        """
+        Return the segments (start, end) of a media, cut at key frames, the last end being None.
+
+        Segments are at least `segment_duration` long and the last one at least half of it.
+
+        **Example usage**
+
+        >>> ChunkedEncoder.get_segments([0, 2, 4, 6, 8, 10, 12], 13.5, 4)
+        [(0.0, 4.0), (4.0, 8.0), (8.0, None)]
+        >>> ChunkedEncoder.get_segments([0, 5, 7.5, 11], 14.0, 4)
+        [(0.0, 5.0), (5.0, 11.0), (11.0, None)]
+        >>> ChunkedEncoder.get_segments([], 13.5, 4)
+        [(0.0, None)]
+        """
+        starts = [0.0]
+        for keyframe in keyframes:
+            if keyframe - starts[-1] >= segment_duration and (
+                duration - keyframe >= segment_duration / 2
+            ):
+                starts.append(float(keyframe))
+        return list(zip(starts, [*starts[1:], None]))
+
+    async def encode_async(  # pylint:disable=too-many-locals
+        self,
+        the_input: object,
+        output: object,
+        in_options: py_subprocess.CallArgsType | None = None,
+        out_options: py_subprocess.CallArgsType | None = None,
+    ) -> collections.abc.AsyncIterator[encode.EncodeStatistics]:
+        """
+        Encode the input to the output by segments and yield the statistics of the whole encoding.
+
+        The statistics are the ones of `the_input` to `output` (see :meth:`FFmpeg.encode_async`),
+        their process is the scheduler encoding the segments. The progress is the sum of the
+        progress of the segments. The segments are encoded in a temporary directory next to the
+        output. The encoding fails if a segment fails (after retries) or the concatenation fails.
+        """
+        probe = self.encoder.ffprobe
+        the_input, output = probe.to_media(the_input), probe.to_media(output)
+        in_options = py_subprocess.to_args_list(in_options)
+        out_options = py_subprocess.to_args_list(out_options)
+        output.create_directory()
+
+        statistics = await asyncio.to_thread(
+            self.encoder.statistics_class,
+            [probe.media_class(the_input.path, the_input.options)],
+            [probe.media_class(output.path)],
+            in_options,
+            out_options,
+        )
+        duration = (statistics.input.duration or datetime.timedelta(0)).total_seconds()
+        keyframes = await asyncio.to_thread(self.get_keyframes, the_input)
+        segments = self.get_segments(keyframes, duration, self.segment_duration)
+
+        jobs_scheduler = self.scheduler_class(
+            self.encoder,
+            cpu_budget=self.cpu_budget,
+            threads_per_job=self.threads_per_job,
+            retries=self.retries,
+        )
+        updates: asyncio.Queue[scheduler.EncodeJob | None] = asyncio.Queue()
+        jobs_scheduler.on_progress = updates.put_nowait  # type: ignore[assignment]
+
+        with tempfile.TemporaryDirectory(prefix='.segments-', dir=output.directory) as directory:
+            jobs = []
+            for number, (start, end) in enumerate(segments):
+                segment_options = ['-ss', str(start)] + (
+                    [] if end is None else ['-t', str(end - start)]
+                )
+                jobs.append(
+                    jobs_scheduler.submit(
+                        probe.media_class(the_input.path, the_input.options),
+                        Path(directory) / f'{number:05d}{Path(output.path).suffix}',
+                        [*in_options, *segment_options],
+                        out_options,
+                    )
+                )
+            yield statistics.start(jobs_scheduler)
+
+            task = asyncio.create_task(jobs_scheduler.run())
+            task.add_done_callback(lambda _: updates.put_nowait(None))
+            try:
+                while await updates.get() is not None:
+                    yield statistics.progress_values(
+                        self._get_progress_values(jobs, segments, duration)
+                    )
+                task.result()
+            finally:
+                if not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+
+            if failed := [job for job in jobs if job.state != scheduler.JobState.SUCCESS]:
+                for job in failed:
+                    if job.statistics is not None:
+                        statistics.append_output(job.statistics.process_output)
+                yield await asyncio.to_thread(statistics.end, 1)
+                return
+
+            concat_path = Path(directory) / 'concat.txt'
+            concat_path.write_text(
+                ''.join(f"file '{self._escape(job.outputs)}'\n" for job in jobs),
+                encoding='utf-8',
+            )
+            concat_statistics = None
+            async for concat_statistics in self.encoder.encode_async(
+                concat_path,
+                output,
+                self.concat_in_options,
+                self.concat_out_options,
+            ):
+                pass
+            assert concat_statistics is not None
+            returncode = concat_statistics.returncode
+            assert returncode is not None  # Set when the encoding ended
+            if returncode:
+                statistics.append_output(concat_statistics.process_output)
+            yield await asyncio.to_thread(statistics.end, returncode)
+
+    @staticmethod
+    def _escape(path: object) -> str:
+        return str(path).replace("'", "'\\''")
+
+    @staticmethod
+    def _get_progress_values(
+        jobs: list[scheduler.EncodeJob],
+        segments: list[tuple[float, float | None]],
+        duration: float,
+    ) -> dict[str, str]:
+        encoded, frame = 0.0, 0
+        for job, (start, end) in zip(jobs, segments):
+            length = (duration if end is None else end) - start
+            if job.state == scheduler.JobState.SUCCESS:
+                encoded += length
+            elif job.statistics is not None and job.statistics.output.duration:
+                encoded += min(length, job.statistics.output.duration.total_seconds())
+            if job.statistics is not None:
+                frame += job.statistics.frame or 0
+        return {'out_time_us': str(int(encoded * 1_000_000)), 'frame': str(frame)}
@@ -4,16 +4,25 @@ Encoding progress tracking and statistics for FFmpeg.
 
 from __future__ import annotations
 
+import collections
+import collections.abc
 import datetime
 import re
 import time
-from typing import Final
+from pathlib import Path
+from typing import IO, Final
 
 from pytoolbox.datetime import datetime_now, multiply_time, secs_to_time, str_to_time, time_ratio
 
-from . import ffprobe, utils
+from . import ffprobe, miscellaneous, utils
 
-__all__ = ['ENCODING_REGEX', 'EncodeState', 'EncodeStatistics', 'FrameBasedRatioMixin']
+__all__ = [
+    'ENCODING_REGEX',
+    'EncodeState',
+    'EncodeStatistics',
+    'FrameBasedRatioMixin',
+    'ProcessOutput',
+]
 
 ENCODING_REGEX: Final[re.Pattern[str]] = re.compile(
     # frame= 2071 fps=  0 q=-1.0 size=   34623kB time=00:01:25.89 bitrate=3302.3kbits/s
@@ -39,12 +48,113 @@ class EncodeState:  # pylint:disable=too-few-public-methods
     FINAL_STATES = frozenset([SUCCESS, FAILURE])
 
 
+class ProcessOutput:
+    r"""
+    Capture the output of a process in bounded memory: its first `head_size` characters (e.g. the
+    header printed by FFmpeg) and its last `tail_size` characters (e.g. the reason of a failure).
+
+    The full output can be spilled to a file at `path` (appended, written as it comes).
+
+    **Example usage**
+
+    >>> output = ProcessOutput(head_size=6, tail_size=8)
+    >>> for chunk in ('header', 'line 1\n', 'line 2\n', 'line 3\n'):
+    ...     output.write(chunk)
+    >>> output.head, output.tail, output.dropped, len(output)
+    ('header', '\nline 3\n', 13, 27)
+    >>> print(output)
+    header
+    [... 13 characters dropped ...]
+    <BLANKLINE>
+    line 3
+    <BLANKLINE>
+
+    Keeping only the head:
+
+    >>> output = ProcessOutput(head_size=6, tail_size=0)
+    >>> for chunk in ('header', 'line 1\n'):
+    ...     output.write(chunk)
+    >>> output.head, output.tail, output.dropped
+    ('header', '', 7)
+    """
+
+    def __init__(
+        self,
+        head_size: int = 16 * 1024,
+        tail_size: int = 64 * 1024,
+        path: Path | str | None = None,
+        *,
+        encoding: str = 'utf-8',
+    ) -> None:
+        """
+        Construct a ProcessOutput.
+
+        :param head_size: Amount of characters kept from the beginning of the output.
+        :param tail_size: Amount of characters kept from the end of the output.
+        :param path: Path of the file where to write the full output (None to disable it).
+        :param encoding: Encoding of the file.
+        """
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.path = None if path is None else Path(path)
+        self.encoding = encoding
+        self.head = ''
+        self.dropped = 0  # Characters neither in the head nor in the tail counter
+        self._file: IO[str] | None = None
+        self._tail: collections.deque[str] = collections.deque()
+        self._tail_length = 0
+
+    def __len__(self) -> int:
+        return len(self.head) + self.dropped + self._tail_length
+
+    def __str__(self) -> str:
+        if self.dropped:
+            return f'{self.head}\n[... {self.dropped} characters dropped ...]\n{self.tail}'
+        return self.head + self.tail
+
+    @property
+    def tail(self) -> str:
+        """Returns the last characters of the output (after the head)."""
+        return ''.join(self._tail)
+
+    def write(self, chunk: str) -> None:
+        """Append a chunk of output."""
+        if self.path is not None:
+            if self._file is None:  # Kept open until closed
+                # pylint:disable=consider-using-with
+                self._file = self.path.open('a', encoding=self.encoding)
+            self._file.write(chunk)
+        if (missing := self.head_size - len(self.head)) > 0:
+            self.head += chunk[:missing]
+            chunk = chunk[missing:]
+        if not chunk:
+            return
+        self._tail.append(chunk)
+        self._tail_length += len(chunk)
+        # Drop the oldest chunks, then the oldest characters
+        while self._tail and self._tail_length - len(self._tail[0]) >= self.tail_size:
+            length = len(self._tail.popleft())
+            self._tail_length -= length
+            self.dropped += length
+        if (extra := self._tail_length - self.tail_size) > 0:
+            self._tail[0] = self._tail[0][extra:]
+            self._tail_length -= extra
+            self.dropped += extra
+
+    def close(self) -> None:
+        """Close the file where the full output is written (if any)."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 class EncodeStatistics:  # pylint:disable=too-many-instance-attributes
     """Track and report FFmpeg encoding progress and statistics."""
 
     default_in_duration = datetime.timedelta(seconds=0)
     encoding_regex = ENCODING_REGEX
     ffprobe_class = ffprobe.FFprobe
+    process_output_class = ProcessOutput
     states = EncodeState
 
     def __init__(
@@ -55,7 +165,14 @@ class EncodeStatistics:  # pylint:disable=too-many-instance-attributes
         out_options: list[str],
         in_base_index: int = 0,
         out_base_index: int = 0,
+        process_output_path: Path | str | None = None,
     ) -> None:
+        """
+        Construct an EncodeStatistics.
+
+        The output of FFmpeg is captured in bounded memory (see :class:`ProcessOutput`) and
+        optionally written in full to `process_output_path`.
+        """
         self.inputs = inputs
         self.outputs = outputs
         self.in_options = in_options
@@ -64,8 +181,8 @@ class EncodeStatistics:  # pylint:disable=too-many-instance-attributes
         self.out_base_index = out_base_index
 
         self.process = None
-        self.process_output = ''
-        self.returncode = None
+        self.capture = self.process_output_class(path=process_output_path)
+        self.returncode: int | None = None
 
         self.state = self.states.NEW
         self.start_date = None
@@ -97,12 +214,17 @@ class EncodeStatistics:  # pylint:disable=too-many-instance-attributes
         return multiply_time(self.elapsed_time, (1.0 - self.ratio) / self.ratio, as_delta=True)
 
     @property
-    def input(self) -> object:
+    def process_output(self) -> str:
+        """Return the output of FFmpeg (its head and tail if too long)."""
+        return str(self.capture)
+
+    @property
+    def input(self) -> miscellaneous.Media:
         """Return the primary input :class:`~.miscellaneous.Media`."""
         return self.inputs[self.in_base_index]
 
     @property
-    def output(self) -> object:
+    def output(self) -> miscellaneous.Media:
         """Return the primary output :class:`~.miscellaneous.Media`."""
         return self.outputs[self.out_base_index]
 
@@ -125,25 +247,28 @@ class EncodeStatistics:  # pylint:disable=too-many-instance-attributes
 
     def progress(self, chunk: str) -> EncodeStatistics:
         """Update statistics from an FFmpeg output chunk."""
-        self.state = self.states.PROCESSING
-        self.elapsed_time = datetime.timedelta(seconds=time.time() - self.start_time)
-        if ffmpeg_statistics := self._parse_chunk(chunk):
-            self.output.duration = ffmpeg_statistics['time']
-            self.frame = ffmpeg_statistics['frame']
-            self.frame_rate = ffmpeg_statistics['frame_rate']
-            self.qscale = ffmpeg_statistics['qscale']
-            self.output.size = ffmpeg_statistics['size']
-            self.bit_rate = ffmpeg_statistics['bit_rate']
-        self._update_ratio()
-        return self
+        return self._update(self._parse_chunk(chunk))
+
+    def progress_values(self, values: dict[str, str]) -> EncodeStatistics:
+        """
+        Update statistics from a block of FFmpeg ``-progress`` key=value pairs.
+
+        Values not available (N/A) are kept unchanged.
+        """
+        return self._update(self._parse_progress_values(values))
+
+    def append_output(self, chunk: str) -> None:
+        """Append a chunk of the output (stderr) of FFmpeg to ``process_output``."""
+        self.capture.write(chunk)
 
     def end(self, returncode: int) -> EncodeStatistics:
         """Finalize statistics after encoding completes."""
         self.state = self.states.FAILURE if returncode else self.states.SUCCESS
         self.returncode = returncode
+        self.capture.close()
         self.elapsed_time = datetime.timedelta(seconds=time.time() - self.start_time)
         self.frame_rate = self.frame / (self.elapsed_time.total_seconds() or 0.0001)
-        self.output.duration = self.ffprobe_class().get_media_duration(
+        self.output.duration = self.ffprobe_class().get_media_duration(  # type: ignore[assignment]
             self.output.path,
             as_delta=True,
         )
@@ -151,6 +276,23 @@ class EncodeStatistics:  # pylint:disable=too-many-instance-attributes
         self._update_ratio()
         return self
 
+    def _update(self, ffmpeg_statistics: dict[str, object] | None) -> EncodeStatistics:
+        self.state = self.states.PROCESSING
+        self.elapsed_time = datetime.timedelta(seconds=time.time() - self.start_time)
+        if ffmpeg_statistics:
+            self.output.duration = ffmpeg_statistics.get(  # type: ignore[assignment]
+                'time', self.output.duration
+            )
+            self.frame = ffmpeg_statistics.get('frame', self.frame)
+            self.frame_rate = ffmpeg_statistics.get('frame_rate', self.frame_rate)
+            self.qscale = ffmpeg_statistics.get('qscale', self.qscale)
+            self.output.size = ffmpeg_statistics.get(  # type: ignore[assignment]
+                'size', self.output.size
+            )
+            self.bit_rate = ffmpeg_statistics.get('bit_rate', self.bit_rate)
+        self._update_ratio()
+        return self
+
     def _update_ratio(self) -> None:
         if self.state == self.states.SUCCESS:
             self.ratio = 1.0
@@ -188,7 +330,7 @@ class EncodeStatistics:  # pylint:disable=too-many-instance-attributes
         return sub_duration, int(size * time_ratio(sub_duration, duration))
 
     def _parse_chunk(self, chunk: str) -> dict[str, object] | None:
-        self.process_output += chunk
+        self.append_output(chunk)
         if not (match := self.encoding_regex.match(chunk.strip())):
             return None
         ffmpeg_statistics = match.groupdict()
@@ -204,6 +346,34 @@ class EncodeStatistics:  # pylint:disable=too-many-instance-attributes
         ffmpeg_statistics['bit_rate'] = utils.to_bit_rate(ffmpeg_statistics['bit_rate'])
         return ffmpeg_statistics
 
+    @staticmethod
+    def _parse_progress_values(values: dict[str, str]) -> dict[str, object]:
+        ffmpeg_statistics: dict[str, object] = {}
+        parsers: dict[str, tuple[str, collections.abc.Callable[[str], object]]] = {
+            'frame': ('frame', int),
+            'fps': ('frame_rate', float),
+            'total_size': ('size', int),
+            'out_time_us': ('time', lambda value: datetime.timedelta(microseconds=int(value))),
+            'bitrate': ('bit_rate', lambda value: utils.to_bit_rate(value.strip())),
+        }
+        parser: collections.abc.Callable[[str], object]
+        for key, value in values.items():
+            if value.strip() == 'N/A':
+                continue
+            if key.endswith('_q'):  # Quality of the first video stream, e.g. stream_0_0_q
+                name, parser = 'qscale', float
+                if name in ffmpeg_statistics:
+                    continue
+            elif key in parsers:
+                name, parser = parsers[key]
+            else:
+                continue
+            try:
+                ffmpeg_statistics[name] = parser(value)
+            except ValueError:
+                pass  # Broken value, ignore it
+        return ffmpeg_statistics
+
     @staticmethod
     def _to_time(value: str) -> datetime.timedelta | None:
         method = str_to_time if ':' in value else secs_to_time
@@ -4,25 +4,67 @@ FFmpeg process wrapper for media encoding with progress tracking.
 
 from __future__ import annotations
 
+import asyncio
+import codecs
+import collections.abc
+import contextlib
 import errno
 import itertools
+import os
 import re
 import select
+import selectors
 import subprocess
 import sys
 import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Final
+from typing import Final, TypeVar
 
-from pytoolbox import filesystem
 from pytoolbox import subprocess as py_subprocess
 
 from . import encode, ffprobe  # pylint:disable=unused-import
+from .encode import EncodeStatistics
 
-__all__ = ['FRAME_MD5_REGEX', 'FFmpeg']
+__all__ = ['FRAME_MD5_REGEX', 'FFmpeg', 'FrameChecksum']
 
 FRAME_MD5_REGEX: Final[re.Pattern] = re.compile(r'[a-z0-9]{32}', re.MULTILINE)
 
+ResultType = TypeVar('ResultType')
+
+
+@dataclass(frozen=True, slots=True)
+class FrameChecksum:
+    """The checksum of a frame, a line of the output of the framemd5 muxer."""
+
+    stream: int
+    dts: int
+    pts: int
+    duration: int
+    size: int
+    checksum: str
+
+    @classmethod
+    def from_line(cls, line: str) -> FrameChecksum | None:
+        """
+        Return the checksum of a frame parsed from a line or None if not a frame (e.g. a comment).
+
+        **Example usage**
+
+        >>> FrameChecksum.from_line('0,  0,  0,  1,  230400, 5a1ddf4d1ea3d9aa6af29fb9e28ba7c9')
+        FrameChecksum(stream=0, dts=0, pts=0, duration=1, size=230400, checksum='5a1dd...7c9')
+        >>> FrameChecksum.from_line('#stream#, dts,        pts, duration,     size, hash') is None
+        True
+        """
+        fields = [field.strip() for field in line.split(',')]
+        if len(fields) != 6 or not FRAME_MD5_REGEX.fullmatch(fields[5]):
+            return None
+        try:
+            stream, dts, pts, duration, size = (int(field) for field in fields[:5])
+        except ValueError:
+            return None
+        return cls(stream, dts, pts, duration, size, fields[5])
+
 
 class FFmpeg:
     """
@@ -66,10 +108,16 @@ class FFmpeg:
         process_poll: bool = True,
         process_kwargs: dict | None = None,
         statistics_kwargs: dict | None = None,
+        progress: bool = False,
     ) -> object:
         """
         Encode a set of input files input to a set of output files and yields statistics about the
         encoding.
+
+        If `progress` is True, the statistics are read from the machine-readable ``-progress``
+        output of FFmpeg (through a dedicated pipe) and yielded as soon as FFmpeg reports them, the
+        encoding ends as soon as FFmpeg exits (`process_poll` and `encode_poll_delay` are not
+        used). Not available on Windows.
         """
         arguments, inputs, outputs, in_options, out_options = self._get_arguments(
             inputs,
@@ -91,32 +139,251 @@ class FFmpeg:
             **(statistics_kwargs or {}),
         )
 
-        process = self._get_process(arguments, **(process_kwargs or {}))
-        try:  # pylint:disable=too-many-try-statements
+        progress_fd = None
+        if progress:
+            progress_fd, write_fd = os.pipe()
+            arguments[1:1] = ['-nostats', '-progress', f'pipe:{write_fd}']
+            process_kwargs = {**(process_kwargs or {}), 'pass_fds': (write_fd,)}
+            try:
+                process = self._get_process(arguments, **process_kwargs)
+            except Exception:
+                os.close(progress_fd)
+                raise
+            finally:
+                os.close(write_fd)  # Only FFmpeg is writing, the pipe is closed when it exits
+        else:
+            process = self._get_process(arguments, **(process_kwargs or {}))
+        returncode: int | None
+        try:
             yield statistics.start(process)
-            while True:
-                chunk = self._get_chunk(process)
-                yield statistics.progress(chunk or '')
-                if process_poll:
-                    if (returncode := process.poll()) is not None:
-                        break
-                if self.encode_poll_delay:
-                    time.sleep(self.encode_poll_delay)
+            if progress_fd is not None:
+                returncode = yield from self._follow_progress(process, progress_fd, statistics)
+            else:
+                while True:
+                    chunk = self._get_chunk(process)
+                    yield statistics.progress(chunk or '')
+                    if process_poll:
+                        if (returncode := process.poll()) is not None:
+                            break
+                    if self.encode_poll_delay:
+                        time.sleep(self.encode_poll_delay)
             yield statistics.end(returncode)
         except Exception as exc:
             traceback = sys.exc_info()[2]
             py_subprocess.kill(process)
             raise exc.with_traceback(traceback) if hasattr(exc, 'with_traceback') else exc
+        finally:
+            if progress_fd is not None:
+                os.close(progress_fd)
+
+    async def encode_async(  # pylint:disable=too-many-locals
+        self,
+        inputs: object,
+        outputs: object,
+        in_options: object = None,
+        out_options: object = None,
+        create_directories: bool = True,
+        process_kwargs: dict | None = None,
+        statistics_kwargs: dict | None = None,
+    ) -> collections.abc.AsyncIterator[EncodeStatistics]:
+        """
+        Asynchronous variant of :meth:`encode` (`progress` set to True) built on :mod:`asyncio`.
+
+        The statistics are created and ended (both are probing the medias) in a worker thread to
+        keep the event loop responsive. FFmpeg is killed if the encoding is cancelled or the
+        generator is closed before its end. Not available on Windows.
+        """
+        arguments, inputs, outputs, in_options, out_options = self._get_arguments(
+            inputs,
+            outputs,
+            in_options,
+            out_options,
+        )
+
+        # Create outputs directories
+        if create_directories:
+            for output in outputs:
+                output.create_directory()
+
+        statistics = await asyncio.to_thread(
+            self.statistics_class,
+            inputs,
+            outputs,
+            in_options,
+            out_options,
+            **(statistics_kwargs or {}),
+        )
+
+        # The pipes are not handled by the process transport, so that waiting for FFmpeg does not
+        # wait for the pipes (they may be kept open by another process spawned by FFmpeg)
+        progress_fd, write_fd = os.pipe()
+        output_fd, output_write_fd = os.pipe()
+        arguments[1:1] = ['-nostats', '-progress', f'pipe:{write_fd}']
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *arguments,
+                stderr=output_write_fd,
+                pass_fds=(write_fd,),
+                **(process_kwargs or {}),
+            )
+        except Exception:
+            os.close(progress_fd)
+            os.close(output_fd)
+            raise
+        finally:
+            # Only FFmpeg is writing, the pipes are closed when it exits
+            os.close(write_fd)
+            os.close(output_write_fd)
+
+        transport, reader = await self._open_pipe_async(progress_fd)
+        output_transport, output_reader = await self._open_pipe_async(output_fd)
+        output_task = asyncio.create_task(self._read_output_async(output_reader, statistics))
+        try:  # pylint:disable=too-many-try-statements
+            yield statistics.start(process)
+            values: dict[str, str] = {}
+            while line := await self._wait_for_async(process, reader.readline()):
+                name, _, value = line.decode(self.encoding, errors='replace').partition('=')
+                values[name.strip()] = value.strip()
+                if name == 'progress':  # Last key of a block
+                    yield statistics.progress_values(values)
+                    values = {}
+            await self._wait_for_async(process, output_task)
+            returncode = await process.wait()
+            yield await asyncio.to_thread(statistics.end, returncode)
+        finally:
+            transport.close()
+            output_transport.close()
+            output_task.cancel()
+            if process.returncode is None:
+                with contextlib.suppress(ProcessLookupError):  # Already exited
+                    process.kill()
+                await process.wait()
 
     @staticmethod
-    def get_frames_md5_checksum(filename: Path) -> str | None:
-        """Return the MD5 checksum of all frames in *filename*."""
-        with filesystem.TempStorage() as tmp:
-            checksum_filename = tmp.create_tmp_file(return_file=False)
-            FFmpeg()('-y', '-i', filename, '-f', 'framemd5', checksum_filename).wait()
-            with open(checksum_filename, encoding='utf-8') as f:
-                match = FRAME_MD5_REGEX.search(f.read())
-            return match.group() if match else None
+    async def _open_pipe_async(
+        fd: int,  # pylint:disable=invalid-name
+    ) -> tuple[asyncio.ReadTransport, asyncio.StreamReader]:
+        reader = asyncio.StreamReader()
+        transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            os.fdopen(fd, 'rb', 0),
+        )
+        return transport, reader
+
+    async def _wait_for_async(
+        self,
+        process: asyncio.subprocess.Process,
+        awaitable: collections.abc.Awaitable[ResultType],
+    ) -> ResultType | None:
+        """
+        Return the result of `awaitable` (reading a pipe) or None if FFmpeg exited and it is not
+        done within `chunk_read_timeout` (the pipe is kept open by another process spawned by
+        FFmpeg).
+        """
+        task = asyncio.ensure_future(awaitable)
+        try:
+            while True:
+                exited = process.returncode is not None
+                done, _ = await asyncio.wait([task], timeout=self.chunk_read_timeout)
+                if done:
+                    return task.result()
+                if exited:
+                    return None
+        finally:
+            task.cancel()
+
+    async def _read_output_async(
+        self,
+        stream: asyncio.StreamReader,
+        statistics: EncodeStatistics,
+    ) -> None:
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        while chunk := await stream.read(65536):
+            statistics.append_output(decoder.decode(chunk))
+        statistics.append_output(decoder.decode(b'', final=True))
+
+    @classmethod
+    def get_frames_md5_checksum(cls, filename: Path) -> str | None:
+        """
+        Return the MD5 checksum of the first frame in *filename* (FFmpeg stops right after).
+
+        Return None if there is no frame, also if FFmpeg fails before decoding any.
+        """
+        frames = cls().iter_frames_md5(filename)
+        try:
+            frame = next(frames, None)
+        except subprocess.CalledProcessError:
+            frame = None
+        finally:
+            frames.close()
+        return None if frame is None else frame.checksum
+
+    def get_frames_md5_mismatch(
+        self,
+        filename: Path,
+        reference: collections.abc.Iterable[FrameChecksum | str],
+        *,
+        options: py_subprocess.CallArgsType | None = None,
+    ) -> int | None:
+        """
+        Return the index of the first frame in *filename* not matching `reference` or None.
+
+        The frames are compared to the reference (checksums or only their MD5 hex digests) as they
+        are decoded, FFmpeg is killed at the first mismatch. A missing or an extra frame is a
+        mismatch.
+        """
+        frames = self.iter_frames_md5(filename, options=options)
+        try:
+            for index, (frame, expected) in enumerate(itertools.zip_longest(frames, reference)):
+                if frame is None or expected is None:
+                    return index
+                if expected != (frame if isinstance(expected, FrameChecksum) else frame.checksum):
+                    return index
+        finally:
+            frames.close()
+        return None
+
+    def iter_frames_md5(
+        self,
+        filename: Path,
+        *,
+        options: py_subprocess.CallArgsType | None = None,
+    ) -> collections.abc.Generator[FrameChecksum]:
+        """
+        Yield the checksums of the frames of all the streams in *filename*, as they are decoded.
+
+        The output of the framemd5 muxer is read from a pipe (nothing is written to disk), set
+        `options` to select the streams, e.g. ``['-map', '0:v']``. FFmpeg is killed if the iteration
+        is stopped before the end. Raise a :class:`subprocess.CalledProcessError` if FFmpeg fails.
+        """
+        arguments: list[py_subprocess.CallArgType] = [
+            self.executable,
+            '-nostdin',
+            '-i',
+            filename,
+            *py_subprocess.to_args_list(options),
+            '-f',
+            'framemd5',
+            '-',
+        ]
+        process = py_subprocess.raw_cmd(
+            arguments,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        try:
+            assert process.stdout is not None
+            for line in process.stdout:
+                if (frame := FrameChecksum.from_line(line)) is not None:
+                    yield frame
+            if returncode := process.wait():
+                raise subprocess.CalledProcessError(returncode, process.args)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
 
     def _clean_medias_argument(self, value: object) -> list:
         """
@@ -170,6 +437,50 @@ class FFmpeg:
                 raise
         return None
 
+    def _follow_progress(
+        self,
+        process: subprocess.Popen,
+        progress_fd: int,
+        statistics: EncodeStatistics,
+    ) -> collections.abc.Generator[EncodeStatistics, None, int]:
+        """
+        Yield the statistics updated by every block of the ``-progress`` output of FFmpeg (read from
+        `progress_fd`) while collecting its output (stderr), then return its exit code.
+        """
+        assert process.stderr is not None
+        decoders = {
+            progress_fd: codecs.getincrementaldecoder(self.encoding)(errors='replace'),
+            process.stderr.fileno(): codecs.getincrementaldecoder(self.encoding)(errors='replace'),
+        }
+        values: dict[str, str] = {}
+        line = ''
+        with selectors.DefaultSelector() as selector:
+            for fd in decoders:
+                selector.register(fd, selectors.EVENT_READ)
+            while selector.get_map():
+                events = selector.select(self.chunk_read_timeout)
+                if not events and process.poll() is not None:
+                    break  # The pipes are kept open by another process (spawned by FFmpeg)
+                for key, _ in events:
+                    try:
+                        data = os.read(key.fd, 65536)
+                    except BlockingIOError:
+                        continue
+                    text = decoders[key.fd].decode(data, final=not data)
+                    if not data:
+                        selector.unregister(key.fd)
+                    if key.fd != progress_fd:
+                        statistics.append_output(text)
+                        continue
+                    *lines, line = (line + text).split('\n')
+                    for line_ in lines:
+                        name, _, value = line_.partition('=')
+                        values[name.strip()] = value.strip()
+                        if name == 'progress':  # Last key of a block
+                            yield statistics.progress_values(values)
+                            values = {}
+        return process.wait()
+
     @staticmethod
     def _get_process(arguments: list, **process_kwargs: object) -> subprocess.Popen:
         """Return an encoding process with stderr made asynchronous."""
@@ -4,7 +4,9 @@ FFprobe wrapper for extracting media file information.
 
 from __future__ import annotations
 
+import asyncio
 import collections.abc
+import contextlib
 import datetime
 import errno
 import itertools
@@ -13,8 +15,9 @@ import math
 import os
 import re
 import subprocess
+from concurrent import futures
 from pathlib import Path
-from typing import Final, Type
+from typing import Final, Type, TypeAlias
 
 from defusedxml import minidom
 
@@ -22,17 +25,34 @@ from pytoolbox import subprocess as py_subprocess
 from pytoolbox.datetime import parts_to_time, secs_to_time
 
 from . import miscellaneous, utils
+from .cache import CacheKey, MediaInfoCache
 
-__all__ = ['DURATION_REGEX', 'FFprobe']
+__all__ = ['DURATION_REGEX', 'EntriesType', 'FFprobe']
+
+EntriesType: TypeAlias = collections.abc.Mapping[str, collections.abc.Iterable[str]]
 
 DURATION_REGEX: Final[re.Pattern] = re.compile(
     r'PT(?P<hours>\d+)H(?P<minutes>\d+)M(?P<seconds>[^S]+)S',
 )
 
+# End of the medias of the bulk methods (None may be a media, probed as an error)
+_END: Final[object] = object()
+
 
 class FFprobe:
-    """Probe media files for format, streams, and duration information."""
+    """
+    Probe media files for format, streams, and duration information.
+
+    The media information is cached by `cache` (shared by all instances, see
+    :class:`~.cache.MediaInfoCache`), set it to None to always call FFprobe or to a cache with an
+    on-disk tier to share it between processes.
 
+    The `get_*` methods accept `entries` to probe only some fields by section, e.g.
+    ``{'format': ['duration']}`` (see :meth:`get_show_entries`) instead of the whole format and
+    streams sections. The cached information of a media is stored by entries.
+    """
+
+    cache: MediaInfoCache | None = MediaInfoCache()
     executable: Path = Path('ffprobe')
     duration_regex: re.Pattern = DURATION_REGEX
     format_class: type | None = None
@@ -58,6 +78,7 @@ class FFprobe:
         media: object,
         *,
         as_delta: bool = False,
+        entries: EntriesType | None = None,
         fail: bool = False,
     ) -> datetime.timedelta | datetime.time | None:
         """
@@ -82,7 +103,7 @@ class FFprobe:
                     microseconds, seconds = int(1000000 * microseconds), int(seconds)
                     return parts_to_time(hours, minutes, seconds, microseconds, as_delta=as_delta)
         else:
-            info = self.get_media_info(media, fail=fail)
+            info = self.get_media_info(media, entries=entries, fail=fail)
             duration = None
             if info:
                 try:
@@ -98,53 +119,224 @@ class FFprobe:
                 return duration
         return None
 
-    def get_media_info(self, media: object, *, fail: bool = False) -> dict | None:
+    def get_media_info(
+        self,
+        media: object,
+        *,
+        entries: EntriesType | None = None,
+        fail: bool = False,
+    ) -> dict | None:
         """
         Return a Python dictionary containing information about the media or None in case of error.
         Set `media` to an instance of `self.media_class` or a path.
         If `media` is a Python dictionary, then it is returned.
+        Set `entries` to retrieve only some fields, e.g. ``{'format': ['duration']}``.
+
+        The information is retrieved from `self.cache` if the media file did not change since it was
+        cached.
         """
         if isinstance(media, dict):
             return media
-        media = self.to_media(media)
         try:
-            if utils.is_pipe(media.path):
-                raise NotImplementedError('Read media information from a PIPE not yet implemented.')
-
-            return json.loads(
-                subprocess.check_output(
-                    [
-                        self.executable,
-                        '-v',
-                        'quiet',
-                        '-print_format',
-                        'json',
-                        '-show_format',
-                        '-show_streams',
-                        media.path,
-                    ]
-                ).decode('utf-8'),
-            )
-        except OSError as exc:
-            # Executable does not exist
-            if fail or exc.errno == errno.ENOENT:
-                raise
-        except Exception:  # pylint:disable=broad-except
-            if fail:
-                raise
+            media, key, info = self._get_cached_media_info(media, entries)
+            if info is None:
+                output = subprocess.check_output(self._get_media_info_arguments(media, entries))
+                info = self._load_media_info(key, output.decode('utf-8'))
+            return info
+        except Exception as exc:
+            self._handle_media_info_error(exc, fail)
         return None
 
-    def get_media_format(self, media: object, *, fail: bool = False) -> object:
+    async def get_media_info_async(
+        self,
+        media: object,
+        *,
+        entries: EntriesType | None = None,
+        fail: bool = False,
+    ) -> dict | None:
+        """Asynchronous variant of :meth:`get_media_info`, FFprobe is run with :mod:`asyncio`."""
+        if isinstance(media, dict):
+            return media
+        try:
+            media, key, info = self._get_cached_media_info(media, entries)
+            if info is None:
+                arguments = self._get_media_info_arguments(media, entries)
+                process = await asyncio.create_subprocess_exec(
+                    *arguments, stdout=asyncio.subprocess.PIPE
+                )
+                try:
+                    output, _ = await process.communicate()
+                finally:
+                    if process.returncode is None:  # Cancelled
+                        with contextlib.suppress(ProcessLookupError):  # Already exited
+                            process.kill()
+                        await process.wait()
+                if process.returncode:
+                    raise subprocess.CalledProcessError(process.returncode, arguments, output)
+                info = self._load_media_info(key, output.decode('utf-8'))
+            return info
+        except Exception as exc:
+            self._handle_media_info_error(exc, fail)
+        return None
+
+    def get_media_infos(
+        self,
+        medias: collections.abc.Iterable[object],
+        *,
+        max_workers: int | None = None,
+        entries: EntriesType | None = None,
+        fail: bool = False,
+    ) -> collections.abc.Iterator[tuple[object, dict | None]]:
+        """
+        Probe the medias concurrently and yield (media, information) as soon as they are available.
+
+        At most `max_workers` FFprobe processes are running at the same time and the medias are
+        consumed lazily (a generator of 100k paths is fine). The information is None in case of
+        error, or the error is raised (and pending probes are cancelled) if `fail` is True, see
+        :meth:`get_media_info`.
+        """
+        max_workers = max_workers or self.get_default_max_workers()
+        medias = iter(medias)
+        with futures.ThreadPoolExecutor(max_workers) as executor:
+            pending: dict[futures.Future, object] = {}
+            try:
+                for media in itertools.islice(medias, 2 * max_workers):
+                    future = executor.submit(self.get_media_info, media, entries=entries, fail=fail)
+                    pending[future] = media
+                while pending:
+                    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        media = pending.pop(future)
+                        yield media, future.result()
+                        if (media := next(medias, _END)) is not _END:
+                            future = executor.submit(
+                                self.get_media_info, media, entries=entries, fail=fail
+                            )
+                            pending[future] = media
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    async def get_media_infos_async(
+        self,
+        medias: collections.abc.Iterable[object],
+        *,
+        max_workers: int | None = None,
+        entries: EntriesType | None = None,
+        fail: bool = False,
+    ) -> collections.abc.AsyncIterator[tuple[object, dict | None]]:
+        """Asynchronous variant of :meth:`get_media_infos`, FFprobe is run with :mod:`asyncio`."""
+        max_workers = max_workers or self.get_default_max_workers()
+        medias = iter(medias)
+        pending: dict[asyncio.Task, object] = {}
+        try:
+            for media in itertools.islice(medias, max_workers):
+                task = asyncio.create_task(
+                    self.get_media_info_async(media, entries=entries, fail=fail)
+                )
+                pending[task] = media
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    media = pending.pop(task)
+                    yield media, task.result()
+                    if (media := next(medias, _END)) is not _END:
+                        task = asyncio.create_task(
+                            self.get_media_info_async(media, entries=entries, fail=fail)
+                        )
+                        pending[task] = media
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def get_default_max_workers() -> int:
+        """Return the default amount of concurrent FFprobe processes of the bulk methods."""
+        return min(32, (os.cpu_count() or 1) + 4)
+
+    @staticmethod
+    def get_show_entries(entries: EntriesType) -> str:
+        """
+        Return the value of the ``-show_entries`` option of FFprobe for `entries`.
+
+        **Example usage**
+
+        >>> FFprobe.get_show_entries({'format': ['duration'], 'stream': ['index', 'codec_type']})
+        'format=duration:stream=index,codec_type'
+        >>> FFprobe.get_show_entries({'format': []})
+        'format'
+        """
+        sections = []
+        for section, fields in entries.items():
+            names = ','.join(fields)
+            sections.append(f'{section}={names}' if names else section)
+        return ':'.join(sections)
+
+    def _get_cached_media_info(
+        self,
+        media: object,
+        entries: EntriesType | None,
+    ) -> tuple[miscellaneous.Media, CacheKey | None, dict | None]:
+        media = self.to_media(media)
+        if utils.is_pipe(media.path):
+            raise NotImplementedError('Read media information from a PIPE not yet implemented.')
+        # The key is computed before probing, a file modified meanwhile will be probed again
+        # The information of a selection of entries is cached apart (an executable "variant")
+        executable = str(self.executable)
+        if entries is not None:
+            executable = f'{executable} -show_entries {self.get_show_entries(entries)}'
+        if (cache := self.cache) is None or (key := cache.get_key(executable, media.path)) is None:
+            return media, None, None
+        return media, key, cache.get(key)
+
+    def _get_media_info_arguments(
+        self,
+        media: miscellaneous.Media,
+        entries: EntriesType | None = None,
+    ) -> list:
+        return [
+            self.executable,
+            '-v',
+            'quiet',
+            '-print_format',
+            'json',
+            *(
+                ['-show_format', '-show_streams']
+                if entries is None
+                else ['-show_entries', self.get_show_entries(entries)]
+            ),
+            media.path,
+        ]
+
+    def _load_media_info(self, key: CacheKey | None, output: str) -> dict:
+        info = json.loads(output)
+        if key is not None and self.cache is not None:
+            self.cache.set(key, output)
+        return info
+
+    @staticmethod
+    def _handle_media_info_error(exc: Exception, fail: bool) -> None:
+        # Executable does not exist
+        if fail or (isinstance(exc, OSError) and exc.errno == errno.ENOENT):
+            raise exc
+
+    def get_media_format(
+        self,
+        media: object,
+        *,
+        entries: EntriesType | None = None,
+        fail: bool = False,
+    ) -> object:
         """
         Return information about the container (and file) or None in case of error.
         Set `media` to an instance of `self.media_class`, a path or the output of
         `get_media_info()`.
         """
-        info = self.get_media_info(media, fail=fail)
+        info = self.get_media_info(media, entries=entries, fail=fail)
         try:
             cls, the_format = self.format_class, info['format']
             if cls and not isinstance(the_format, cls):  # pylint:disable=all
-                return cls(the_format)  # pylint:disable=not-callable
+                return cls(the_format).clean()  # pylint:disable=not-callable
             return the_format
         except Exception:  # pylint:disable=broad-except
             if fail:
@@ -156,31 +348,42 @@ class FFprobe:
         media: object,
         *,
         condition: collections.abc.Callable[[dict], bool] = lambda stream: True,
+        entries: EntriesType | None = None,
         fail: bool = False,
     ) -> list:
         """
         Return a list with the media streams of `media` or [] in case of error.
         Set `media` to an instance of `self.media_class`, a path or the output of
         `get_media_info()`.
+
+        The field *codec_type* is added to the stream `entries` (required to select the stream
+        classes).
         """
-        info = self.get_media_info(media, fail=fail)
+        if entries is not None and 'codec_type' not in (fields := list(entries.get('stream', ()))):
+            entries = {**entries, 'stream': [*fields, 'codec_type']}
+        info = self.get_media_info(media, entries=entries, fail=fail)
         try:
-            raw_streams = (s for s in info['streams'] if condition(s))
+            streams = []
+            for stream in (s for s in info['streams'] if condition(s)):
+                stream_class = self.stream_classes[stream['codec_type']]
+                streams.append(
+                    stream_class(stream).clean()
+                    if stream_class and not isinstance(stream, stream_class)
+                    else stream,
+                )
+            return streams
         except Exception:  # pylint:disable=broad-except
             if fail:
                 raise
             return []
-        streams = []
-        for stream in raw_streams:
-            stream_class = self.stream_classes[stream['codec_type']]
-            streams.append(
-                stream_class(stream)
-                if stream_class and not isinstance(stream, stream_class)
-                else stream,
-            )
-        return streams
 
-    def get_audio_streams(self, media: object, *, fail: bool = False) -> list:
+    def get_audio_streams(
+        self,
+        media: object,
+        *,
+        entries: EntriesType | None = None,
+        fail: bool = False,
+    ) -> list:
         """
         Return a list with the audio streams of `media` or [] in case of error.
         Set `media` to an instance of `self.media_class`, a path or the output of
@@ -189,10 +392,17 @@ class FFprobe:
         return self.get_media_streams(
             media,
             condition=lambda s: s['codec_type'] == 'audio',
+            entries=entries,
             fail=fail,
         )
 
-    def get_subtitle_streams(self, media: object, *, fail: bool = False) -> list:
+    def get_subtitle_streams(
+        self,
+        media: object,
+        *,
+        entries: EntriesType | None = None,
+        fail: bool = False,
+    ) -> list:
         """
         Return a list with the subtitle streams of `media` or [] in case of error.
         Set `media` to an instance of `self.media_class`, a path or the output of
@@ -201,10 +411,17 @@ class FFprobe:
         return self.get_media_streams(
             media,
             condition=lambda s: s['codec_type'] == 'subtitle',
+            entries=entries,
             fail=fail,
         )
 
-    def get_video_streams(self, media: object, *, fail: bool = False) -> list:
+    def get_video_streams(
+        self,
+        media: object,
+        *,
+        entries: EntriesType | None = None,
+        fail: bool = False,
+    ) -> list:
         """
         Return a list with the video streams of `media` or [] in case of error.
         Set `media` to an instance of `self.media_class`, a path or the output of
@@ -213,6 +430,7 @@ class FFprobe:
         return self.get_media_streams(
             media,
             condition=lambda s: s['codec_type'] == 'video',
+            entries=entries,
             fail=fail,
         )
 
@@ -221,6 +439,7 @@ class FFprobe:
         media: object,
         *,
         index: int = 0,
+        entries: EntriesType | None = None,
         fail: bool = False,
     ) -> float | None:
         """
@@ -229,7 +448,7 @@ class FFprobe:
         `get_media_info()`.
         """
         try:
-            stream = self.get_video_streams(media)[index]
+            stream = self.get_video_streams(media, entries=entries)[index]
             if isinstance(stream, dict):
                 return utils.to_frame_rate(stream['avg_frame_rate'])
             else:
@@ -239,11 +458,51 @@ class FFprobe:
                 raise
         return None
 
+    def get_video_keyframes(
+        self,
+        media: object,
+        *,
+        index: int = 0,
+        fail: bool = False,
+    ) -> list[float]:
+        """
+        Return the sorted timestamps (seconds) of the key frames of the video stream at `index` in
+        `media` or [] in case of error. Set `media` to an instance of `self.media_class` or a path.
+
+        The packets are read but not decoded, the media file is read entirely.
+        """
+        try:
+            output = subprocess.check_output(
+                [
+                    self.executable,
+                    '-v',
+                    'error',
+                    '-select_streams',
+                    f'v:{index}',
+                    '-show_entries',
+                    'packet=pts_time,flags',
+                    '-of',
+                    'csv=print_section=0',
+                    self.to_media(media).path,
+                ]
+            )
+            keyframes = []
+            for line in output.decode('utf-8').splitlines():
+                pts_time, _, flags = line.partition(',')
+                if flags.startswith('K') and pts_time not in ('', 'N/A'):
+                    keyframes.append(float(pts_time))
+            return sorted(keyframes)
+        except Exception:  # pylint:disable=broad-except
+            if fail:
+                raise
+        return []
+
     def get_video_resolution(
         self,
         media: object,
         *,
         index: int = 0,
+        entries: EntriesType | None = None,
         fail: bool = False,
     ) -> list[int] | None:
         """
@@ -252,7 +511,7 @@ class FFprobe:
         `get_media_info()`.
         """
         try:
-            stream = self.get_video_streams(media)[index]
+            stream = self.get_video_streams(media, entries=entries)[index]
             is_dict = isinstance(stream, dict)
             if is_dict:
                 return [int(stream['width']), int(stream['height'])]
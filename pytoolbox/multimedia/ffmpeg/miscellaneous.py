@@ -4,12 +4,12 @@ Data classes for FFmpeg/FFprobe media, codec, format, and stream info.
 
 from __future__ import annotations
 
+import datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, ClassVar
 
 from pytoolbox import comparison, filesystem, validation
 from pytoolbox.subprocess import CallArgsType, to_args_list
-from pytoolbox.types import get_slots
 
 from . import utils
 
@@ -25,27 +25,62 @@ __all__ = [
 ]
 
 
-class BaseInfo(  # pylint:disable=too-few-public-methods
-    validation.CleanAttributesMixin,
-    comparison.SlotsEqualityMixin,
-):
-    """Base class for FFprobe info objects populated from a JSON dict."""
+class BaseInfo(validation.CleanAttributesMixin, comparison.SlotsEqualityMixin):
+    """
+    Base class for FFprobe info objects populated from a JSON dict.
+
+    The attributes are set (and cleaned) lazily from the `info` dictionary, on first access.
+    Call :meth:`clean` to set them all at once and raise any cleaning error, the `info` dictionary
+    is then released.
+    """
+
+    __slots__ = ('_info',)
+
+    # The public `__slots__` including all parent classes `__slots__`
+    _attributes: ClassVar[frozenset[str]] = frozenset()
 
     defaults: dict[str, Any] = {}
     attr_name_template: str = '{name}'
 
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._attributes = frozenset(
+            name
+            for klass in cls.__mro__
+            for name in getattr(klass, '__slots__', ())
+            if not name.startswith('_')
+        )
+
     def __init__(self, info: dict[str, Any]) -> None:
-        for attr in get_slots(self):
-            self._set_attribute(attr, info)
+        self._info = info
+
+    def __eq__(self, other: object) -> bool:
+        # The raw information is not compared, only the (cleaned) attributes
+        return self._attributes == getattr(other, '_attributes', None) and all(
+            getattr(self, a) == getattr(other, a) for a in self._attributes
+        )
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called if the attribute is not yet set
+        if name in self._attributes:
+            return self._set_attribute(name, self._info)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def clean(self) -> BaseInfo:
+        """Set (and clean) all the attributes that are not yet set and return self."""
+        for name in self._attributes:
+            getattr(self, name)
+        self._info = {}  # Not needed anymore, do not keep the raw information in memory
+        return self
 
     def _set_attribute(self, name: str, info: dict) -> Any:
         """Set attribute `name` value from the `info` or ``self.defaults`` dictionary."""
         value = info.get(self.attr_name_template.format(name=name), self.defaults.get(name))
         setattr(self, name, value)
-        return value
+        return getattr(self, name)
 
 
-class Codec(BaseInfo):  # pylint:disable=too-few-public-methods
+class Codec(BaseInfo):
     """Represent a media codec extracted from FFprobe output."""
 
     long_name: str
@@ -59,13 +94,13 @@ class Codec(BaseInfo):  # pylint:disable=too-few-public-methods
 
     attr_name_template: str = 'codec_{name}'
 
-    def __init__(self, info: dict[str, Any]) -> None:
+    def _set_attribute(self, name: str, info: dict) -> Any:
+        attribute = self.attr_name_template.format(name=name)
         # The codec_time_base is available (tested with ffprobe 4.3.1)
-        if (attribute := self.attr_name_template.format(name='time_base')) in info:
-            super().__init__(info)
+        if name != 'time_base' or attribute in info:
+            return super()._set_attribute(name, info)
         # Set codec_time_base to time_base (discovered with ffprobe 6.1)
-        else:
-            super().__init__({**info, attribute: info.get('time_base')})
+        return super()._set_attribute(name, {attribute: info.get('time_base')})
 
     @staticmethod
     def clean_time_base(value: float | str | None) -> float | None:
@@ -142,7 +177,6 @@ class Stream(BaseInfo):
     """Represent a media stream extracted from FFprobe output."""
 
     avg_frame_rate: float | None
-    bit_per_raw_sample: int | None
     bit_rate: int | None
     codec: Codec
     disposition: dict | None
@@ -172,12 +206,16 @@ class Stream(BaseInfo):
 
     codec_class: type[Codec] = Codec
 
-    def __init__(self, info: dict[str, Any]) -> None:  # pylint:disable=super-init-not-called
-        for attr in get_slots(self):
-            if attr == 'codec':
-                self.codec = self.codec_class(info)
-            else:
-                self._set_attribute(attr, info)
+    def clean(self) -> BaseInfo:
+        super().clean()
+        self.codec.clean()
+        return self
+
+    def _set_attribute(self, name: str, info: dict) -> Any:
+        if name == 'codec':
+            self.codec = self.codec_class(info)
+            return self.codec
+        return super()._set_attribute(name, info)
 
     @staticmethod
     def clean_avg_frame_rate(value: float | str | None) -> float | None:
@@ -265,7 +303,7 @@ class AudioStream(Stream):
 class SubtitleStream(Stream):
     """Represent a subtitle stream."""
 
-    __slots__ = ('duration', 'duration_ts', 'start_pts', 'start_time', 'tags')
+    __slots__ = ('start_pts', 'start_time')
 
     @staticmethod
     def clean_duration(value: float | int | str | None) -> float | None:
@@ -291,6 +329,8 @@ class SubtitleStream(Stream):
 class VideoStream(Stream):
     """Represent a video stream with resolution and pixel format info."""
 
+    bit_per_raw_sample: int | None
+
     __slots__ = (
         'bit_per_raw_sample',
         'display_aspect_ratio',
@@ -298,7 +338,6 @@ class VideoStream(Stream):
         'height',
         'level',
         'pix_fmt',
-        'profile',
         'sample_aspect_ratio',
         'width',
     )
@@ -326,14 +365,17 @@ class VideoStream(Stream):
     @property
     def rotation(self) -> int:
         """Return the stream rotation angle from metadata tags."""
-        tags = self.tags  # type: ignore[attr-defined]  # pylint:disable=no-member
+        tags = self.tags
         return int(0 if tags is None else tags.get('rotate', 0))
 
 
 class Media(validation.CleanAttributesMixin, comparison.SlotsEqualityMixin):
     """Represent a media file or pipe with its FFmpeg options."""
 
-    __slots__ = ('_path', 'options', '_is_pipe')
+    duration: datetime.timedelta | None
+    frame: float | None
+
+    __slots__ = ('_path', 'options', '_is_pipe', '_size', 'duration', 'frame')
 
     def __init__(
         self,
@@ -344,6 +386,16 @@ class Media(validation.CleanAttributesMixin, comparison.SlotsEqualityMixin):
         self._path: Path | str = path if self._is_pipe else Path(path)
         self.options: list[str] = options or []  # type: ignore[assignment]
         self._size: int | None = None
+        self.duration = None
+        self.frame = None
+
+    def __eq__(self, other: object) -> bool:
+        # The size and the statistics updated while encoding are not part of the media identity
+        return isinstance(other, Media) and (self._path, self.options, self._is_pipe) == (
+            other._path,
+            other.options,
+            other._is_pipe,
+        )
 
     @property
     def directory(self) -> Path | None:
@@ -0,0 +1,266 @@
+"""
+Scheduling of many FFmpeg encodings within a CPU budget.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import heapq
+import itertools
+import os
+from dataclasses import dataclass, field
+from typing import Any
+
+from pytoolbox import logging
+from pytoolbox import subprocess as py_subprocess
+
+from . import encode, ffmpeg
+
+__all__ = ['EncodeJob', 'EncodeScheduler', 'JobState']
+
+log = logging.get_logger(__name__)
+
+
+class JobState:  # pylint:disable=too-few-public-methods
+    """Enumeration of encoding job states."""
+
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    SUCCESS = 'SUCCESS'
+    FAILURE = 'FAILURE'
+    CANCELLED = 'CANCELLED'
+
+    ALL_STATES = frozenset([QUEUED, RUNNING, SUCCESS, FAILURE, CANCELLED])
+    FINAL_STATES = frozenset([SUCCESS, FAILURE, CANCELLED])
+
+
+@dataclass(eq=False, slots=True)
+class EncodeJob:
+    """An encoding job, see :meth:`EncodeScheduler.submit`."""
+
+    inputs: object
+    outputs: object
+    in_options: py_subprocess.CallArgsType | None = None
+    out_options: py_subprocess.CallArgsType | None = None
+    priority: int = 0
+    threads: int = 1
+    state: str = JobState.QUEUED
+    attempts: int = 0
+    statistics: encode.EncodeStatistics | None = None
+    error: BaseException | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def ratio(self) -> float:
+        """Returns the progress of the job (1.0 once finished)."""
+        if self.state in JobState.FINAL_STATES:
+            return 1.0
+        if self.statistics is None or self.statistics.ratio is None:
+            return 0.0
+        return self.statistics.ratio
+
+
+class EncodeScheduler:
+    """
+    Run encoding jobs concurrently with :meth:`FFmpeg.encode_async`, within a CPU budget.
+
+    Every job is given a number of threads (FFmpeg's ``-threads`` option, unless set by the job
+    options) and jobs are started by priority (then in order of submission) as long as the threads
+    of the running jobs fit in `cpu_budget`. Running fewer threads per job and more jobs
+    concurrently usually makes a better use of the cores, encoders do not scale linearly.
+
+    Failed jobs are retried up to `retries` times. Queued and running jobs can be cancelled (FFmpeg
+    is killed).
+
+    **Example usage**
+
+    >> scheduler = EncodeScheduler(FFmpeg(), cpu_budget=64, threads_per_job=4)
+    >> for path in paths:
+    ..     scheduler.submit(path, path.with_suffix('.mkv'), out_options='-c:v libx264')
+    >> asyncio.run(scheduler.run())
+    """
+
+    job_class: type[EncodeJob] = EncodeJob
+
+    def __init__(
+        self,
+        encoder: ffmpeg.FFmpeg | None = None,
+        *,
+        cpu_budget: int | None = None,
+        threads_per_job: int = 4,
+        retries: int = 1,
+    ) -> None:
+        """
+        Construct an EncodeScheduler.
+
+        :param encoder: The FFmpeg wrapper encoding the jobs.
+        :param cpu_budget: Total amount of threads of the running jobs (defaults to the CPU count).
+        :param threads_per_job: Default amount of threads of a job.
+        :param retries: Amount of times a failed job is retried.
+        """
+        self.encoder = encoder or ffmpeg.FFmpeg()
+        self.cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+        self.threads_per_job = max(1, min(threads_per_job, self.cpu_budget))
+        self.retries = retries
+        self.jobs: list[EncodeJob] = []
+        self.used_threads = 0
+        self._counter = itertools.count()
+        self._queue: list[tuple[int, int, EncodeJob]] = []
+        self._running: set[EncodeJob] = set()
+        self._wakeup: asyncio.Event | None = None
+
+    @property
+    def ratio(self) -> float:
+        """Returns the progress of all the jobs, weighted by the duration of their inputs."""
+        weights = [(job.ratio, self._get_weight(job)) for job in self.jobs]
+        if not (total := sum(weight for _, weight in weights)):
+            return 1.0
+        return sum(ratio * weight for ratio, weight in weights) / total
+
+    @property
+    def statistics(self) -> list[encode.EncodeStatistics]:
+        """Returns the statistics of the jobs started at least once."""
+        return [job.statistics for job in self.jobs if job.statistics is not None]
+
+    def count(self, state: str) -> int:
+        """Return the amount of jobs in given state."""
+        return sum(1 for job in self.jobs if job.state == state)
+
+    def submit(
+        self,
+        inputs: object,
+        outputs: object,
+        in_options: py_subprocess.CallArgsType | None = None,
+        out_options: py_subprocess.CallArgsType | None = None,
+        *,
+        priority: int = 0,
+        threads: int | None = None,
+    ) -> EncodeJob:
+        """
+        Queue an encoding job and return it, higher `priority` jobs are started first.
+
+        The arguments are the ones of :meth:`FFmpeg.encode`, `threads` defaults to
+        `self.threads_per_job` (and is capped by the CPU budget).
+        """
+        job = self.job_class(
+            inputs,
+            outputs,
+            in_options,
+            out_options,
+            priority=priority,
+            threads=max(1, min(threads or self.threads_per_job, self.cpu_budget)),
+        )
+        self.jobs.append(job)
+        self._enqueue(job)
+        return job
+
+    def cancel(self, job: EncodeJob) -> bool:
+        """Cancel a queued or running job, return False if already finished."""
+        if job.state in JobState.FINAL_STATES:
+            return False
+        if job.state == JobState.RUNNING and job.task is not None:
+            job.task.cancel()  # The job is marked as cancelled once its task is done
+        else:
+            job.state = JobState.CANCELLED  # Removed from the queue when popped
+            self._notify()
+        return True
+
+    async def run(self) -> None:
+        """Run the jobs until all of them are finished (jobs can be submitted meanwhile)."""
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                self._wakeup.clear()
+                self._start_jobs()
+                if not self._running and not self._queue:
+                    break
+                await self._wakeup.wait()
+        finally:
+            for job in list(self._running):
+                if job.task is not None:
+                    job.task.cancel()
+            if tasks := [job.task for job in self._running if job.task is not None]:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self._wakeup = None
+
+    def on_progress(self, job: EncodeJob) -> None:
+        """Handle the statistics of a job once updated (override it to report the progress)."""
+
+    def on_finish(self, job: EncodeJob) -> None:
+        """Handle a finished (or cancelled) job."""
+
+    def get_out_options(self, job: EncodeJob) -> list[str]:
+        """Return the output options of a job, with its amount of threads unless already set."""
+        out_options = py_subprocess.to_args_list(job.out_options)
+        if '-threads' not in out_options:
+            out_options = ['-threads', str(job.threads), *out_options]
+        return out_options
+
+    async def _run_job(self, job: EncodeJob) -> bool:
+        """Encode a job and return True if failed, see :meth:`_on_job_done` for the bookkeeping."""
+        async for statistics in self.encoder.encode_async(
+            job.inputs,
+            job.outputs,
+            job.in_options,
+            self.get_out_options(job),
+        ):
+            job.statistics = statistics
+            self.on_progress(job)
+        return job.statistics is None or job.statistics.state != encode.EncodeState.SUCCESS
+
+    def _on_job_done(self, job: EncodeJob, task: asyncio.Task) -> None:
+        # Called even if the task is cancelled before it has started running
+        self._running.discard(job)
+        self.used_threads -= job.threads
+        job.task = None
+        self._notify()
+        if task.cancelled():
+            job.state = JobState.CANCELLED
+            self.on_finish(job)
+            return
+        if (error := task.exception()) is not None:
+            log.error('Encoding job failed', exc_info=error)
+            job.error = error
+        failed = error is not None or task.result()
+        if failed and job.attempts <= self.retries:
+            self._enqueue(job)
+        else:
+            job.state = JobState.FAILURE if failed else JobState.SUCCESS
+            self.on_finish(job)
+
+    def _enqueue(self, job: EncodeJob) -> None:
+        job.state = JobState.QUEUED
+        heapq.heappush(self._queue, (-job.priority, next(self._counter), job))
+        self._notify()
+
+    def _get_weight(self, job: EncodeJob) -> float:
+        if job.state == JobState.CANCELLED:
+            return 0.0
+        duration = getattr(getattr(job.statistics, 'input', None), 'duration', None)
+        return duration.total_seconds() if duration else 1.0
+
+    def _notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _start_jobs(self) -> None:
+        while self._queue:
+            _, _, job = self._queue[0]
+            if job.state == JobState.CANCELLED:
+                heapq.heappop(self._queue)
+                self.on_finish(job)
+                continue
+            if self.used_threads + job.threads > self.cpu_budget:
+                break  # Wait for running jobs to finish (the order of the jobs is kept)
+            heapq.heappop(self._queue)
+            job.state = JobState.RUNNING
+            job.attempts += 1
+            self.used_threads += job.threads
+            self._running.add(job)
+            job.task = asyncio.create_task(self._run_job(job))
+            job.task.add_done_callback(functools.partial(self._on_job_done, job))
+
+    def __repr__(self) -> str:
+        counts: dict[str, Any] = {state: self.count(state) for state in sorted(JobState.ALL_STATES)}
+        return f'<{self.__class__.__name__} threads={self.used_threads}/{self.cpu_budget} {counts}>'
@@ -0,0 +1,167 @@
+"""
+Pools of reusable buffers, e.g. to serialize packets without allocating memory per packet.
+"""
+
+from __future__ import annotations
+
+__all__ = ['BufferPool', 'PayloadPool']
+
+
+class BufferPool:
+    """
+    A pool of fixed-size buffers (slots) carved out of one preallocated :class:`bytearray`.
+
+    A slot is acquired by index, its memory is accessed with a :class:`memoryview` (no copy)
+    and the slot is released once its content is not needed anymore (e.g. the packet was sent).
+    When all the slots are in use, the pool grows by allocating a standalone slot (counted by
+    :attr:`overflows`), to size the pool accordingly.
+
+    The pool is not thread-safe, acquiring and releasing slots must be serialized by the caller.
+
+    **Example usage**
+
+    >>> pool = BufferPool(1500, 2)
+    >>> first, second = pool.acquire(), pool.acquire()
+    >>> pool[first][:5] = b'hello'
+    >>> bytes(pool[first][:5]), len(pool[first]), pool.available
+    (b'hello', 1500, 0)
+    >>> third = pool.acquire()
+    >>> pool.overflows, len(pool)
+    (1, 3)
+    >>> pool.release(first)
+    >>> pool.acquire() == first
+    True
+    >>> pool.release(first)
+    >>> pool.release(first)
+    Traceback (most recent call last):
+        ...
+    ValueError: Slot 0 is not in use
+    """
+
+    def __init__(self, slot_size: int, slots: int) -> None:
+        """
+        Construct a BufferPool.
+
+        :param slot_size: Size of a slot (bytes).
+        :param slots: Amount of preallocated slots.
+        """
+        if slot_size < 1 or slots < 1:
+            raise ValueError(f'Invalid pool size: {slots} slots of {slot_size} bytes')
+        self.slot_size = slot_size
+        self.memory = bytearray(slot_size * slots)
+        view = memoryview(self.memory)
+        self._views = [view[i * slot_size : (i + 1) * slot_size] for i in range(slots)]
+        self._free = list(range(slots - 1, -1, -1))  # The lowest indexes are acquired first
+        self._used = [False] * slots
+        self.overflows = 0  # Slots allocated because the pool was exhausted counter
+
+    def __getitem__(self, index: int) -> memoryview:
+        return self._views[index]
+
+    def __len__(self) -> int:
+        return len(self._views)
+
+    @property
+    def available(self) -> int:
+        """Returns the amount of free slots."""
+        return len(self._free)
+
+    def acquire(self) -> int:
+        """Return the index of a free slot, marked as in use."""
+        try:
+            index = self._free.pop()
+        except IndexError:
+            self.overflows += 1
+            self._views.append(memoryview(bytearray(self.slot_size)))
+            self._used.append(False)
+            index = len(self._views) - 1
+        self._used[index] = True
+        return index
+
+    def release(self, index: int) -> None:
+        """Put a slot back into the pool."""
+        if not self._used[index]:
+            raise ValueError(f'Slot {index} is not in use')
+        self._used[index] = False
+        self._free.append(index)
+
+
+class PayloadPool:
+    r"""
+    Recycle the payload buffers (:class:`bytearray`) of the most common sizes (size classes).
+
+    Every size class keeps at most `depth` free buffers. Acquiring a buffer of a size class reuses
+    a free buffer (zero-filled in place if requested) or allocates one, buffers of other sizes are
+    allocated. Releasing a buffer of a size class keeps it for reuse, other buffers are left to the
+    garbage collector. Any :class:`bytearray` can be released (e.g. the payload of a received
+    packet), it must not be used anymore once released.
+
+    The pool is opt-in, e.g. to recycle the payloads of the media and FEC packets (set it before
+    constructing the FEC generators, receivers and senders)::
+
+        RtpPacket.payload_pool = PayloadPool()
+
+    **Example usage**
+
+    >>> pool = PayloadPool(sizes=(4, 1316), depth=2)
+    >>> first = pool.acquire(4)
+    >>> first[:] = b'abcd'
+    >>> pool.release(first)
+    >>> second = pool.acquire(4)
+    >>> second is first, second
+    (True, bytearray(b'\x00\x00\x00\x00'))
+    >>> pool.acquire(5), pool.hits, pool.misses
+    (bytearray(b'\x00\x00\x00\x00\x00'), 1, 2)
+    >>> for _ in range(3):
+    ...     pool.release(bytearray(1316))
+    >>> pool.available(1316), pool.dropped
+    (2, 1)
+    >>> pool.release(b'not a bytearray')
+    >>> pool.dropped
+    2
+    """
+
+    def __init__(self, sizes: tuple[int, ...] = (1316, 1328, 1500), depth: int = 4096) -> None:
+        """
+        Construct a PayloadPool.
+
+        :param sizes: The size classes, e.g. 7 TS packets (1316 bytes) with or without the FEC
+            header (1328 bytes) and a full Ethernet payload (1500 bytes).
+        :param depth: Maximum amount of free buffers kept per size class.
+        """
+        self.depth = depth
+        self._free: dict[int, list[bytearray]] = {size: [] for size in sizes}
+        self._zeros = {size: bytes(size) for size in sizes}
+        # Statistics
+        self.hits = 0  # Buffers reused counter
+        self.misses = 0  # Buffers allocated counter
+        self.dropped = 0  # Buffers released but not kept counter
+
+    @property
+    def sizes(self) -> tuple[int, ...]:
+        """Returns the size classes."""
+        return tuple(self._free)
+
+    def available(self, size: int) -> int:
+        """Return the amount of free buffers of a size class."""
+        return len(self._free.get(size, ()))
+
+    def acquire(self, size: int, *, zero: bool = True) -> bytearray:
+        """Return a buffer of `size` bytes, zero-filled unless `zero` is False."""
+        if free := self._free.get(size):
+            self.hits += 1
+            buffer = free.pop()
+            if zero:
+                buffer[:] = self._zeros[size]
+            return buffer
+        self.misses += 1
+        return bytearray(size)
+
+    def release(self, buffer: object) -> None:
+        """Put a buffer back into the pool, it must not be used anymore."""
+        if type(buffer) is bytearray:  # pylint:disable=unidiomatic-typecheck
+            free = self._free.get(len(buffer))
+            if free is not None and len(free) < self.depth:
+                free.append(buffer)
+                return
+        self.dropped += 1
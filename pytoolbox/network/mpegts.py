@@ -0,0 +1,263 @@
+"""
+MPEG-2 Transport Stream (TS) packet-level analysis of RTP payloads, vectorized with NumPy.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from typing import Any, Final
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
+
+__all__ = ['PACKET_SIZE', 'SYNC_BYTE', 'NULL_PID', 'TsAnalyzer', 'TsPacketBatch']
+
+PACKET_SIZE: Final[int] = 188
+SYNC_BYTE: Final[int] = 0x47
+NULL_PID: Final[int] = 0x1FFF
+PIDS: Final[int] = 0x2000
+
+# Masks of the fields of the header
+TEI_MASK: Final[int] = 0x80
+PUSI_MASK: Final[int] = 0x40
+PID_HIGH_MASK: Final[int] = 0x1F
+SCRAMBLING_MASK: Final[int] = 0xC0
+ADAPTATION_FIELD_MASK: Final[int] = 0x20
+PAYLOAD_MASK: Final[int] = 0x10
+CC_MASK: Final[int] = 0x0F
+DISCONTINUITY_MASK: Final[int] = 0x80
+PCR_MASK: Final[int] = 0x10
+
+
+class TsPacketBatch:  # pylint:disable=too-many-instance-attributes
+    r"""
+    Decode the headers of the transport stream packets contained into a buffer at once into NumPy
+    arrays (one entry per TS packet).
+
+    The buffer is split into 188 bytes packets, trailing bytes (:attr:`remainder`) are ignored.
+    Fields are only meaningful for the packets flagged in :attr:`sync` (starting with a sync byte).
+
+    Requires NumPy.
+
+    **Example usage**
+
+    >>> data = b''.join([
+    ...     TsPacketBatch.create(0x100, 0, pusi=True, pcr=27_000_000 * 3 + 42),
+    ...     TsPacketBatch.create(0x100, 1),
+    ...     TsPacketBatch.create(0x1FFF, 0),
+    ...     b'\x00' * 188,
+    ...     b'\x47\x01',
+    ... ])
+    >>> batch = TsPacketBatch(data)
+    >>> len(batch), batch.remainder
+    (4, 2)
+    >>> batch.sync.tolist()
+    [True, True, True, False]
+    >>> batch.pid.tolist(), batch.cc.tolist(), batch.pusi.tolist()
+    ([256, 256, 8191, 0], [0, 1, 0, 0], [True, False, False, False])
+    >>> batch.has_pcr.tolist(), int(batch.pcr[0])
+    ([True, False, False, False], 81000042)
+    """
+
+    def __init__(self, buffer: bytes | bytearray | memoryview) -> None:
+        """
+        Parse the TS packets contained into `buffer`.
+
+        :param buffer: A buffer of TS packets, e.g. the payload of a RTP packet.
+        """
+        if np is None:
+            raise ImportError('TsPacketBatch requires numpy')
+        count, self.remainder = divmod(len(buffer), PACKET_SIZE)
+        data = np.frombuffer(buffer, dtype=np.uint8, count=count * PACKET_SIZE)
+        packets = data.reshape(count, PACKET_SIZE)
+
+        self.sync = packets[:, 0] == SYNC_BYTE
+        self.tei = (packets[:, 1] & TEI_MASK) != 0
+        self.pusi = (packets[:, 1] & PUSI_MASK) != 0
+        self.pid = (packets[:, 1] & PID_HIGH_MASK).astype(np.uint16) << 8 | packets[:, 2]
+        self.scrambling = (packets[:, 3] & SCRAMBLING_MASK) >> 6
+        self.has_adaptation = (packets[:, 3] & ADAPTATION_FIELD_MASK) != 0
+        self.has_payload = (packets[:, 3] & PAYLOAD_MASK) != 0
+        self.cc = packets[:, 3] & CC_MASK
+
+        # Adaptation field: length (at least the flags) then flags and PCR
+        has_flags = self.has_adaptation & (packets[:, 4] > 0)
+        self.discontinuity = has_flags & ((packets[:, 5] & DISCONTINUITY_MASK) != 0)
+        self.has_pcr = has_flags & (packets[:, 4] >= 7) & ((packets[:, 5] & PCR_MASK) != 0)
+        pcr = packets[:, 6:12].astype(np.uint64)
+        base = pcr[:, 0] << 25 | pcr[:, 1] << 17 | pcr[:, 2] << 9 | pcr[:, 3] << 1 | pcr[:, 4] >> 7
+        extension = (pcr[:, 4] & 1) << 8 | pcr[:, 5]
+        self.pcr = np.where(self.has_pcr, base * 300 + extension, 0)  # 27 MHz clock
+
+    def __len__(self) -> int:
+        return len(self.sync)
+
+    @staticmethod
+    def create(
+        pid: int,
+        cc: int,  # pylint:disable=invalid-name
+        *,
+        pusi: bool = False,
+        pcr: int | None = None,
+        discontinuity: bool = False,
+        payload: bool = True,
+    ) -> bytes:
+        """Return a TS packet (stuffed with 0xFF), mostly useful for testing purposes."""
+        header = bytearray(
+            [
+                SYNC_BYTE,
+                (PUSI_MASK if pusi else 0) | (pid >> 8 & PID_HIGH_MASK),
+                pid & 0xFF,
+                (PAYLOAD_MASK if payload else 0) | (cc & CC_MASK),
+            ]
+        )
+        if pcr is not None or discontinuity or not payload:
+            header[3] |= ADAPTATION_FIELD_MASK
+            flags = (DISCONTINUITY_MASK if discontinuity else 0) | (
+                PCR_MASK if pcr is not None else 0
+            )
+            field = bytearray([flags])
+            if pcr is not None:
+                base, extension = divmod(pcr, 300)
+                field += (base << 15 | 0x3F << 9 | extension).to_bytes(6, 'big')
+            size = (PACKET_SIZE - 5) if not payload else len(field)
+            header += bytes([size]) + field.ljust(size, b'\xff')
+        return bytes(header.ljust(PACKET_SIZE, b'\xff'))
+
+
+class TsAnalyzer:
+    r"""
+    Maintain per-PID counters and detect continuity counter errors in a transport stream.
+
+    The stream is put by chunks (e.g. the payloads of the RTP packets output by a
+    :class:`pytoolbox.network.smpte2022.receiver.FecReceiver`) and analyzed with NumPy, one
+    vectorized pass per chunk, the state (last continuity counter and PCR of every PID) being
+    kept between chunks. Putting the payloads by batches amortizes the cost of the analysis, see
+    :meth:`put_payloads`.
+
+    A continuity counter error is a packet with payload whose counter is neither the previous
+    one + 1 nor the previous one (duplicate packet), unless the discontinuity indicator is set.
+    Packets without a sync byte or with the transport error indicator set are counted but not
+    analyzed further. The null packets are ignored.
+
+    Requires NumPy.
+
+    **Example usage**
+
+    >>> analyzer = TsAnalyzer()
+    >>> analyzer.put(b''.join(TsPacketBatch.create(0x100, cc) for cc in (14, 15, 0, 2)))
+    >>> analyzer.put(b''.join([
+    ...     TsPacketBatch.create(0x100, 3),
+    ...     TsPacketBatch.create(0x100, 3),  # Duplicate
+    ...     TsPacketBatch.create(0x101, 5, pcr=1000),
+    ...     TsPacketBatch.create(0x100, 9, discontinuity=True),
+    ...     TsPacketBatch.create(0x101, 7, pcr=2000),
+    ...     TsPacketBatch.create(0x1FFF, 0),
+    ...     b'\x00' * 188,
+    ... ]))
+    >>> analyzer.packets, analyzer.sync_errors, analyzer.cc_errors
+    (11, 1, 2)
+    >>> analyzer.statistics
+    {256: {'packets': 7, 'cc_errors': 1, 'pcr': 0}, 257: {'packets': 2, 'cc_errors': 1, 'pcr': 2}}
+    >>> analyzer.last_pcr(0x101), analyzer.last_pcr(0x102)
+    (2000, None)
+
+    The payloads of the output of a receiver can be analyzed by batches:
+
+    >>> import io
+    >>> from pytoolbox.network.rtp import RtpPacket
+    >>> from pytoolbox.network.smpte2022.receiver import FecReceiver
+    >>>
+    >>> analyzer = TsAnalyzer()
+    >>> receiver = FecReceiver(io.BytesIO())
+    >>> receiver.writer.on_write = analyzer.put_payloads
+    >>> for i in range(100):
+    ...     payload = bytearray(b''.join(TsPacketBatch.create(0x200, i * 7 + j) for j in range(7)))
+    ...     if i != 42:  # Lost packet (unrecoverable)
+    ...         receiver.put_media(RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, payload), True)
+    >>> receiver.flush()
+    >>> analyzer.packets, analyzer.statistics
+    (693, {512: {'packets': 693, 'cc_errors': 1, 'pcr': 0}})
+    """
+
+    def __init__(self) -> None:
+        if np is None:
+            raise ImportError('TsAnalyzer requires numpy')
+        self.packets = 0  # Analyzed TS packets counter
+        self.remainder = 0  # Trailing bytes (not a multiple of 188 bytes) counter
+        self.sync_errors = 0  # Packets without a sync byte counter
+        self.tei_errors = 0  # Packets with the transport error indicator set counter
+        self.pid_packets = np.zeros(PIDS, dtype=np.int64)
+        self.pid_cc_errors = np.zeros(PIDS, dtype=np.int64)
+        self.pid_pcr = np.zeros(PIDS, dtype=np.int64)
+        self._last_cc = np.full(PIDS, -1, dtype=np.int16)
+        self._last_pcr = np.full(PIDS, -1, dtype=np.int64)
+
+    @property
+    def cc_errors(self) -> int:
+        """Returns the total amount of continuity counter errors."""
+        return int(self.pid_cc_errors.sum())
+
+    @property
+    def statistics(self) -> dict[int, dict[str, int]]:
+        """Returns the counters of the PIDs seen in the stream (excluding null packets)."""
+        return {
+            int(pid): {
+                'packets': int(self.pid_packets[pid]),
+                'cc_errors': int(self.pid_cc_errors[pid]),
+                'pcr': int(self.pid_pcr[pid]),
+            }
+            for pid in np.flatnonzero(self.pid_packets)
+            if pid != NULL_PID
+        }
+
+    def last_pcr(self, pid: int) -> int | None:
+        """Return the last PCR (27 MHz clock) of a PID or None."""
+        pcr = int(self._last_pcr[pid])
+        return None if pcr < 0 else pcr
+
+    def put_payloads(self, payloads: Iterable[Any]) -> None:
+        """Analyze consecutive chunks of the stream at once (e.g. a batch of RTP payloads)."""
+        self.put(b''.join(payloads))
+
+    def put(self, data: bytes | bytearray | memoryview) -> None:
+        """Analyze the next chunk of the stream."""
+        batch = TsPacketBatch(data)
+        self.packets += len(batch)
+        self.remainder += batch.remainder
+        self.sync_errors += int(np.count_nonzero(~batch.sync))
+        self.tei_errors += int(np.count_nonzero(batch.sync & batch.tei))
+
+        valid = batch.sync & ~batch.tei
+        pid = batch.pid[valid]
+        self.pid_packets += np.bincount(pid, minlength=PIDS)
+
+        # PCR (the last value of every PID is kept)
+        has_pcr = batch.has_pcr[valid]
+        self.pid_pcr += np.bincount(pid[has_pcr], minlength=PIDS)
+        self._last_pcr[pid[has_pcr]] = batch.pcr[valid][has_pcr]
+
+        # Continuity counters, only incremented by packets with payload
+        selected = valid & batch.has_payload & (batch.pid != NULL_PID)
+        order = np.argsort(batch.pid[selected], kind='stable')
+        pid = batch.pid[selected][order]
+        cc = batch.cc[selected][order].astype(np.int16)
+        if len(pid) == 0:
+            return
+        first = np.ones(len(pid), dtype=bool)
+        first[1:] = pid[1:] != pid[:-1]
+        previous = np.empty_like(cc)
+        previous[1:] = cc[:-1]
+        previous[first] = self._last_cc[pid[first]]
+        errors = (
+            (previous >= 0)
+            & (cc != ((previous + 1) & CC_MASK))
+            & (cc != previous)
+            & ~batch.discontinuity[selected][order]
+        )
+        self.pid_cc_errors += np.bincount(pid[errors], minlength=PIDS)
+        last = np.ones(len(pid), dtype=bool)
+        last[:-1] = first[1:]
+        self._last_cc[pid[last]] = cc[last]
@@ -0,0 +1,391 @@
+"""
+Memory-mapped reader of network captures (pcap and pcapng files) with UDP datagrams extraction.
+
+The capture is memory-mapped and parsed in place: multi-gigabytes captures are processed in
+bounded memory, the packets being yielded as views of the mapped file.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import socket
+import struct
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Final, NamedTuple
+
+__all__ = [
+    'LINKTYPE_ETHERNET',
+    'LINKTYPE_LINUX_SLL',
+    'LINKTYPE_LINUX_SLL2',
+    'LINKTYPE_NULL',
+    'LINKTYPE_RAW',
+    'CapturedPacket',
+    'PcapReader',
+    'UdpDatagram',
+    'build_udp_frame',
+    'write_pcap',
+]
+
+LINKTYPE_NULL: Final[int] = 0
+LINKTYPE_ETHERNET: Final[int] = 1
+LINKTYPE_RAW: Final[int] = 101
+LINKTYPE_LINUX_SLL: Final[int] = 113
+LINKTYPE_LINUX_SLL2: Final[int] = 276
+
+PCAP_MAGIC: Final[int] = 0xA1B2C3D4
+PCAP_MAGIC_NS: Final[int] = 0xA1B23C4D
+PCAPNG_SHB: Final[int] = 0x0A0D0D0A
+PCAPNG_IDB: Final[int] = 0x00000001
+PCAPNG_SPB: Final[int] = 0x00000003
+PCAPNG_EPB: Final[int] = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC: Final[int] = 0x1A2B3C4D
+
+ETHERTYPE_IPV4: Final[int] = 0x0800
+ETHERTYPE_IPV6: Final[int] = 0x86DD
+ETHERTYPE_VLANS: Final[frozenset[int]] = frozenset({0x8100, 0x88A8, 0x9100})
+IPPROTO_UDP: Final[int] = 17
+
+
+class CapturedPacket(NamedTuple):
+    """A packet of the capture (`data` is a view of the mapped file)."""
+
+    timestamp: float
+    linktype: int
+    data: memoryview
+
+
+class UdpDatagram(NamedTuple):
+    """An UDP datagram of the capture (`payload` is a view of the mapped file)."""
+
+    timestamp: float
+    source: tuple[str, int]
+    destination: tuple[str, int]
+    payload: memoryview
+
+
+class PcapReader:
+    r"""
+    Read the packets of a pcap or pcapng capture by memory-mapping the file.
+
+    The yielded views are only valid until the reader is closed, copy them to keep them.
+
+    **Example usage**
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile(suffix='.pcap') as f:
+    ...     write_pcap(f.name, [
+    ...         (1.5, build_udp_frame(('10.0.0.1', 1234), ('239.0.0.1', 5000), b'hello')),
+    ...         (2.25, build_udp_frame(('10.0.0.1', 1234), ('239.0.0.1', 5002), b'world')),
+    ...         (3.0, b'not an ethernet frame')])
+    ...     with PcapReader(f.name) as reader:
+    ...         print(reader.format, len(list(reader)))
+    ...         for datagram in reader.iter_udp_datagrams():
+    ...             print(datagram.timestamp, datagram.source, datagram.destination,
+    ...                   bytes(datagram.payload))
+    ...             del datagram
+    ...         print(reader.ignored)
+    pcap 3
+    1.5 ('10.0.0.1', 1234) ('239.0.0.1', 5000) b'hello'
+    2.25 ('10.0.0.1', 1234) ('239.0.0.1', 5002) b'world'
+    1
+
+    An exception raised while views are still referenced is not masked by the closing:
+
+    >>> with tempfile.NamedTemporaryFile(suffix='.pcap') as f:
+    ...     write_pcap(f.name, [(1.5, b'frame')])
+    ...     with PcapReader(f.name) as reader:
+    ...         packets = list(reader)
+    ...         raise KeyError('original')
+    Traceback (most recent call last):
+        ...
+    KeyError: 'original'
+
+    A malformed capture raises a :class:`ValueError`, e.g. a packet of an undeclared interface:
+
+    >>> import struct
+    >>> with tempfile.NamedTemporaryFile(suffix='.pcapng') as f:
+    ...     shb = (PCAPNG_SHB, 28, PCAPNG_BYTE_ORDER_MAGIC, 1, 0, -1, 28)
+    ...     _ = f.write(struct.pack('<IIIHHqI', *shb))
+    ...     _ = f.write(struct.pack('<IIIIIII4sI', PCAPNG_EPB, 36, 0, 0, 0, 4, 4, b'data', 36))
+    ...     f.flush()
+    ...     with PcapReader(f.name) as reader:
+    ...         packets = list(reader)
+    Traceback (most recent call last):
+        ...
+    ValueError: Capture ... is corrupted, packet of unknown interface 0
+
+    Or a packet longer than its block, and a file too short to be a capture:
+
+    >>> with tempfile.NamedTemporaryFile(suffix='.pcapng') as f:
+    ...     _ = f.write(struct.pack('<IIIHHqI', *shb))
+    ...     _ = f.write(struct.pack('<IIHHII', PCAPNG_IDB, 20, LINKTYPE_ETHERNET, 0, 0, 20))
+    ...     _ = f.write(struct.pack('<IIIIIII4sI', PCAPNG_EPB, 36, 0, 0, 0, 40, 40, b'data', 36))
+    ...     f.flush()
+    ...     with PcapReader(f.name) as reader:
+    ...         packets = list(reader)
+    Traceback (most recent call last):
+        ...
+    ValueError: Capture ... is corrupted, packet of 40 bytes in a block of 36 bytes
+    >>> with tempfile.NamedTemporaryFile(suffix='.pcap') as f:
+    ...     _ = f.write(b'\xd4\xc3')
+    ...     f.flush()
+    ...     PcapReader(f.name)
+    Traceback (most recent call last):
+        ...
+    ValueError: Capture ... is truncated
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.format = ''
+        self.ignored = 0  # Packets that are not UDP datagrams (or are IP fragments)
+        with open(self.path, 'rb') as f:
+            if (size := os.fstat(f.fileno()).st_size) == 0:
+                raise ValueError(f'Capture {self.path} is empty')
+            if size < 4:
+                raise ValueError(f'Capture {self.path} is truncated')
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._mmap, 'madvise'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        self._view = memoryview(self._mmap)
+        try:
+            magic = struct.unpack_from('<I', self._mmap, 0)[0]
+            if {magic, socket.ntohl(magic)} & {PCAP_MAGIC, PCAP_MAGIC_NS}:
+                if size < 24:  # The global header
+                    raise ValueError(f'Capture {self.path} is truncated')
+                self.format = 'pcap'
+            elif magic == PCAPNG_SHB:
+                self.format = 'pcapng'
+            else:
+                raise ValueError(f'Capture {self.path} is neither a pcap nor a pcapng file')
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> PcapReader:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        try:
+            self.close()
+        except BufferError:
+            # Do not mask the original exception, the mapping is released with the views
+            if exc_type is None:
+                raise
+
+    def __iter__(self) -> Iterator[CapturedPacket]:
+        return self._iter_pcap() if self.format == 'pcap' else self._iter_pcapng()
+
+    def close(self) -> None:
+        """Release the mapping of the file (the yielded views must be released first)."""
+        self._view.release()
+        self._mmap.close()
+
+    def iter_udp_datagrams(self) -> Iterator[UdpDatagram]:
+        """Yield the UDP datagrams (over IPv4 or IPv6) of the capture."""
+        for timestamp, linktype, data in self:
+            if (datagram := self.parse_udp(linktype, data)) is None:
+                self.ignored += 1
+            else:
+                source, destination, payload = datagram
+                yield UdpDatagram(timestamp, source, destination, payload)
+
+    @staticmethod
+    def parse_udp(
+        linktype: int,
+        data: memoryview,
+    ) -> tuple[tuple[str, int], tuple[str, int], memoryview] | None:
+        """Return source, destination and payload if `data` is an UDP datagram else None."""
+        try:  # pylint:disable=too-many-try-statements
+            # Link layer
+            if linktype == LINKTYPE_ETHERNET:
+                offset, ethertype = 14, struct.unpack_from('!H', data, 12)[0]
+                while ethertype in ETHERTYPE_VLANS:
+                    ethertype = struct.unpack_from('!H', data, offset + 2)[0]
+                    offset += 4
+            elif linktype == LINKTYPE_LINUX_SLL:
+                offset, ethertype = 16, struct.unpack_from('!H', data, 14)[0]
+            elif linktype == LINKTYPE_LINUX_SLL2:
+                offset, ethertype = 20, struct.unpack_from('!H', data, 0)[0]
+            elif linktype == LINKTYPE_RAW:
+                offset, ethertype = 0, ETHERTYPE_IPV4 if data[0] >> 4 == 4 else ETHERTYPE_IPV6
+            elif linktype == LINKTYPE_NULL:
+                family = struct.unpack_from('=I', data, 0)[0]
+                offset, ethertype = (
+                    4,
+                    ETHERTYPE_IPV4 if family == socket.AF_INET else ETHERTYPE_IPV6,
+                )
+            else:
+                return None
+
+            # Network layer
+            if ethertype == ETHERTYPE_IPV4:
+                version_ihl, length, flags_offset, protocol = struct.unpack_from(
+                    '!B1xH2xH1xB',
+                    data,
+                    offset,
+                )
+                if version_ihl >> 4 != 4 or protocol != IPPROTO_UDP or flags_offset & 0x3FFF:
+                    return None  # Not IPv4, not UDP or fragmented
+                end = offset + length
+                family, address_offset, address_size = socket.AF_INET, offset + 12, 4
+                offset += (version_ihl & 0x0F) * 4
+            elif ethertype == ETHERTYPE_IPV6:
+                length, protocol = struct.unpack_from('!HB', data, offset + 4)
+                if protocol != IPPROTO_UDP:
+                    return None  # Not UDP (or extension headers)
+                end = offset + 40 + length
+                family, address_offset, address_size = socket.AF_INET6, offset + 8, 16
+                offset += 40
+            else:
+                return None
+
+            # Transport layer
+            source_port, destination_port, length = struct.unpack_from('!HHH', data, offset)
+            if length < 8 or offset + length > min(end, len(data)):
+                return None  # Truncated
+            source_ip = socket.inet_ntop(
+                family,
+                data[address_offset : address_offset + address_size],
+            )
+            destination_ip = socket.inet_ntop(
+                family,
+                data[address_offset + address_size : address_offset + 2 * address_size],
+            )
+        except (IndexError, struct.error, ValueError):
+            return None
+        return (
+            (source_ip, source_port),
+            (destination_ip, destination_port),
+            data[offset + 8 : offset + length],
+        )
+
+    def _iter_pcap(self) -> Iterator[CapturedPacket]:
+        buf, view = self._mmap, self._view
+        magic = struct.unpack_from('<I', buf, 0)[0]
+        order = '<' if magic in {PCAP_MAGIC, PCAP_MAGIC_NS} else '>'
+        resolution = 1e-9 if PCAP_MAGIC_NS in {magic, socket.ntohl(magic)} else 1e-6
+        linktype = struct.unpack_from(f'{order}I', buf, 20)[0] & 0x0FFFFFFF
+        record = struct.Struct(f'{order}IIII')
+        offset, size = 24, len(buf)
+        while offset + record.size <= size:
+            seconds, fraction, captured_length, _ = record.unpack_from(buf, offset)
+            offset += record.size
+            if offset + captured_length > size:
+                break  # Truncated capture
+            yield CapturedPacket(
+                seconds + fraction * resolution,
+                linktype,
+                view[offset : offset + captured_length],
+            )
+            offset += captured_length
+
+    def _iter_pcapng(self) -> Iterator[CapturedPacket]:
+        buf, view = self._mmap, self._view
+        order = '<'
+        interfaces: list[tuple[int, float, int]] = []  # Link type, resolution, snap length
+        offset, size = 0, len(buf)
+        while offset + 12 <= size:
+            block_type, block_length = struct.unpack_from(f'{order}II', buf, offset)
+            if block_type == PCAPNG_SHB:
+                magic = struct.unpack_from('<I', buf, offset + 8)[0]
+                order = '<' if magic == PCAPNG_BYTE_ORDER_MAGIC else '>'
+                block_length = struct.unpack_from(f'{order}I', buf, offset + 4)[0]
+                interfaces = []  # A new section begins
+            if block_length < 12 or offset + block_length > size:
+                break  # Truncated or corrupted capture
+            body = offset + 8
+            if block_type == PCAPNG_IDB:
+                linktype, _, snap_length = struct.unpack_from(f'{order}HHI', buf, body)
+                interfaces.append(
+                    (
+                        linktype,
+                        self._get_pcapng_resolution(
+                            buf, order, body + 8, offset + block_length - 4
+                        ),
+                        snap_length,
+                    )
+                )
+            elif block_type == PCAPNG_EPB:
+                interface, high, low, captured_length, _ = struct.unpack_from(
+                    f'{order}IIIII',
+                    buf,
+                    body,
+                )
+                if interface >= len(interfaces):
+                    raise ValueError(
+                        f'Capture {self.path} is corrupted, packet of unknown interface {interface}'
+                    )
+                linktype, resolution, _ = interfaces[interface]
+                data = body + 20
+                if data + captured_length > offset + block_length - 4:
+                    raise ValueError(
+                        f'Capture {self.path} is corrupted, packet of {captured_length} bytes '
+                        f'in a block of {block_length} bytes'
+                    )
+                yield CapturedPacket(
+                    ((high << 32) + low) * resolution,
+                    linktype,
+                    view[data : data + captured_length],
+                )
+            elif block_type == PCAPNG_SPB and interfaces:
+                linktype, _, snap_length = interfaces[0]
+                captured_length = struct.unpack_from(f'{order}I', buf, body)[0]
+                if snap_length:
+                    captured_length = min(captured_length, snap_length)
+                data = body + 4
+                yield CapturedPacket(0.0, linktype, view[data : data + captured_length])
+            offset += block_length
+
+    @staticmethod
+    def _get_pcapng_resolution(buf: mmap.mmap, order: str, offset: int, end: int) -> float:
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(f'{order}HH', buf, offset)
+            if code == 0:  # End of options
+                break
+            if code == 9 and length >= 1:  # if_tsresol
+                value = buf[offset + 4]
+                return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0**-value
+            offset += 4 + (length + 3) // 4 * 4
+        return 1e-6
+
+
+def build_udp_frame(
+    source: tuple[str, int],
+    destination: tuple[str, int],
+    payload: bytes | bytearray | memoryview,
+) -> bytes:
+    """Return an Ethernet frame containing an UDP over IPv4 datagram (checksums are not set)."""
+    ip_header = struct.pack(
+        '!BBHHHBBH4s4s',
+        0x45,
+        0,
+        20 + 8 + len(payload),
+        0,
+        0,
+        64,
+        IPPROTO_UDP,
+        0,
+        socket.inet_aton(source[0]),
+        socket.inet_aton(destination[0]),
+    )
+    udp_header = struct.pack('!HHHH', source[1], destination[1], 8 + len(payload), 0)
+    ethernet_header = bytes(12) + struct.pack('!H', ETHERTYPE_IPV4)
+    return ethernet_header + ip_header + udp_header + bytes(payload)
+
+
+def write_pcap(
+    path: Path | str,
+    packets: Iterable[tuple[float, bytes | bytearray | memoryview]],
+    *,
+    linktype: int = LINKTYPE_ETHERNET,
+) -> None:
+    """Write the packets (timestamp, data) to a pcap file (microseconds resolution)."""
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', PCAP_MAGIC, 2, 4, 0, 0, 65535, linktype))
+        for timestamp, data in packets:
+            seconds, fraction = divmod(round(timestamp * 1_000_000), 1_000_000)
+            f.write(struct.pack('<IIII', seconds, fraction, len(data), len(data)))
+            f.write(data)
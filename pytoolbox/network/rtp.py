@@ -4,12 +4,20 @@ Real-time Transport Protocol (RTP) packet parsing and creation.
 
 from __future__ import annotations
 
+import itertools
 import struct
 
-__all__ = ['RtpPacket']
+from pytoolbox.network.buffers import PayloadPool
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
 
-class RtpPacket:  # pylint:disable=too-many-instance-attributes
+__all__ = ['RtpPacket', 'RtpPacketBatch']
+
+
+class RtpPacket:
     """
     Model a real-time transport protocol (RTP) packet.
 
@@ -57,6 +65,7 @@ class RtpPacket:  # pylint:disable=too-many-instance-attributes
     ER_VERSION = 'RTP Header : Version must be set to 2'
     ER_PADDING_LENGTH = 'RTP Header : Bad padding length'
     ER_EXTENSION_LENGTH = 'RTP Header : Bad extension length'
+    ER_CSRC_LENGTH = 'RTP Header : Bad contributing sources length'
     ER_PAYLOAD = 'RTP packet must have a payload'
 
     HEADER_LENGTH = 12
@@ -73,6 +82,27 @@ class RtpPacket:  # pylint:disable=too-many-instance-attributes
     S_MASK = 0x0000FFFF
     TS_MASK = 0xFFFFFFFF
 
+    HEADER_STRUCT = struct.Struct('!BBHII')
+    CSRC_STRUCT = struct.Struct('!I')
+    EXTENSION_STRUCT = struct.Struct('!HH')
+
+    # Recycle the payloads of the media and FEC packets if set (opt-in), see :meth:`release`
+    payload_pool: PayloadPool | None = None
+
+    __slots__ = (
+        'version',
+        'padding',
+        'extension',
+        'marker',
+        'payload_type',
+        'sequence',
+        'timestamp',
+        'ssrc',
+        'csrc',
+        'payload',
+        '_error',
+    )
+
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Properties >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
     @property
@@ -103,6 +133,14 @@ class RtpPacket:  # pylint:disable=too-many-instance-attributes
         ...     'RTP packet must have a payload'
         ... ])
 
+        Testing a header announcing more contributing sources than available:
+
+        >>> rtp = RtpPacket(bytearray.fromhex('83 21 00 06 00 00 03 09 00 00 00 00 11 11'), 14)
+        >>> asserts.list_equal(rtp.errors, [
+        ...     'RTP Header : Bad contributing sources length',
+        ...     'RTP packet must have a payload'
+        ... ])
+
         Testing a valid RTP packet with a MPEG2-TS payload:
 
         >>> rtp = RtpPacket.create(6, 777, RtpPacket.MP2T_PT, 'salut')
@@ -204,32 +242,26 @@ class RtpPacket:  # pylint:disable=too-many-instance-attributes
         >>> header += rtp.payload
         >>> assert rtp == RtpPacket(header, len(header))
         """
-        cc = len(self.csrc)  # pylint:disable=invalid-name
-        header = bytearray(self.HEADER_LENGTH + 4 * cc)
-        header[0] = (
-            ((self.version << self.V_SHIFT) & self.V_MASK)
-            + (self.P_MASK if self.padding else 0)
-            + (self.X_MASK if self.extension else 0)
-            + (cc & self.CC_MASK)
-        )
-        header[1] = (self.M_MASK if self.marker else 0) + (self.payload_type & self.PT_MASK)
-        struct.pack_into(b'!H', header, 2, self.sequence)
-        struct.pack_into(b'!I', header, 4, self.timestamp)
-        struct.pack_into(b'!I', header, 8, self.ssrc)
-        i = 12
-        for contributor in self.csrc:
-            struct.pack_into(b'!I', header, i, contributor)
-            i += 4
+        header = bytearray(self.header_size)
+        self.pack_header_into(header)
         return header
 
     @property
     def bytes(self) -> bytearray:
         """Return the RTP packet header and payload bytes."""
-        return self.header_bytes + self.payload
+        data = bytearray(self.header_size + self.payload_size)
+        self.pack_into(data)
+        return data
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Constructor >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
-    def __init__(self, data: bytearray | None, length: int) -> None:
+    def __init__(
+        self,
+        data: bytearray | memoryview | None,
+        length: int,
+        *,
+        copy: bool = True,
+    ) -> None:
         r"""
         Parse input bytes array to fill packet's fields.
         In case of error (e.g. bad version number) abort filling
@@ -239,6 +271,9 @@ class RtpPacket:  # pylint:disable=too-many-instance-attributes
         :type bytes: bytearray
         :param length: Amount of bytes to read from the array of bytes
         :type length: int
+        :param copy: Copy the payload out of `data` (the default) or keep a :class:`memoryview` on
+            it (zero-copy), call :meth:`detach` before the receive buffer is reused.
+        :type copy: bool
 
         **Example usage**
 
@@ -314,6 +349,18 @@ class RtpPacket:  # pylint:disable=too-many-instance-attributes
         [286331153, 572662306, 858993459, 1145324612, 1431655765]
         >>> rtp.payload
         bytearray(b'\x124')
+
+        Parsing without copying the payload out of the receive buffer:
+
+        >>> buffer = bytearray(2048)
+        >>> buffer[:14] = bytes.fromhex('80 a1 a4 25 ca fe b5 04 b0 60 5e bb 12 34')
+        >>> rtp = RtpPacket(buffer, 14, copy=False)
+        >>> rtp.sequence, rtp.timestamp, rtp.ssrc
+        (42021, 3405690116, 2959105723)
+        >>> rtp.payload.obj is buffer
+        True
+        >>> rtp.payload.tobytes()
+        b'\x124'
         """
         # Fields default values
         self.version = 0
@@ -325,51 +372,60 @@ class RtpPacket:  # pylint:disable=too-many-instance-attributes
         self.timestamp = 0
         self.ssrc = 0
         self.csrc: list[int] = []
-        self.payload: bytearray = bytearray()
+        self.payload: bytearray | memoryview = bytearray()
         self._error: str | None = None
 
         offset = self.HEADER_LENGTH
         if data is None or length < offset:
             return
 
-        self.version = (data[0] & self.V_MASK) >> 6
+        byte0, byte1, sequence, timestamp, ssrc = self.HEADER_STRUCT.unpack_from(data)
+        self.version = (byte0 & self.V_MASK) >> self.V_SHIFT
         if self.version != 2:
             return
 
-        self.padding = (data[0] & self.P_MASK) == self.P_MASK
+        self.padding = (byte0 & self.P_MASK) == self.P_MASK
         if self.padding:  # Remove padding if present
-            padding_length = data[-1]
+            padding_length = data[length - 1]
             if padding_length == 0 or length < (offset + padding_length):
                 self._error = self.ER_PADDING_LENGTH
                 return
             length -= padding_length
 
-        self.extension = (data[0] & self.X_MASK) == self.X_MASK
-        cc = data[0] & self.CC_MASK  # pylint:disable=invalid-name
-        self.csrc = []  # cc > 0 ? new long[cc] : null
-        self.marker = (data[1] & self.M_MASK) == self.M_MASK
-        self.payload_type = data[1] & self.PT_MASK
-        self.sequence = data[2] * 256 + data[3]
-        self.timestamp = ((data[4] * 256 + data[5]) * 256 + data[6]) * 256 + data[7]
-        self.ssrc = ((data[8] * 256 + data[9]) * 256 + data[10]) * 256 + data[11]
-
-        for _ in range(cc):
-            self.csrc.append(
-                ((data[offset] * 256 + data[offset + 1]) * 256 + data[offset + 2]) * 256
-                + data[offset + 3],
-            )
-            offset += 4
+        self.extension = (byte0 & self.X_MASK) == self.X_MASK
+        cc = byte0 & self.CC_MASK  # pylint:disable=invalid-name
+        self.marker = (byte1 & self.M_MASK) == self.M_MASK
+        self.payload_type = byte1 & self.PT_MASK
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.ssrc = ssrc
+
+        if cc:
+            if length < offset + 4 * cc:
+                self._error = self.ER_CSRC_LENGTH
+                return
             # FIXME In session.c of VLC they store per-source statistics in a rtp_source_t struct
+            self.csrc = list(struct.unpack_from(f'!{cc}I', data, offset))
+            offset += 4 * cc
 
         if self.extension:  # Extension header (ignored for now)
-            extension_length = data[offset + 2] * 256 + data[offset + 3]
+            if length < offset + 4:
+                self._error = self.ER_EXTENSION_LENGTH
+                return
+            _, extension_length = self.EXTENSION_STRUCT.unpack_from(data, offset)
             offset += 4 + extension_length
             if length < offset:
                 self._error = self.ER_EXTENSION_LENGTH
                 return
 
         # And finally ... The payload !
-        self.payload = data[offset:length]
+        if not copy:
+            self.payload = memoryview(data)[offset:length]
+        elif self.payload_pool is None:
+            self.payload = bytearray(memoryview(data)[offset:length])  # Slicing data may not copy
+        else:
+            self.payload = self.acquire_payload(length - offset, zero=False)
+            self.payload[:] = memoryview(data)[offset:length]
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Functions >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
@@ -424,6 +480,107 @@ class RtpPacket:  # pylint:disable=too-many-instance-attributes
         rtp.payload = payload  # type: ignore[assignment]
         return rtp
 
+    def pack_header_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        """Write the RTP header into `buffer` at `offset` and return the offset following it."""
+        cc = len(self.csrc)  # pylint:disable=invalid-name
+        self.HEADER_STRUCT.pack_into(
+            buffer,
+            offset,
+            (
+                ((self.version << self.V_SHIFT) & self.V_MASK)
+                + (self.P_MASK if self.padding else 0)
+                + (self.X_MASK if self.extension else 0)
+                + (cc & self.CC_MASK)
+            ),
+            (self.M_MASK if self.marker else 0) + (self.payload_type & self.PT_MASK),
+            self.sequence,
+            self.timestamp,
+            self.ssrc,
+        )
+        offset += self.HEADER_LENGTH
+        for contributor in self.csrc:
+            self.CSRC_STRUCT.pack_into(buffer, offset, contributor)
+            offset += 4
+        return offset
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        """
+        Write the RTP packet (header and payload) into `buffer` at `offset` and return its size.
+
+        No intermediate buffer is created, e.g. to serialize the packet into a send buffer.
+
+        **Example usage**
+
+        >>> rtp = RtpPacket.create(6, 777, RtpPacket.MP2T_PT, bytearray.fromhex('00 01 02 03'))
+        >>> buffer = bytearray(20)
+        >>> rtp.pack_into(buffer, 2)
+        16
+        >>> buffer[2:18] == rtp.bytes
+        True
+        >>> rtp.pack_into(bytearray(15))
+        Traceback (most recent call last):
+            ...
+        ValueError: Buffer of 15 bytes is too small for a packet of 16 bytes at offset 0
+        """
+        size = self.payload_size
+        end = offset + self.header_size + size
+        if end > len(buffer):
+            raise ValueError(
+                f'Buffer of {len(buffer)} bytes is too small for a packet of {end - offset} bytes '
+                f'at offset {offset}'
+            )
+        position = self.pack_header_into(buffer, offset)
+        if size:
+            buffer[position:end] = self.payload
+        return end - offset
+
+    def detach(self) -> RtpPacket:
+        r"""
+        Copy the payload out of the receive buffer if the packet was parsed with ``copy=False``.
+
+        **Example usage**
+
+        >>> buffer = bytearray.fromhex('80 21 00 06 00 00 03 09 00 00 00 00 ca fe')
+        >>> rtp = RtpPacket(buffer, len(buffer), copy=False)
+        >>> isinstance(rtp.payload, memoryview)
+        True
+        >>> rtp.detach().payload
+        bytearray(b'\xca\xfe')
+        >>> buffer[12:] = b'\x00\x00'
+        >>> rtp.payload
+        bytearray(b'\xca\xfe')
+        """
+        if isinstance(self.payload, memoryview):
+            payload = self.acquire_payload(len(self.payload), zero=False)
+            payload[:] = self.payload
+            self.payload = payload
+        return self
+
+    def release(self) -> None:
+        """
+        Give the payload back to the payload pool (if any), the packet must not be used anymore.
+
+        **Example usage**
+
+        >>> RtpPacket.payload_pool = PayloadPool(sizes=(4,))
+        >>> rtp = RtpPacket.create(6, 777, RtpPacket.MP2T_PT, RtpPacket.acquire_payload(4))
+        >>> payload = rtp.payload
+        >>> rtp.release()
+        >>> rtp.payload, RtpPacket.acquire_payload(4) is payload
+        (bytearray(b''), True)
+        >>> RtpPacket.payload_pool = None
+        """
+        if self.payload_pool is not None:
+            self.payload_pool.release(self.payload)
+            self.payload = bytearray()
+
+    @classmethod
+    def acquire_payload(cls, size: int, *, zero: bool = True) -> bytearray:
+        """Return a buffer of `size` bytes from the payload pool if set or a new one."""
+        if cls.payload_pool is None:
+            return bytearray(size)
+        return cls.payload_pool.acquire(size, zero=zero)
+
     def __eq__(self, other: object) -> bool:
         """
         Equality test.
@@ -475,3 +632,208 @@ time         = {self.time:.0f}
 ssrc         = {self.ssrc}
 csrc count   = {len(self.csrc)}
 payload size = {self.payload_size}"""
+
+
+class RtpPacketBatch:  # pylint:disable=too-many-instance-attributes
+    """
+    Decode a burst of real-time transport protocol (RTP) packets at once into NumPy arrays.
+
+    The datagrams are stored in one shared buffer (e.g. filled by ``recvmmsg`` or a pcap slab)
+    and described by their `offsets` and `lengths`. Every header field is exposed as an array
+    with one entry per packet and the payloads are located with :attr:`payload_offset` and
+    :attr:`payload_size` into that shared buffer, no per-packet object is created.
+
+    Fields are only meaningful for the packets flagged in :attr:`valid`, the rules are the same as
+    :attr:`RtpPacket.errors`.
+
+    Requires NumPy.
+
+    **Example usage**
+
+    >>> packets = [
+    ...     RtpPacket.create(65534, 100, RtpPacket.MP2T_PT, bytearray(188)),
+    ...     RtpPacket.create(65535, 200, RtpPacket.MP2T_PT, bytearray(188)),
+    ...     RtpPacket.create(2, 500, RtpPacket.MP2T_PT, bytearray(188)),
+    ...     RtpPacket.create(1, 400, RtpPacket.MP2T_PT, bytearray(188)),
+    ...     RtpPacket.create(3, 600, RtpPacket.DYNAMIC_PT, bytearray(188)),
+    ... ]
+    >>> datagrams = [p.bytes for p in packets] + [bytearray(RtpPacket.HEADER_LENGTH - 1)]
+    >>> batch = RtpPacketBatch.from_datagrams(datagrams)
+    >>> len(batch)
+    6
+    >>> batch.sequence.tolist()
+    [65534, 65535, 2, 1, 3, 0]
+    >>> batch.valid.tolist()
+    [True, True, True, True, True, False]
+    >>> batch.validMP2T.tolist()
+    [True, True, True, True, False, False]
+    >>> batch.errors(5) == RtpPacket(datagrams[5], len(datagrams[5])).errors
+    True
+    >>> batch.sequence_deltas().tolist()
+    [1, 3, -1, 2, -3]
+    >>> batch[2] == packets[2]
+    True
+    >>> truncated = bytearray.fromhex('83 21 00 06 00 00 03 09 00 00 00 00 11 11')
+    >>> RtpPacketBatch.from_datagrams([truncated]).errors(0) == RtpPacket(truncated, 14).errors
+    True
+    """
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Properties >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+
+    @property
+    def valid(self) -> np.ndarray:
+        """Returns a boolean array, True for packets that are valid RTP packets."""
+        return (
+            (self.version == 2)
+            & ~self.padding_error
+            & ~self.csrc_error
+            & ~self.extension_error
+            & (self.payload_size > 0)
+        )
+
+    @property
+    def validMP2T(self) -> np.ndarray:  # noqa: N802
+        """Returns a boolean array, True for valid RTP packets containing a MPEG2-TS payload."""
+        return self.valid & (self.payload_type == RtpPacket.MP2T_PT)
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Constructor >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+
+    def __init__(
+        self,
+        buffer: bytearray | bytes | memoryview,
+        offsets: object,
+        lengths: object,
+    ) -> None:
+        """
+        Parse the packets stored into `buffer`.
+
+        :param buffer: Shared buffer containing the datagrams
+        :param offsets: Offset of every datagram into the buffer (sequence of int)
+        :param lengths: Length of every datagram (sequence of int)
+        """
+        if np is None:
+            raise ImportError('RtpPacketBatch requires numpy')
+
+        self.buffer = buffer
+        self.offsets = offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = lengths = np.asarray(lengths, dtype=np.int64)
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        last = max(len(data) - 1, 0)
+        if len(data) == 0:
+            data = np.zeros(1, dtype=np.uint8)
+
+        def gather(positions: np.ndarray) -> np.ndarray:
+            return data[np.clip(positions, 0, last)]
+
+        header = gather(offsets[:, None] + np.arange(RtpPacket.HEADER_LENGTH))
+        self.version = (header[:, 0] & RtpPacket.V_MASK) >> RtpPacket.V_SHIFT
+        self.padding = (header[:, 0] & RtpPacket.P_MASK) != 0
+        self.extension = (header[:, 0] & RtpPacket.X_MASK) != 0
+        self.csrc_count = header[:, 0] & RtpPacket.CC_MASK
+        self.marker = (header[:, 1] & RtpPacket.M_MASK) != 0
+        self.payload_type = header[:, 1] & RtpPacket.PT_MASK
+        self.sequence = np.ascontiguousarray(header[:, 2:4]).view('>u2')[:, 0].astype(np.uint16)
+        self.timestamp = np.ascontiguousarray(header[:, 4:8]).view('>u4')[:, 0].astype(np.uint32)
+        self.ssrc = np.ascontiguousarray(header[:, 8:12]).view('>u4')[:, 0].astype(np.uint32)
+
+        has_header = lengths >= RtpPacket.HEADER_LENGTH
+        self.version = np.where(has_header, self.version, 0)
+
+        # Every check only applies if the previous ones passed (like RtpPacket's early returns)
+        parsed = self.version == 2  # Also False without a header (version set to 0)
+
+        # Remove padding if present
+        padding_length = np.where(
+            parsed & self.padding, gather(offsets + lengths - 1).astype(np.int64), 0
+        )
+        self.padding_error = (
+            parsed
+            & self.padding
+            & ((padding_length == 0) | (lengths < RtpPacket.HEADER_LENGTH + padding_length))
+        )
+        parsed &= ~self.padding_error
+        end = lengths - padding_length
+
+        # Skip contributing sources and extension header (ignored for now)
+        payload_offset = RtpPacket.HEADER_LENGTH + 4 * self.csrc_count.astype(np.int64)
+        self.csrc_error = parsed & (end < payload_offset)
+        parsed &= ~self.csrc_error
+        extension_header = gather(offsets[:, None] + payload_offset[:, None] + np.arange(2, 4))
+        extension_length = extension_header[:, 0].astype(np.int64) * 256 + extension_header[:, 1]
+        self.extension_error = parsed & self.extension & (end < payload_offset + 4)
+        payload_offset = np.where(
+            self.extension, payload_offset + 4 + extension_length, payload_offset
+        )
+        self.extension_error |= parsed & self.extension & (end < payload_offset)
+        parsed &= ~self.extension_error
+
+        self.payload_offset = offsets + payload_offset
+        self.payload_size = np.where(parsed, np.maximum(end - payload_offset, 0), 0)
+
+    # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Functions >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+
+    @classmethod
+    def from_datagrams(cls, datagrams: list) -> RtpPacketBatch:
+        """Concatenate `datagrams` into a shared buffer and parse them."""
+        lengths = [len(d) for d in datagrams]
+        offsets = list(itertools.accumulate(lengths, initial=0))[:-1]
+        return cls(b''.join(datagrams), offsets, lengths)
+
+    @classmethod
+    def from_slab(
+        cls, buffer: bytearray | memoryview, stride: int, lengths: object
+    ) -> RtpPacketBatch:
+        """
+        Parse datagrams stored every `stride` bytes into `buffer` (e.g. a ``recvmmsg`` slab).
+
+        **Example usage**
+
+        >>> slab = bytearray(3 * 2048)
+        >>> for i in range(3):
+        ...     data = RtpPacket.create(i, i * 10, RtpPacket.MP2T_PT, bytearray(7 * 188)).bytes
+        ...     slab[i * 2048:i * 2048 + len(data)] = data
+        >>> batch = RtpPacketBatch.from_slab(slab, 2048, [1328, 1328, 1328])
+        >>> batch.timestamp.tolist(), batch.payload_size.tolist()
+        ([0, 10, 20], [1316, 1316, 1316])
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        return cls(buffer, np.arange(len(lengths), dtype=np.int64) * stride, lengths)
+
+    def errors(self, index: int) -> list[str]:
+        """Return the errors of the packet at `index` (see :attr:`RtpPacket.errors`)."""
+        errors = []
+        if self.padding_error[index]:
+            errors.append(RtpPacket.ER_PADDING_LENGTH)
+        if self.csrc_error[index]:
+            errors.append(RtpPacket.ER_CSRC_LENGTH)
+        if self.extension_error[index]:
+            errors.append(RtpPacket.ER_EXTENSION_LENGTH)
+        if self.version[index] != 2:
+            errors.append(RtpPacket.ER_VERSION)
+        if self.payload_size[index] == 0:
+            errors.append(RtpPacket.ER_PAYLOAD)
+        return errors
+
+    def payload(self, index: int) -> memoryview:
+        """Return the payload of the packet at `index` as a :class:`memoryview` (zero-copy)."""
+        start = int(self.payload_offset[index])
+        return memoryview(self.buffer)[start : start + int(self.payload_size[index])]
+
+    def sequence_deltas(self) -> np.ndarray:
+        """
+        Return the signed difference of sequence number between consecutive packets.
+
+        Wrap-around is handled, so 1 is the expected value, greater values are gaps (lost packets)
+        and values lower than 1 are duplicated (0) or reordered packets.
+        """
+        deltas = np.bitwise_and(np.diff(self.sequence.astype(np.int64)), RtpPacket.S_MASK)
+        return np.where(deltas > RtpPacket.S_MASK // 2, deltas - (RtpPacket.S_MASK + 1), deltas)
+
+    def __getitem__(self, index: int) -> RtpPacket:
+        """Return the packet at `index` as an instance of :class:`RtpPacket` (zero-copy)."""
+        offset = int(self.offsets[index])
+        view = memoryview(self.buffer)[offset : offset + int(self.lengths[index])]
+        return RtpPacket(view, len(view), copy=False)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
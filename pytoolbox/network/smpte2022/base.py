@@ -6,10 +6,10 @@ from __future__ import annotations
 
 import struct
 
-from fastxor import fast_xor_inplace  # pylint:disable=no-name-in-module
-
 from pytoolbox.network.rtp import RtpPacket
 
+from .xor import xor_many_inplace
+
 __all__ = ['FecPacket']
 
 
@@ -111,6 +111,7 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Constants >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
     ER_PAYLOAD_TYPE = 'RTP Header : Payload type must be set to 96'
+    ER_HEADER_LENGTH = 'SMPTE 2022-1 Header : Bad header length'
     ER_EXTENDED = 'SMPTE 2022-1 Header : Extended must be set to one'
     ER_MASK = 'SMPTE 2022-1 Header : Mask must be set to zero'
     ER_N = 'SMPTE 2022-1 Header : N must be set to zero'
@@ -129,6 +130,7 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
     ER_J = 'Unable to find a suitable j e N that satisfy : media_sequence = snbase + j * offset'
 
     HEADER_LENGTH = 16
+    HEADER_STRUCT = struct.Struct('!HHBBHIBBBB')
     E_MASK = 0x80
     PT_MASK = 0x7F
     N_MASK = 0x80
@@ -168,6 +170,12 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
         #TODO >>> fec = FecPacket(bytearray(FecPacket.HEADER_LENGTH-1), FecPacket.HEADER_LENGTH-1)
         #TODO >>> print(fec.errors)
         #TODO ['RTP Header : Version must be set to 2', 'RTP packet must have a payload']
+
+        Testing a truncated FEC header:
+
+        >>> data = RtpPacket.create(1, 0, RtpPacket.DYNAMIC_PT, bytearray(8)).bytes
+        >>> FecPacket.ER_HEADER_LENGTH in FecPacket(data, len(data)).errors
+        True
         """
         errors = self._errors[:]
         if not self.extended:
@@ -294,30 +302,16 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
         >>> fec == FecPacket(header, len(header))
         True
         """
-        # TODO map type string to enum
         header = bytearray(self.HEADER_LENGTH)
-        struct.pack_into(b'!H', header, 0, self.snbase & self.SNBL_MASK)
-        struct.pack_into(b'!H', header, 2, self.length_recovery)
-        struct.pack_into(b'!I', header, 4, self.mask)
-        header[4] = (self.payload_type_recovery & self.PT_MASK) + (
-            self.E_MASK if self.extended else 0
-        )
-        struct.pack_into(b'!I', header, 8, self.timestamp_recovery)
-        header[12] = (
-            (self.N_MASK if self.n else 0)
-            + (self.D_MASK if self.direction else 0)
-            + ((self.algorithm << self.T_SHIFT) & self.T_MASK)
-            + (self.index & self.I_MASK)
-        )
-        header[13] = self.offset
-        header[14] = self.na
-        header[15] = self.snbase >> self.SNBE_SHIFT
+        self.pack_header_into(header)
         return header
 
     @property
     def bytes(self) -> bytearray:
         """Return the complete FEC packet bytes (header + payload recovery)."""
-        return self.header_bytes + self.payload_recovery
+        data = bytearray(self.HEADER_LENGTH + self.payload_size)
+        self.pack_into(data)
+        return data
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Constructor >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
@@ -334,7 +328,7 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
         self.payload_type_recovery = 0
         self.timestamp_recovery = 0
         self.length_recovery = 0
-        self.payload_recovery: bytearray = bytearray()
+        self.payload_recovery: bytearray | memoryview = bytearray()
         # (Unused as defined in SMPTE 2022-1-1)
         self.index = 0
         self.mask = 0
@@ -343,7 +337,7 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
         self.missing: list[int] = []
 
         if data is not None:
-            packet = RtpPacket(data, length)
+            packet = RtpPacket(data, length, copy=False)  # Only the payload recovery is copied
             self.sequence = packet.sequence
             self._errors = packet.errors[:]
             if len(self._errors) > 0:
@@ -351,6 +345,9 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
             if packet.payload_type != RtpPacket.DYNAMIC_PT:
                 self._errors.append(self.ER_PAYLOAD_TYPE)
                 return
+            if len(packet.payload) < self.HEADER_LENGTH:
+                self._errors.append(self.ER_HEADER_LENGTH)
+                return
             self.snbase = (packet.payload[15] * 256 + packet.payload[0]) * 256 + packet.payload[1]
             self.length_recovery = packet.payload[2] * 256 + packet.payload[3]
             self.extended = (packet.payload[4] & self.E_MASK) != 0
@@ -377,7 +374,9 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
             self.na = packet.payload[14]
             self.snbase += packet.payload[15] << 16
             # And finally ... The payload !
-            self.payload_recovery = packet.payload[self.HEADER_LENGTH :]
+            recovery = packet.payload[self.HEADER_LENGTH :]
+            self.payload_recovery = RtpPacket.acquire_payload(len(recovery), zero=False)
+            self.payload_recovery[:] = recovery
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Functions >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
@@ -537,8 +536,8 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
             size = max(size, packet.payload_size)
             i += 1
 
-        # Create payload recovery field according to size/length
-        fec.payload_recovery = bytearray(size)
+        # Create payload recovery field according to size/length (zero-filled, from the pool if set)
+        fec.payload_recovery = RtpPacket.acquire_payload(size)
 
         # Compute FEC packet's fields based on input packets
         for packet in packets:
@@ -547,18 +546,82 @@ class FecPacket:  # pylint:disable=too-many-instance-attributes
             fec.timestamp_recovery ^= packet.timestamp
             fec.length_recovery ^= packet.payload_size
 
-            # Update payload recovery by xor'ing all packets payload
-            payload = packet.payload
-            if len(packet.payload) < size:
-                payload = payload + bytearray(size - len(packet.payload))
-
-            fast_xor_inplace(fec.payload_recovery, bytearray(payload))
-            # NUMPY fec.payload_recovery = bytearray(
-            #     numpy.bitwise_xor(fec.payload_recovery, bytearray(payload)))
-            # XOR LOOP for i in range(min(size, len(packet.payload))):
-            # XOR LOOP     fec.payload_recovery[i] ^= packet.payload[i]
+        # Update payload recovery by xor'ing all packets payload (shorter ones are zero-padded)
+        xor_many_inplace(fec.payload_recovery, [packet.payload for packet in packets])
         return fec
 
+    def pack_header_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        """Write the FEC header into `buffer` at `offset` and return the offset following it."""
+        # TODO map type string to enum
+        self.HEADER_STRUCT.pack_into(
+            buffer,
+            offset,
+            self.snbase & self.SNBL_MASK,
+            self.length_recovery,
+            (self.payload_type_recovery & self.PT_MASK) + (self.E_MASK if self.extended else 0),
+            self.mask >> 16 & 0xFF,
+            self.mask & 0xFFFF,
+            self.timestamp_recovery,
+            (
+                (self.N_MASK if self.n else 0)
+                + (self.D_MASK if self.direction else 0)
+                + ((self.algorithm << self.T_SHIFT) & self.T_MASK)
+                + (self.index & self.I_MASK)
+            ),
+            self.offset,
+            self.na,
+            self.snbase >> self.SNBE_SHIFT,
+        )
+        return offset + self.HEADER_LENGTH
+
+    def pack_into(self, buffer: bytearray | memoryview, offset: int = 0) -> int:
+        """
+        Write the FEC packet (header + payload recovery) into `buffer` at `offset` and return its
+        size (the RTP header is not included, see :meth:`RtpPacket.pack_header_into`).
+
+        **Example usage**
+
+        >>> from pytoolbox.network.rtp import RtpPacket
+        >>> packets = [
+        ...     RtpPacket.create(10, 100, RtpPacket.MP2T_PT, bytearray(123)),
+        ...     RtpPacket.create(11, 200, RtpPacket.MP2T_PT, bytearray(1234))
+        ... ]
+        >>> fec = FecPacket.compute(26, FecPacket.XOR, FecPacket.ROW, 2, 1, packets)
+        >>> buffer = bytearray(1500)
+        >>> size = fec.pack_into(buffer, RtpPacket.HEADER_LENGTH)
+        >>> size, buffer[12:12 + size] == fec.bytes
+        (1250, True)
+        >>> rtp = RtpPacket.create(26, 0, RtpPacket.DYNAMIC_PT, bytearray())
+        >>> rtp.pack_header_into(buffer)
+        12
+        >>> fec == FecPacket(buffer, 12 + size)
+        True
+        >>> fec.pack_into(buffer, 251)
+        Traceback (most recent call last):
+            ...
+        ValueError: Buffer of 1500 bytes is too small for a packet of 1250 bytes at offset 251
+        """
+        size = self.payload_size
+        end = offset + self.HEADER_LENGTH + size
+        if end > len(buffer):
+            raise ValueError(
+                f'Buffer of {len(buffer)} bytes is too small for a packet of {end - offset} bytes '
+                f'at offset {offset}'
+            )
+        position = self.pack_header_into(buffer, offset)
+        if size:
+            buffer[position:end] = self.payload_recovery
+        return end - offset
+
+    def release(self) -> None:
+        """
+        Give the payload recovery back to the payload pool (if any, see
+        :attr:`RtpPacket.payload_pool`), the packet must not be used anymore.
+        """
+        if RtpPacket.payload_pool is not None:
+            RtpPacket.payload_pool.release(self.payload_recovery)
+            self.payload_recovery = bytearray()
+
     def compute_j(self, media_sequence: int) -> int | None:
         """Return the index *j* for *media_sequence* within this FEC packet."""
         if (delta := media_sequence - self.snbase) < 0:
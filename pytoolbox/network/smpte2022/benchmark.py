@@ -0,0 +1,413 @@
+"""
+Throughput benchmark of the SMPTE 2022-1 FEC generator and receiver with synthetic loss models.
+
+Synthetic MPEG-TS over RTP streams are protected by a :class:`FecGenerator`, then losses are applied
+by a loss model before feeding a :class:`FecReceiver`.
+
+Can be used from the command line::
+
+    python -m pytoolbox.network.smpte2022.benchmark --matrix 10x10 --matrix 20x5 --loss uniform:0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+
+from pytoolbox.network.rtp import RtpPacket
+
+from .base import FecPacket
+from .generator import FecGenerator
+from .receiver import FecReceiver
+
+__all__ = [
+    'BenchmarkResult',
+    'ColumnBurstLoss',
+    'GilbertElliottLoss',
+    'LossModel',
+    'UniformLoss',
+    'benchmark',
+    'create_loss_model',
+    'create_medias',
+    'main',
+]
+
+TS_PACKET_SIZE = 188
+TS_PACKETS_PER_RTP = 7
+
+
+# Loss models --------------------------------------------------------------------------------------
+
+
+class LossModel:
+    """Decide if each media packet of a stream is lost (base class: nothing is lost)."""
+
+    def __init__(self, seed: int = 0) -> None:
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def __iter__(self) -> Iterator[bool]:
+        """Yield True for each lost packet and False for each received packet (endlessly)."""
+        self.random.seed(self.seed)
+        while True:
+            yield False
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}()'
+
+
+class UniformLoss(LossModel):
+    """
+    Each packet is lost with the same probability.
+
+    **Example usage**
+
+    >>> import itertools
+    >>> losses = list(itertools.islice(UniformLoss(0.1, seed=1), 10000))
+    >>> 900 < sum(losses) < 1100
+    True
+    """
+
+    def __init__(self, ratio: float, seed: int = 0) -> None:
+        super().__init__(seed)
+        self.ratio = ratio
+
+    def __iter__(self) -> Iterator[bool]:
+        self.random.seed(self.seed)
+        rand, ratio = self.random.random, self.ratio
+        while True:
+            yield rand() < ratio
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.ratio})'
+
+
+class GilbertElliottLoss(LossModel):
+    """
+    Two states (good and bad) Markov chain generating bursts of losses.
+
+    **Example usage**
+
+    >>> import itertools
+    >>> model = GilbertElliottLoss(p_good_bad=0.01, p_bad_good=0.25, seed=2)
+    >>> losses = list(itertools.islice(model, 100000))
+    >>> 0.02 < sum(losses) / len(losses) < 0.05  # Steady state: 0.01 / (0.01 + 0.25) = 0.038
+    True
+    """
+
+    def __init__(
+        self,
+        p_good_bad: float,
+        p_bad_good: float,
+        *,
+        loss_good: float = 0.0,
+        loss_bad: float = 1.0,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(seed)
+        self.p_good_bad = p_good_bad
+        self.p_bad_good = p_bad_good
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+
+    def __iter__(self) -> Iterator[bool]:
+        self.random.seed(self.seed)
+        rand, bad = self.random.random, False
+        while True:
+            bad = rand() >= self.p_bad_good if bad else rand() < self.p_good_bad
+            yield rand() < (self.loss_bad if bad else self.loss_good)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.p_good_bad}, {self.p_bad_good})'
+
+
+class ColumnBurstLoss(LossModel):
+    """
+    Periodic bursts of consecutive losses, longer than a row they are defeating column FEC alone.
+
+    **Example usage**
+
+    >>> import itertools
+    >>> ''.join('x' if lost else '.' for lost in itertools.islice(ColumnBurstLoss(3, 8), 20))
+    'xxx.....xxx.....xxx.'
+    """
+
+    def __init__(self, length: int, interval: int, seed: int = 0) -> None:
+        super().__init__(seed)
+        if not 0 <= length <= interval:
+            raise ValueError(f'Burst length {length} must be in [0, {interval}]')
+        self.length = length
+        self.interval = interval
+
+    def __iter__(self) -> Iterator[bool]:
+        while True:
+            for index in range(self.interval):
+                yield index < self.length
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.length}, {self.interval})'
+
+
+def create_loss_model(spec: str, seed: int = 0) -> LossModel:
+    """
+    Create a loss model from a specification: name and colon separated parameters.
+
+    **Example usage**
+
+    >>> create_loss_model('none')
+    LossModel()
+    >>> create_loss_model('uniform:0.05')
+    UniformLoss(0.05)
+    >>> create_loss_model('gilbert:0.01:0.3')
+    GilbertElliottLoss(0.01, 0.3)
+    >>> create_loss_model('burst:11:500')
+    ColumnBurstLoss(11, 500)
+    >>> create_loss_model('gaga:1')
+    Traceback (most recent call last):
+        ...
+    ValueError: Unknown loss model 'gaga'
+    """
+    name, *parameters = spec.split(':')
+    if name == 'none':
+        return LossModel(seed)
+    if name == 'uniform':
+        return UniformLoss(float(parameters[0]), seed=seed)
+    if name == 'gilbert':
+        return GilbertElliottLoss(float(parameters[0]), float(parameters[1]), seed=seed)
+    if name == 'burst':
+        return ColumnBurstLoss(int(parameters[0]), int(parameters[1]), seed=seed)
+    raise ValueError(f'Unknown loss model {name!r}')
+
+
+# Benchmark ----------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True, slots=True)
+class BenchmarkResult:  # pylint:disable=too-many-instance-attributes
+    """Result of a benchmark run, rates are in packets per second."""
+
+    L: int  # pylint:disable=invalid-name
+    D: int  # pylint:disable=invalid-name
+    loss: str
+    medias: int
+    lost: int
+    generator_rate: float
+    receiver_rate: float
+    recovered: int
+    missing: int
+    recovery_ratio: float
+    max_media: int
+    max_cross: int
+    max_col: int
+    max_row: int
+    blocks_per_packet: float
+    peak_bytes_per_packet: float | None
+
+    def __str__(self) -> str:
+        return (
+            f'{self.L:>3}x{self.D:<3} {self.loss:<30} '
+            f'generator {self.generator_rate:>9.0f} p/s  receiver {self.receiver_rate:>9.0f} p/s  '
+            f'lost {self.lost:>6}  recovered {self.recovery_ratio:>7.2%}  '
+            f'max media/cross/col/row {self.max_media}/{self.max_cross}/{self.max_col}/'
+            f'{self.max_row}  blocks/packet {self.blocks_per_packet:.2f}'
+            + (
+                ''
+                if self.peak_bytes_per_packet is None
+                else f'  peak bytes/packet {self.peak_bytes_per_packet:.0f}'
+            )
+        )
+
+
+def create_medias(count: int, *, start: int = 0, seed: int = 0) -> list[RtpPacket]:
+    """
+    Return a synthetic MPEG-TS over RTP stream (7 TS packets per RTP packet, 90 kHz clock).
+
+    **Example usage**
+
+    >>> medias = create_medias(3, start=65535)
+    >>> [media.sequence for media in medias], medias[1].payload_size, medias[1].payload[188]
+    ([65535, 0, 1], 1316, 71)
+    >>> all(media.validMP2T for media in medias)
+    True
+    """
+    rand = random.Random(seed)
+    medias = []
+    for index in range(count):
+        payload = bytearray(rand.randbytes(TS_PACKET_SIZE * TS_PACKETS_PER_RTP))
+        payload[::TS_PACKET_SIZE] = b'\x47' * TS_PACKETS_PER_RTP  # Sync bytes
+        medias.append(
+            RtpPacket.create(
+                (start + index) & RtpPacket.S_MASK,
+                (index * 900) & RtpPacket.TS_MASK,  # 100 packets per second
+                RtpPacket.MP2T_PT,
+                payload,
+            )
+        )
+    return medias
+
+
+def benchmark(  # pylint:disable=too-many-locals
+    medias: list[RtpPacket],
+    L: int,  # noqa: N803
+    D: int,  # noqa: N803
+    loss: LossModel | None = None,
+    *,
+    delay: int | None = None,
+    incremental: bool = False,
+    trace_memory: bool = False,
+) -> BenchmarkResult:
+    """
+    Benchmark the FEC generator and receiver with the given stream and loss model.
+
+    :param medias: The media packets of the stream, see :func:`create_medias`.
+    :param L: Horizontal size of the FEC matrix (columns)
+    :param D: Vertical size of the FEC matrix (rows)
+    :param loss: The loss model applied to the media packets.
+    :param delay: Delay of the receiver in packets (defaults to twice the size of the matrix).
+    :param incremental: Use the incremental mode of the generator.
+    :param trace_memory: Measure peak memory usage of the receiver (much slower).
+
+    **Example usage**
+
+    >>> result = benchmark(create_medias(1000), 5, 4, UniformLoss(0.01, seed=3))
+    >>> result.medias, result.lost, result.missing, result.recovery_ratio
+    (1000, 9, 0, 1.0)
+    >>> result.generator_rate > 0 and result.receiver_rate > 0
+    True
+    """
+    loss = loss or LossModel()
+
+    # Generate the FEC packets (and time it)
+    fecs: list[FecPacket] = []
+    counts: list[int] = []  # Amount of FEC packets generated so far, after each media packet
+    generator = FecGenerator(L, D, incremental=incremental)
+    generator.on_reset = lambda media: None  # type: ignore[method-assign]
+    generator.on_new_col = fecs.append  # type: ignore[assignment,method-assign]
+    generator.on_new_row = fecs.append  # type: ignore[assignment,method-assign]
+    start = time.perf_counter()
+    for media in medias:
+        generator.put_media(media)
+        counts.append(len(fecs))
+    generator_elapsed = time.perf_counter() - start
+
+    # Prepare the packets received by the receiver (FEC packets as they are parsed from the network)
+    received: list[tuple[RtpPacket | None, list[FecPacket]]] = []
+    lost = first = 0
+    for media, count, is_lost in zip(medias, counts, loss, strict=False):
+        lost += is_lost
+        received.append((None if is_lost else media, [_to_received(f) for f in fecs[first:count]]))
+        first = count
+
+    # Receive the packets (and time it)
+    receiver = FecReceiver(_NullOutput())  # type: ignore[arg-type]
+    receiver.set_delay(2 * L * D if delay is None else delay, FecReceiver.PACKETS)
+    put_media, put_fec = receiver.put_media, receiver.put_fec
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    for received_media, received_fecs in received:
+        if received_media is not None:
+            put_media(received_media, True)
+        for fec in received_fecs:
+            put_fec(fec)
+    receiver.flush()
+    receiver_elapsed = time.perf_counter() - start
+    blocks = sys.getallocatedblocks() - blocks
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / len(medias)
+        tracemalloc.stop()
+
+    return BenchmarkResult(
+        L=L,
+        D=D,
+        loss=repr(loss),
+        medias=len(medias),
+        lost=lost,
+        generator_rate=len(medias) / generator_elapsed if generator_elapsed else 0.0,
+        receiver_rate=len(medias) / receiver_elapsed if receiver_elapsed else 0.0,
+        recovered=receiver.media_recovered,
+        missing=receiver.media_missing,
+        recovery_ratio=receiver.media_recovered / lost if lost else 1.0,
+        max_media=receiver.max_media,
+        max_cross=receiver.max_cross,
+        max_col=receiver.max_col,
+        max_row=receiver.max_row,
+        blocks_per_packet=blocks / len(medias),
+        peak_bytes_per_packet=peak,
+    )
+
+
+class _NullOutput:
+    """Discard the recovered stream (to only measure the receiver)."""
+
+    def write(self, data: object) -> None:
+        """Discard `data`."""
+
+    def flush(self) -> None:
+        """Do nothing."""
+
+
+def _to_received(fec: FecPacket) -> FecPacket:
+    data = RtpPacket.create(fec.sequence, 0, RtpPacket.DYNAMIC_PT, fec.bytes).bytes
+    return FecPacket(data, len(data))
+
+
+def main(args: list[str] | None = None) -> list[BenchmarkResult]:
+    """Run the benchmarks from the command line, print and return the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0].strip())
+    parser.add_argument('-c', '--count', type=int, default=20_000, help='Media packets.')
+    parser.add_argument(
+        '-m',
+        '--matrix',
+        action='append',
+        help='FEC matrix size LxD (can be repeated, default 10x10).',
+    )
+    parser.add_argument(
+        '-l',
+        '--loss',
+        action='append',
+        help='Loss model: none, uniform:<ratio>, gilbert:<p_good_bad>:<p_bad_good> or '
+        'burst:<length>:<interval> (can be repeated, default uniform:0.01).',
+    )
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random generators seed.')
+    parser.add_argument('--incremental', action='store_true', help='Incremental generator.')
+    parser.add_argument('--json', action='store_true', help='Output results as JSON lines.')
+    parser.add_argument(
+        '--trace-memory',
+        action='store_true',
+        help='Measure peak memory usage of the receiver (slower).',
+    )
+    options = parser.parse_args(args)
+    medias = create_medias(options.count, seed=options.seed)
+    results = []
+    for matrix in options.matrix or ['10x10']:
+        L, D = (int(size) for size in matrix.lower().split('x'))  # noqa: N806
+        for spec in options.loss or ['uniform:0.01']:
+            result = benchmark(
+                medias,
+                L,
+                D,
+                create_loss_model(spec, seed=options.seed),
+                incremental=options.incremental,
+                trace_memory=options.trace_memory,
+            )
+            results.append(result)
+            if options.json:
+                print(json.dumps(asdict(result)))
+            else:
+                print(result)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ from __future__ import annotations
 from pytoolbox.network.rtp import RtpPacket
 
 from .base import FecPacket
+from .xor import xor_inplace
 
 __all__ = ['FecGenerator']
 
@@ -15,6 +16,31 @@ class FecGenerator:  # pylint:disable=too-many-instance-attributes
     """
     A SMPTE 2022-1 FEC streams generator.
     This generator accept incoming RTP media packets and compute corresponding FEC packets.
+
+    In incremental mode, the media packets are not stored but XOR'ed once into running accumulators
+    (the current row and the L columns) that are output as soon as they are complete.
+
+    **Example usage**
+
+    Both modes are generating the same FEC packets:
+
+    >>> import random
+    >>>
+    >>> fecs = {False: [], True: []}
+    >>> for incremental in (False, True):
+    ...     generator = FecGenerator(4, 5, incremental=incremental)
+    ...     generator.on_new_col = generator.on_new_row = fecs[incremental].append
+    ...     generator.on_reset = lambda media: None
+    ...     random.seed(7)
+    ...     for i in range(65500, 65500 + 50):  # Sequence numbers are wrapping around
+    ...         payload = bytearray(random.randbytes(random.randint(50, 100)))
+    ...         generator.put_media(RtpPacket.create(i, i * 100, RtpPacket.MP2T_PT, payload))
+    >>> len(fecs[True]), fecs[False] == fecs[True]
+    (20, True)
+    >>> [f.timestamp_recovery for f in fecs[False]] == [f.timestamp_recovery for f in fecs[True]]
+    True
+    >>> [(fec.sequence, fec.snbase) for fec in fecs[True][-3:]]
+    [(8, 65523), (11, 4), (12, 8)]
     """
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Properties >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
@@ -45,22 +71,30 @@ class FecGenerator:  # pylint:disable=too-many-instance-attributes
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Constructor >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
-    def __init__(  # pylint:disable=invalid-name,too-many-instance-attributes
+    def __init__(  # pylint:disable=invalid-name
         self,
         L: int,  # noqa: N803
         D: int,  # noqa: N803
+        *,
+        incremental: bool = False,
     ) -> None:
         """
         Construct a FecGenerator.
 
         :param L: Horizontal size of the FEC matrix (columns)
         :param D: Vertical size of the FEC matrix (rows)
+        :param incremental: Compute the FEC packets with running accumulators instead of storing
+            the media packets of the matrix.
         """
         self._L, self._D = L, D  # pylint:disable=invalid-name
         self._col_sequence = self._row_sequence = 1
-        self._media_sequence = None
-        self._medias = []
+        self._media_sequence: int | None = None
+        self._medias: list[RtpPacket] = []
         self._invalid = self._total = 0
+        self.incremental = incremental
+        self._position = 0  # Position of the next media packet in the matrix (incremental mode)
+        self._row: FecPacket | None = None  # Accumulator of the current row (incremental mode)
+        self._cols: list[FecPacket | None] = [None] * L  # Accumulators of the columns (idem)
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Functions >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
@@ -212,13 +246,18 @@ class FecGenerator:  # pylint:disable=too-many-instance-attributes
         # - Looped VLC broadcast session restarted media
         # - Some media packet are really lost between the emitter and this software
         # - An unknown feature (aka bug) makes this beautiful tool crazy !
-        if self._media_sequence is not None and media.sequence == self._media_sequence:
-            self._medias.append(media)
-        else:
-            self._medias = [media]
+        if self._media_sequence is None or media.sequence != self._media_sequence:
+            self._medias = []
+            self._position = 0
             self.on_reset(media)
         self._media_sequence = sequence
 
+        if self.incremental:
+            self._put_media_incremental(media)
+            return
+
+        self._medias.append(media)
+
         # Compute a new row FEC packet when a new row just filled with packets
         if len(self._medias) % self._L == 0:
             row_medias = self._medias[-self._L :]
@@ -253,6 +292,63 @@ class FecGenerator:  # pylint:disable=too-many-instance-attributes
         if len(self._medias) == self._L * self._D:
             self._medias = []
 
+    def _put_media_incremental(self, media: RtpPacket) -> None:
+        if not media.validMP2T:
+            raise ValueError(FecPacket.ER_VALID_MP2T)
+
+        row_index, col_index = divmod(self._position, self._L)
+        self._position = (self._position + 1) % (self._L * self._D)
+
+        # XOR the media packet into the accumulators, starting new ones if necessary
+        if col_index == 0:
+            self._row = self._create_accumulator(FecPacket.ROW, media)
+        if row_index == 0:
+            self._cols[col_index] = self._create_accumulator(FecPacket.COL, media)
+        row, col = self._row, self._cols[col_index]
+        assert row is not None and col is not None
+        self._accumulate(row, media)
+        self._accumulate(col, media)
+
+        # Output the accumulators as soon as they are complete
+        if col_index == self._L - 1:
+            row.sequence = self._row_sequence
+            self._row_sequence = (self._row_sequence + 1) & RtpPacket.S_MASK
+            self._row = None
+            self.on_new_row(row)
+
+        if row_index == self._D - 1:
+            col.sequence = self._col_sequence
+            self._col_sequence = (self._col_sequence + 1) & RtpPacket.S_MASK
+            self._cols[col_index] = None
+            self.on_new_col(col)
+
+    def _create_accumulator(self, direction: int, media: RtpPacket) -> FecPacket:
+        fec = FecPacket()
+        fec.direction = direction
+        fec.snbase = media.sequence
+        fec.payload_recovery = RtpPacket.acquire_payload(media.payload_size)
+        if direction == FecPacket.COL:
+            fec.na, fec.offset = self._D, self._L
+        else:
+            fec.na, fec.offset = self._L, 1
+        return fec
+
+    @staticmethod
+    def _accumulate(fec: FecPacket, media: RtpPacket) -> None:
+        fec.payload_type_recovery ^= media.payload_type
+        fec.timestamp_recovery ^= media.timestamp
+        fec.length_recovery ^= media.payload_size
+        recovery = fec.payload_recovery
+        assert isinstance(recovery, bytearray)
+        if media.payload_size > len(recovery):
+            # Shorter payloads are zero-padded, move to a (pooled) buffer of the longest size
+            longer = RtpPacket.acquire_payload(media.payload_size)
+            longer[: len(recovery)] = recovery
+            if RtpPacket.payload_pool is not None:
+                RtpPacket.payload_pool.release(recovery)
+            fec.payload_recovery = recovery = longer
+        xor_inplace(recovery, media.payload)  # type: ignore[arg-type]
+
     def __str__(self) -> str:
         """
         Return a string containing a formatted representation of the FEC streams generator.
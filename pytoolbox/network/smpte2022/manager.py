@@ -0,0 +1,579 @@
+"""
+Multi-process SMPTE 2022-1 FEC receiver, the streams are sharded across a pool of workers.
+
+The datagrams are received by one :mod:`asyncio` event loop in the parent process and handed over
+without pickling to the worker in charge of the stream through a shared-memory ring buffer
+(:class:`SharedRing`, one per worker). Each worker runs the :class:`FecReceiver` of its streams, so
+the FEC processing scales with the amount of cores (the parent only copies datagrams into the
+rings).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterable
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, Final, NamedTuple
+
+from pytoolbox import logging
+
+from .receiver import FecReceiver
+from .ring import SharedRing
+from .service import COL, MEDIA, ROW, FecReceiverService, FecStream, StreamSocketsMixin
+
+log = logging.get_logger(__name__)
+
+__all__ = [
+    'STATISTICS',
+    'FecReceiverManager',
+    'FecWorker',
+    'ShardedDatagramProtocol',
+    'ShardedStream',
+    'aggregate',
+    'run_worker',
+]
+
+# Counters of a stream, the counters prefixed by max_ are maximums, the others are summed up
+STATISTICS: Final[tuple[str, ...]] = (
+    'media_received',
+    'media_recovered',
+    'media_aborted_recovery',
+    'media_overwritten',
+    'media_missing',
+    'media_late',
+    'col_received',
+    'row_received',
+    'col_dropped',
+    'row_dropped',
+    'max_media',
+    'max_cross',
+    'max_col',
+    'max_row',
+    'invalid',
+    'dropped',
+)
+
+# Kind of the datagrams, the index is stored in the 2 lowest bits of the channel in the ring
+KINDS: Final[tuple[str, ...]] = (MEDIA, COL, ROW)
+
+
+def aggregate(statistics: Iterable[dict[str, int]]) -> dict[str, int]:
+    """
+    Aggregate the statistics of many streams.
+
+    **Example usage**
+
+    >>> aggregate([{'media_received': 10, 'max_media': 5}, {'media_received': 3, 'max_media': 7}])
+    {'media_received': 13, 'max_media': 7}
+    """
+    total: dict[str, int] = {}
+    for counters in statistics:
+        for name, value in counters.items():
+            function: Callable[[int, int], int] = max if name.startswith('max_') else int.__add__
+            total[name] = function(total[name], value) if name in total else value
+    return total
+
+
+# Worker process -----------------------------------------------------------------------------------
+
+
+class FecWorker:
+    """
+    Runs the receivers of the streams handled by a worker process.
+
+    The worker is processing the datagrams of the ring by batches and the commands sent by the
+    manager (a method name and its arguments) between two batches. The datagrams already in the
+    ring are processed before executing a command.
+
+    A datagram breaking the receiver of its stream is counted as invalid, the other datagrams and
+    streams are not affected.
+    """
+
+    receiver_class: type[FecReceiver] = FecReceiver
+    stream_class: type[FecStream] = FecStream
+
+    # Maximum amount of datagrams processed between two checks for commands
+    batch_size: int = 256
+    # Sleep duration when the ring is empty (seconds)
+    poll_interval: float = 0.001
+    # Interval between two cleanups of the FEC packets that became useless (seconds)
+    cleanup_interval: float = 1.0
+
+    def __init__(self, ring: SharedRing, connection: Connection) -> None:
+        self.ring = ring
+        self.connection = connection
+        self.streams: dict[int, FecStream] = {}
+        self.running = False
+
+    def run(self) -> None:
+        """Process the datagrams and the commands until stopped (or the manager is gone)."""
+        self.running = True
+        next_cleanup = time.monotonic() + self.cleanup_interval
+        try:  # pylint:disable=too-many-try-statements
+            while self.running:
+                if self.connection.poll():
+                    try:
+                        method, args = self.connection.recv()
+                    except EOFError:
+                        break
+                    self.process()
+                    self.connection.send(self.execute(method, args))
+                elif not self.process(self.batch_size):
+                    time.sleep(self.poll_interval)
+                if time.monotonic() > next_cleanup:
+                    self.cleanup()
+                    next_cleanup = time.monotonic() + self.cleanup_interval
+        finally:
+            for channel in list(self.streams):
+                self.remove_stream(channel)
+
+    def execute(self, method: str, args: tuple[Any, ...]) -> Any:
+        """Execute a command and return its result (or the exception it raised)."""
+        if method not in {'add_stream', 'remove_stream', 'get_statistics', 'stop'}:
+            return ValueError(f'Unknown command {method!r}')
+        try:
+            return getattr(self, method)(*args)
+        except Exception as exc:  # pylint:disable=broad-except
+            return exc
+
+    def process(self, limit: int | None = None) -> int:
+        """Put (at most `limit`) datagrams of the ring into the receivers, return their amount."""
+        datagrams = self.ring.get(limit)
+        streams = self.streams
+        for channel, data in datagrams:
+            if stream := streams.get(channel >> 2):
+                try:
+                    stream.put(KINDS[channel & 3], data)
+                except Exception as exc:  # pylint:disable=broad-except
+                    stream.invalid += 1
+                    log.warning('Stream %s, failed to process packet: %r', stream.media_socket, exc)
+        return len(datagrams)
+
+    def cleanup(self) -> None:
+        """Remove FEC packets that are stored but useless from the receivers."""
+        for stream in self.streams.values():
+            if not stream.receiver.startup:
+                try:
+                    stream.receiver.cleanup()
+                except Exception as exc:  # pylint:disable=broad-except
+                    log.warning('Stream %s, failed to cleanup: %r', stream.media_socket, exc)
+
+    def add_stream(
+        self,
+        channel: int,
+        media_socket: str,
+        output: str,
+        delay: float,
+        units: int,
+        only_mp2ts: bool,
+    ) -> None:
+        """Start receiving a stream, the recovered stream is written into the `output` file."""
+        # pylint:disable=consider-using-with
+        receiver = self.receiver_class(open(output, 'wb'))  # type: ignore[arg-type]
+        receiver.set_delay(delay, units)
+        self.streams[channel] = self.stream_class(media_socket, receiver, only_mp2ts=only_mp2ts)
+
+    def remove_stream(self, channel: int) -> dict[str, int]:
+        """Flush the receiver of a stream, close its output and return its statistics."""
+        stream = self.streams.pop(channel)
+        try:
+            stream.close()
+        finally:
+            stream.receiver.output.close()
+        return self.get_stream_statistics(stream)
+
+    def get_statistics(self) -> dict[int, dict[str, int]]:
+        """Return the statistics of the streams."""
+        return {ch: self.get_stream_statistics(stream) for ch, stream in self.streams.items()}
+
+    def stop(self) -> None:
+        """Stop the worker (the streams are removed)."""
+        self.running = False
+
+    @staticmethod
+    def get_stream_statistics(stream: FecStream) -> dict[str, int]:
+        """Return the statistics of a stream."""
+        receiver = stream.receiver
+        statistics = {name: getattr(receiver, name, 0) for name in STATISTICS}
+        statistics['invalid'] = stream.invalid
+        return statistics
+
+
+def run_worker(worker_class: type[FecWorker], ring_name: str, connection: Connection) -> None:
+    """Entry point of a worker process."""
+    ring = SharedRing(ring_name, create=False)
+    try:
+        worker_class(ring, connection).run()
+    finally:
+        ring.close()
+        connection.close()
+
+
+# Manager (parent process) -------------------------------------------------------------------------
+
+
+class ShardedDatagramProtocol(asyncio.DatagramProtocol):
+    """Hand the datagrams received on one of the sockets of a stream over to its worker."""
+
+    def __init__(self, stream: ShardedStream, kind: str) -> None:
+        self.stream = stream
+        self.channel = stream.channel << 2 | KINDS.index(kind)
+
+    def datagram_received(self, data: bytes, addr: tuple[str | Any, int]) -> None:
+        self.stream.put(self.channel, data)
+
+    def error_received(self, exc: Exception) -> None:
+        log.warning('Stream %s socket error: %s', self.stream.media_socket, exc)
+
+
+class ShardedStream(StreamSocketsMixin):
+    """
+    A stream (media + FEC column and row sockets) handled by a worker.
+
+    Datagrams too large for a slot (``self.invalid``) and dropped because the ring of the worker
+    was full (``self.dropped``) are counted.
+    """
+
+    def __init__(self, media_socket: str, channel: int, worker: int, ring: SharedRing) -> None:
+        self.media_socket = media_socket
+        self.channel = channel
+        self.worker = worker
+        self.ring = ring
+        self.invalid = 0
+        self.dropped = 0
+        self.transports: list[asyncio.DatagramTransport] = []
+
+    def put(self, channel: int, data: bytes) -> None:
+        """Copy a datagram into the ring of the worker."""
+        try:
+            if not self.ring.put(data, channel):
+                self.dropped += 1
+        except ValueError as exc:
+            self.invalid += 1
+            log.debug('Stream %s, dropped invalid packet: %s', self.media_socket, exc)
+
+    def close(self) -> None:
+        """Close the sockets."""
+        for transport in self.transports:
+            transport.close()
+        self.transports.clear()
+
+
+class Worker(NamedTuple):
+    """A worker process, the pipe to send it commands (and its lock) and its ring."""
+
+    process: multiprocessing.process.BaseProcess
+    connection: Connection
+    lock: threading.Lock
+    ring: SharedRing
+
+
+class FecReceiverManager:
+    """
+    Receive any amount of SMPTE 2022-1 FEC streams with a pool of worker processes.
+
+    The streams are assigned to the workers by hashing their media socket (see
+    :meth:`get_worker`), the recovered streams are written into files by the workers.
+
+    A command sent to a worker that is gone raises a :class:`RuntimeError`, see
+    :meth:`get_dead_workers` to check the workers. So does a command not answered within
+    `request_timeout`, the worker is then killed (a late answer would be taken as the answer of
+    the next command).
+
+    A command waits for the worker to process the datagrams already in its ring, the coroutines
+    (e.g. :meth:`get_statistics_async`) are waiting for the answer in a thread, without blocking the
+    event loop.
+
+    **Example usage**
+
+    >>> import asyncio
+    >>> import socket
+    >>> import tempfile
+    >>> from pathlib import Path
+    >>> from pytoolbox.network.rtp import RtpPacket
+    >>> from pytoolbox.network.smpte2022.generator import FecGenerator
+    >>>
+    >>> def received(statistics):
+    ...     return sum(
+    ...         counters['media_received'] + counters['col_received'] + counters['row_received']
+    ...         for counters in statistics.values())
+    >>>
+    >>> async def main(directory):
+    ...     async with FecReceiverManager(2) as manager:
+    ...         sockets = ('127.0.0.1:0', '127.0.0.2:0', '127.0.0.3:0')  # Bound to free ports
+    ...         streams = [
+    ...             await manager.add_stream(media_socket, directory / f'{i}.ts')
+    ...             for i, media_socket in enumerate(sockets)
+    ...         ]
+    ...         sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ...         sent = []
+    ...
+    ...         def send(stream, kind, packet):
+    ...             sender.sendto(packet.bytes, stream.bound_addresses[kind])
+    ...             sent.append(kind)
+    ...
+    ...         def create_generator(stream):
+    ...             generator = FecGenerator(4, 5)
+    ...             generator.on_reset = lambda media: None
+    ...             generator.on_new_col = lambda col: send(stream, 'col', RtpPacket.create(
+    ...                 col.sequence, 0, RtpPacket.DYNAMIC_PT, col.bytes))
+    ...             generator.on_new_row = lambda row: send(stream, 'row', RtpPacket.create(
+    ...                 row.sequence, 0, RtpPacket.DYNAMIC_PT, row.bytes))
+    ...             return generator
+    ...
+    ...         generators = [create_generator(stream) for stream in streams]
+    ...         for i in range(40):
+    ...             for stream, generator in zip(streams, generators):
+    ...                 payload = bytearray([i] * 188)
+    ...                 media = RtpPacket.create(1000 + i, i * 900, RtpPacket.MP2T_PT, payload)
+    ...                 if i % 7:  # Simulate some losses
+    ...                     send(stream, 'media', media)
+    ...                 generator.put_media(media)
+    ...             # Wait for the packets to be received by the workers
+    ...             while received(statistics := await manager.get_statistics_async()) < len(sent):
+    ...                 pass
+    ...         sender.close()
+    ...     return statistics, manager.get_totals(statistics)
+    >>>
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     statistics, totals = asyncio.run(main(Path(directory)))
+    ...     data = [(Path(directory) / f'{i}.ts').read_bytes() for i in range(3)]
+    >>> sorted(statistics)
+    ['127.0.0.1:0', '127.0.0.2:0', '127.0.0.3:0']
+    >>> statistics['127.0.0.1:0']['media_recovered']
+    6
+    >>> totals['media_received'], totals['media_recovered'], totals['media_missing']
+    (102, 18, 0)
+    >>> data == [b''.join(bytes([i] * 188) for i in range(40))] * 3
+    True
+    """
+
+    protocol_class: type[ShardedDatagramProtocol] = ShardedDatagramProtocol
+    ring_class: type[SharedRing] = SharedRing
+    stream_class: type[ShardedStream] = ShardedStream
+    worker_class: type[FecWorker] = FecWorker
+
+    # Seconds to wait for a worker to answer a command before killing it
+    request_timeout: float = 60.0
+    # Seconds to wait for a worker to stop before killing it
+    stop_timeout: float = 5.0
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        *,
+        ring_slots: int = 8192,
+        slot_size: int = 1536,
+        start_method: str = 'spawn',
+    ) -> None:
+        """
+        Construct a FecReceiverManager, see :meth:`start` to start the workers.
+
+        :param workers: Amount of worker processes, defaults to the amount of CPUs.
+        :param ring_slots: Amount of datagrams that can be waiting for a worker.
+        :param slot_size: Size of a slot of the rings, see :class:`SharedRing`.
+        :param start_method: How to start the workers, see :mod:`multiprocessing`.
+        """
+        self.workers_count = workers or os.cpu_count() or 1
+        self.ring_slots = ring_slots
+        self.slot_size = slot_size
+        self.context = multiprocessing.get_context(start_method)
+        self.streams: dict[str, ShardedStream] = {}
+        self.workers: list[Worker] = []
+        self._channels = itertools.count()
+
+    async def __aenter__(self) -> FecReceiverManager:
+        self.start()
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        for media_socket in list(self.streams):
+            try:
+                await self.remove_stream_async(media_socket)
+            except RuntimeError as exc:
+                log.warning('Unable to remove stream %s: %s', media_socket, exc)
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def start(self) -> None:
+        """Start the worker processes."""
+        if self.workers:
+            raise ValueError('Workers are already started')
+        for index in range(self.workers_count):
+            ring = self.ring_class(slots=self.ring_slots, slot_size=self.slot_size)
+            connection, child_connection = self.context.Pipe()
+            process = self.context.Process(  # type: ignore[attr-defined]
+                target=run_worker,
+                args=(self.worker_class, ring.name, child_connection),
+                name=f'{self.__class__.__name__}-{index}',
+                daemon=True,
+            )
+            process.start()
+            child_connection.close()
+            self.workers.append(Worker(process, connection, threading.Lock(), ring))
+
+    async def add_stream(
+        self,
+        media_socket: str,
+        output: Path | str,
+        *,
+        delay: float = 100,
+        units: int = FecReceiver.PACKETS,
+        only_mp2ts: bool = True,
+    ) -> ShardedStream:
+        """
+        Let a worker start receiving a stream then bind the sockets of the stream.
+
+        :param media_socket: Media socket, e.g. ``239.232.0.222:5004`` (multicast groups are
+            joined), see :class:`StreamSocketsMixin` for the port 0.
+        :param output: Path of the file where the worker writes the recovered stream.
+        :param delay: Delay of the receiver, see :meth:`FecReceiver.set_delay`.
+        :param units: Units of the delay, see :meth:`FecReceiver.set_delay`.
+        :param only_mp2ts: Accept only RTP packets with a MPEG2-TS payload.
+        """
+        if media_socket in self.streams:
+            raise ValueError(f'Stream {media_socket} is already registered')
+        index = self.get_worker(media_socket)
+        channel = next(self._channels)
+        await self.request_async(
+            index, 'add_stream', channel, media_socket, str(output), delay, units, only_mp2ts
+        )
+        stream = self.stream_class(media_socket, channel, index, self.workers[index].ring)
+        self.streams[media_socket] = stream
+        loop = asyncio.get_running_loop()
+        try:
+            for kind, address in stream.addresses.items():
+                transport, _ = await loop.create_datagram_endpoint(
+                    self.get_protocol_factory(stream, kind),
+                    sock=FecReceiverService.create_socket(address),
+                )
+                stream.transports.append(transport)  # type: ignore[arg-type]
+        except Exception:
+            await self.remove_stream_async(media_socket)
+            raise
+        return stream
+
+    def remove_stream(self, media_socket: str) -> dict[str, int]:
+        """Close the sockets of a stream, let its worker flush it and return its statistics."""
+        stream = self.streams.pop(media_socket)
+        stream.close()
+        statistics = self.request(stream.worker, 'remove_stream', stream.channel)
+        return self.merge_statistics(stream, statistics)
+
+    async def remove_stream_async(self, media_socket: str) -> dict[str, int]:
+        """Asynchronous version of :meth:`remove_stream`."""
+        stream = self.streams.pop(media_socket)
+        stream.close()
+        statistics = await self.request_async(stream.worker, 'remove_stream', stream.channel)
+        return self.merge_statistics(stream, statistics)
+
+    def get_statistics(self) -> dict[str, dict[str, int]]:
+        """Return the statistics of the streams (by media socket)."""
+        return self._merge_worker_statistics(
+            [self.request(index, 'get_statistics') for index in range(len(self.workers))]
+        )
+
+    async def get_statistics_async(self) -> dict[str, dict[str, int]]:
+        """Asynchronous version of :meth:`get_statistics`, the workers are requested together."""
+        return self._merge_worker_statistics(
+            await asyncio.gather(
+                *(self.request_async(index, 'get_statistics') for index in range(len(self.workers)))
+            )
+        )
+
+    def get_totals(self, statistics: dict[str, dict[str, int]] | None = None) -> dict[str, int]:
+        """Return the statistics aggregated over all streams."""
+        return aggregate((statistics or self.get_statistics()).values())
+
+    def get_dead_workers(self) -> list[int]:
+        """Return the index of the worker processes that are gone."""
+        return [i for i, worker in enumerate(self.workers) if not worker.process.is_alive()]
+
+    def close(self) -> None:
+        """Remove all streams and stop the workers."""
+        for media_socket in list(self.streams):
+            try:
+                self.remove_stream(media_socket)
+            except RuntimeError as exc:
+                log.warning('Unable to remove stream %s: %s', media_socket, exc)
+        for worker in self.workers:
+            try:
+                with worker.lock:
+                    worker.connection.send(('stop', ()))
+                    if worker.connection.poll(self.stop_timeout):
+                        worker.connection.recv()
+            except (EOFError, OSError) as exc:
+                log.warning('Unable to stop worker %s: %s', worker.process.name, exc)
+            worker.process.join(self.stop_timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.connection.close()
+            worker.ring.close()
+            worker.ring.unlink()
+        self.workers.clear()
+
+    def request(self, index: int, method: str, *args: Any) -> Any:
+        """Execute a command in a worker and return its result (raise its exception if any)."""
+        process, connection, lock, _ = self.workers[index]
+        with lock:
+            try:
+                if not process.is_alive():
+                    raise EOFError
+                connection.send((method, args))
+                answered = connection.poll(self.request_timeout)
+                result = connection.recv() if answered else None
+            except (EOFError, OSError) as exc:
+                raise RuntimeError(
+                    f'Worker {process.name} is gone (exit code {process.exitcode})'
+                ) from exc
+            if not answered:
+                process.kill()
+                raise RuntimeError(
+                    f'Worker {process.name} did not answer {method!r} within '
+                    f'{self.request_timeout} seconds, killed'
+                )
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def request_async(self, index: int, method: str, *args: Any) -> Any:
+        """Asynchronous version of :meth:`request`, the answer is waited for in a thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.request, index, method, *args)
+        )
+
+    def get_protocol_factory(
+        self, stream: ShardedStream, kind: str
+    ) -> Callable[[], ShardedDatagramProtocol]:
+        """Return a factory of protocol instances for the `kind` socket of `stream`."""
+        return lambda: self.protocol_class(stream, kind)
+
+    def get_worker(self, media_socket: str) -> int:
+        """Return the index of the worker in charge of a stream (stable hash of media socket)."""
+        return zlib.crc32(media_socket.encode('utf-8')) % len(self.workers)
+
+    def _merge_worker_statistics(
+        self, statistics: Iterable[dict[int, dict[str, int]]]
+    ) -> dict[str, dict[str, int]]:
+        """Return the statistics of the streams (by media socket) from the workers statistics."""
+        merged: dict[str, dict[str, int]] = {}
+        for by_channel in statistics:
+            for media_socket, stream in self.streams.items():
+                if stream.channel in by_channel:
+                    merged[media_socket] = self.merge_statistics(stream, by_channel[stream.channel])
+        return merged
+
+    @staticmethod
+    def merge_statistics(stream: ShardedStream, statistics: dict[str, int]) -> dict[str, int]:
+        """Add the counters kept by the parent process to the statistics of a stream."""
+        statistics['invalid'] += stream.invalid
+        statistics['dropped'] = stream.dropped
+        return statistics
@@ -7,11 +7,15 @@ from __future__ import annotations
 import collections
 import io
 import os
+from collections.abc import MutableMapping
 
 from pytoolbox.network.ip import IPSocket
 from pytoolbox.network.rtp import RtpPacket
 
 from .base import FecPacket
+from .storage import SequenceRing
+from .writer import PayloadWriter
+from .xor import xor_many_inplace
 
 __all__ = ['FecReceiver']
 
@@ -107,6 +111,7 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
             1       0           0       0
     Current position (media sequence) : 0
     Current delay (can be set) : 20 packets
+    Output latency (min/avg/max) : 0.000/0.000/0.000 seconds
     FEC matrix size (LxD) : 4x5 = 20 packets
     >>> receiver.flush()
 
@@ -131,12 +136,6 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
     )
     ER_ROW_MISMATCH = 'Row FEC packet n°{0}, expected n°{1}'
     ER_ROW_OVERWRITE = 'Another row FEC packet is already registered to protect media packet n°{0}'
-    ER_GET_COL_CASCADE = (
-        'Column FEC cascade : Unable to compute sequence # of the media packet to recover{0}{1}{0}'
-    )
-    ER_GET_ROW_CASCADE = (
-        'Row FEC cascade : Unable to compute sequence # of the media packet to recover{0}{1}{0}'
-    )
     ER_NULL_COL_CASCADE = 'Column FEC cascade : Unable to find linked entry in crosses buffer'
     ER_NULL_ROW_CASCADE = 'Row FEC cascade : Unable to find linked entry in crosses buffer'
     ER_STARTUP = 'Current position still not initialized (startup state)'
@@ -147,6 +146,12 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
     DELAY_RANGE = range(len(DELAY_NAMES))  # noqa
     PACKETS, SECONDS = DELAY_RANGE
 
+    # Storage of the media packets and crosses buffers (indexed by media sequence number)
+    storage_class: type[MutableMapping] = SequenceRing
+
+    # Output stage collecting the payloads of the media packets and writing them by batches
+    writer_class: type[PayloadWriter] = PayloadWriter
+
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Constructors >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
     def __init__(self, output: io.StringIO) -> None:
@@ -171,12 +176,15 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
         if not output:
             raise ValueError('output is None')
         # Media packets storage, medias[media seq] = media pkt
-        self.medias: dict[int, RtpPacket] = {}
+        self.medias: MutableMapping[int, RtpPacket] = self.storage_class()
         self.startup = True  # Indicate that actual position must be initialized
         self.flushing = False  # Indicate that a flush operation is actually running
         self.position = 0  # Actual position (sequence number) in the medias buffer
         # Link media packets to fec packets able to recover it, crosses[mediaseq] = {colseq, rowseq}
-        self.crosses: dict[int, dict[str, int | None]] = {}
+        self.crosses: MutableMapping[int, dict[str, int | None]] = self.storage_class()
+        # Media sequences of the crosses in order of creation (their expiry order, see cleanup)
+        self._crosses_order: collections.deque[int] = collections.deque()
+        self._spare_crosses: list[dict[str, int | None]] = []  # Removed crosses, to reuse
         # Fec packets + related information storage, col[sequence] = { fec pkt + info }
         self.cols: dict[int, FecPacket] = {}
         self.rows: dict[int, FecPacket] = {}
@@ -184,15 +192,22 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
         self.matrixD = 0  # Detected FEC matrix size (number of rows)    pylint:disable=invalid-name
         # Output
         self.output = output  # Registered output
+        # Writes the payloads to output by batches (then recycles them if a payload pool is set)
+        self.writer = self.writer_class(output, pool=RtpPacket.payload_pool)
         # Settings
-        self.delay_value = 100  # RTP buffer delay value
+        self.delay_value: float = 100  # RTP buffer delay value
         self.delay_units = self.PACKETS  # RTP buffer delay units
+        # Time reference (RTP timestamps)
+        self.head: int | None = None  # Oldest media sequence received while in startup state
+        self.newest_timestamp: int | None = None  # Timestamp of the most recent media packet
+        self.clock_rate = 1  # Clock rate of the media packets timestamps
         # Statistics about media (buffers and packets)
         self.media_received = 0  # Received media packets counter
         self.media_recovered = 0  # Recovered media packets counter
         self.media_aborted_recovery = 0  # Aborted media packet recovery counter
         self.media_overwritten = 0  # Overwritten media packets counter
         self.media_missing = 0  # Missing media packets counter
+        self.media_late = 0  # Media packets received after their position was output counter
         self.max_media = 0  # Largest amount of stored elements in the medias buffer
         # Statistics about fec (buffers and packets)
         self.col_received = 0  # Received column fec packets counter
@@ -206,32 +221,123 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
             int
         )  # Statistics about lost medias
         self.lostogram_counter = 0  # Incremented while there are lost media packets
+        # Statistics about latency (age of the media packets when output, in seconds)
+        self.latency_count = 0  # Output media packets counter
+        self.latency_min = 0.0  # Lowest latency
+        self.latency_max = 0.0  # Highest latency
+        self.latency_total = 0.0  # Sum of the latencies (to compute the average)
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Properties >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
     @property
-    def current_delay(self) -> int:
-        """Return current delay based on the length of the media buffer."""
+    def current_delay(self) -> float:
+        """
+        Return current delay based on the length of the media buffer (packets) or on the time
+        elapsed between the next media packet to output and the most recent one (seconds).
+        """
         if len(self.medias) == 0:
             return 0
         if self.delay_units == self.PACKETS:
             return len(self.medias)
         if self.delay_units == self.SECONDS:
-            raise NotImplementedError()
+            return self.elapsed(self.next_media().timestamp)
+        raise ValueError(self.ER_DELAY_UNITS.format(self.delay_units))
+
+    @property
+    def delay_packets(self) -> int:
+        """
+        Return the delay converted to an amount of media packets.
+
+        In seconds this is estimated based on the buffered media packets (at least a FEC matrix).
+        """
+        if self.delay_units == self.PACKETS:
+            return int(self.delay_value)
+        if self.delay_units == self.SECONDS:
+            return max(len(self.medias), self.matrixL * self.matrixD)
         raise ValueError(self.ER_DELAY_UNITS.format(self.delay_units))
-        # return medias.lastEntry().getValue().getTime() - medias.firstEntry().getValue().getTime()
 
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< Functions >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
 
-    def set_delay(self, value: int, units: int) -> None:
-        """Set desired size for the internal media buffer."""
-        if units == self.PACKETS:
-            self.delay_value = value
-            self.delay_units = units
-        elif units == self.SECONDS:
-            raise NotImplementedError()
-        else:
+    def set_delay(self, value: float, units: int) -> None:
+        r"""
+        Set desired size for the internal media buffer.
+
+        In seconds, the media packets are output when they are older than `value` compared to the
+        most recent media packet (based on the RTP timestamps, so whatever the bitrate).
+
+        **Example usage**
+
+        >>> import io
+        >>>
+        >>> output = io.BytesIO()
+        >>> receiver = FecReceiver(output)
+        >>> receiver.set_delay(0.1, FecReceiver.SECONDS)
+        >>>
+        >>> # One media packet every 10 ms, sequence numbers and timestamps are wrapping around
+        >>> for i in range(100):
+        ...     timestamp = (RtpPacket.TS_MASK - 9000 + i * 900) & RtpPacket.TS_MASK
+        ...     sequence = (RtpPacket.S_MASK - 50 + i) & RtpPacket.S_MASK
+        ...     payload = bytearray([i])
+        ...     receiver.put_media(RtpPacket.create(sequence, timestamp, 33, payload), True)
+        >>> len(receiver.medias), receiver.current_delay, receiver.position
+        (11, 0.1, 37)
+        >>> receiver.writer.written, receiver.writer.pending, output.getvalue()[:3]
+        (64, 25, b'\x00\x01\x02')
+        >>> receiver.latency_min, receiver.latency_max
+        (0.11, 0.11)
+        >>> receiver.set_delay(1, 42)
+        Traceback (most recent call last):
+            ...
+        ValueError: Unknown delay units '42'
+        """
+        if units not in self.DELAY_RANGE:
             raise ValueError(self.ER_DELAY_UNITS.format(units))
+        self.delay_value = value
+        self.delay_units = units
+
+    def elapsed(self, timestamp: int) -> float:
+        """
+        Return the time elapsed (in seconds) between `timestamp` and the most recent media packet.
+
+        This method is timestamps wrap-around aware and returns 0 for a more recent timestamp.
+        """
+        if self.newest_timestamp is None:
+            return 0
+        delta = (self.newest_timestamp - timestamp) & RtpPacket.TS_MASK
+        return 0 if delta > RtpPacket.TS_MASK >> 1 else delta / self.clock_rate
+
+    def next_media(self) -> RtpPacket:
+        """Return the next media packet to output (skipping missing media packets)."""
+        sequence = self.head if self.startup else (self.position + 1) & RtpPacket.S_MASK
+        assert sequence is not None
+        if (media := self.medias.get(sequence)) is not None:
+            return media
+        if not self.medias:
+            raise ValueError('Media buffer is empty')
+        # The closest following media packet (wrapping around), proportional to the stored packets
+        return self.medias[min(self.medias, key=lambda s: (s - sequence) & RtpPacket.S_MASK)]
+
+    def store_media(self, media: RtpPacket) -> None:
+        """Put a media packet into the medias buffer and update the time reference."""
+        if media.sequence in self.medias:
+            self.media_overwritten += 1
+        self.medias[media.sequence] = media
+        self.max_media = max(self.max_media, len(self.medias))
+
+        # Track the oldest media packet until the current position is initialized
+        if self.startup and (
+            self.head is None or (media.sequence - self.head) & RtpPacket.S_MASK > 0x8000
+        ):
+            self.head = media.sequence
+
+        # Track the most recent media packet (recovered packets are usually older)
+        if (
+            self.newest_timestamp is None
+            or (media.timestamp - self.newest_timestamp) & RtpPacket.TS_MASK
+            <= RtpPacket.TS_MASK >> 1
+        ):
+            self.newest_timestamp = media.timestamp
+            self.clock_rate = media.clock_rate
 
     def put_media(self, media: RtpPacket, onlyMP2TS: bool) -> None:  # noqa: N803
         """Put an incoming media packet."""
@@ -243,11 +349,13 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
         elif not media.valid:
             raise ValueError(self.ER_VALID_RTP)
 
+        # Drop the media packet if it arrives too late (its position was already output)
+        if not self.startup and (self.position - media.sequence) & RtpPacket.S_MASK < 0x8000:
+            self.media_late += 1
+            return
+
         # Put the media packet into medias buffer
-        if media.sequence in self.medias:
-            self.media_overwritten += 1
-        self.medias[media.sequence] = media
-        self.max_media = max(self.max_media, len(self.medias))
+        self.store_media(media)
         self.media_received += 1
 
         if cross := self.crosses.get(media.sequence):
@@ -266,6 +374,9 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
         1. The fec packet is useless if none of the protected media packets is missing
         2. Only on media packet missing, fec packet is able to recover it now !
         3. More than one media packet is missing, fec packet stored for future recovery
+
+        The receiver takes the ownership of the FEC packet, it is released (see
+        :meth:`FecPacket.release`) once useless.
         """
         if self.flushing:
             raise ValueError(self.ER_FLUSHING)
@@ -290,18 +401,16 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
                 media_lost = media_test
                 # TODO
                 if not (cross := self.crosses.get(media_test)):
-                    cross = {'col_sequence': None, 'row_sequence': None}
-                    self.crosses[media_test] = cross
-                    self.max_cross = max(self.max_cross, len(self.crosses))
+                    cross = self._add_cross(media_test)
 
                 # Register the fec packet able to recover the missing media packet
                 if fec.direction == FecPacket.COL:
-                    if cross['col_sequence']:
+                    if cross['col_sequence'] is not None:
                         raise ValueError(self.ER_COL_OVERWRITE.format(media_lost))
                     cross['col_sequence'] = fec.sequence
 
                 elif fec.direction == FecPacket.ROW:
-                    if cross['row_sequence']:
+                    if cross['row_sequence'] is not None:
                         raise ValueError(self.ER_ROW_OVERWRITE.format(media_lost))
                     cross['row_sequence'] = fec.sequence
 
@@ -320,19 +429,22 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
 
         # [1] The fec packet is useless if none of the protected media packets is missing
         if len(fec.missing) == 0:
+            fec.release()
             return
 
-        # FIXME check if 10 * delay_value is a good way to avoid removing early fec packets !
+        # FIXME check if 10 * delay_packets is a good way to avoid removing early fec packets !
         # The fec packet is useless if it needs an already output'ed media packet to do recovery
-        drop = not self.validity_window(
+        # (nothing was output'ed while in startup state)
+        drop = not self.startup and not self.validity_window(
             fec.snbase,
             self.position,
-            (self.position + 10 * self.delay_value) & RtpPacket.S_MASK,
+            (self.position + 10 * self.delay_packets) & RtpPacket.S_MASK,
         )
 
         if fec.direction == FecPacket.COL:
             if drop:
                 self.col_dropped += 1
+                fec.release()
                 return
             self.cols[fec.sequence] = fec
             self.max_col = max(self.max_col, len(self.cols))
@@ -340,6 +452,7 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
         if fec.direction == FecPacket.ROW:
             if drop:
                 self.row_dropped += 1
+                fec.release()
                 return
             self.rows[fec.sequence] = fec
             self.max_row = max(self.max_row, len(self.rows))
@@ -356,7 +469,7 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
         try:
             self.flushing = True
             self.out()
-            self.output.flush()
+            self.writer.flush()
         finally:
             self.flushing = False
 
@@ -368,21 +481,28 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
         if self.startup:
             raise ValueError(self.ER_STARTUP)
 
-        if self.delay_units == self.PACKETS:
-            start, end = self.position, (self.position + self.delay_value) & RtpPacket.S_MASK
-            for media_sequence, cross in list(self.crosses.items()):
-                if not self.validity_window(media_sequence, start, end):
-                    if (col_seq := cross['col_sequence']) is not None:
-                        del self.cols[col_seq]
-                    if (row_seq := cross['row_sequence']) is not None:
-                        del self.rows[row_seq]
-                    del self.crosses[media_sequence]
-        elif self.delay_units == self.SECONDS:
-            raise NotImplementedError()
+        # The crosses are expired from the oldest, up to the first one still in the window
+        start, end = self.position, (self.position + self.delay_packets) & RtpPacket.S_MASK
+        order = self._crosses_order
+        while order:
+            media_sequence = order[0]
+            if (cross := self.crosses.get(media_sequence)) is not None:
+                if self.validity_window(media_sequence, start, end):
+                    break
+                if (col_seq := cross['col_sequence']) is not None:
+                    self.remove_fec(self.cols, col_seq)
+                if (row_seq := cross['row_sequence']) is not None:
+                    self.remove_fec(self.rows, row_seq)
+                self._remove_cross(media_sequence, cross)
+            order.popleft()
 
-        raise ValueError(self.ER_DELAY_UNITS.format(self.delay_units))
+    @staticmethod
+    def remove_fec(fecs: dict[int, FecPacket], sequence: int) -> None:
+        """Remove a FEC packet (if stored) from `fecs` and release it."""
+        if (fec := fecs.pop(sequence, None)) is not None:
+            fec.release()
 
-    def recover_media_packet(  # pylint:disable=too-many-branches,too-many-statements
+    def recover_media_packet(
         self,
         media_sequence: int,
         cross: dict[str, int | None],
@@ -391,11 +511,53 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
         """
         Recover a missing media packet helped by a FEC packet, this method is also called to
         register an incoming media packet if it is registered as missing.
+
+        The recovery may cascade: FEC packets protecting the recovered media packet may now have
+        only one missing media packet left and so be able to recover it. The cascade is processed
+        iteratively with a work-queue (whatever the length of the loss burst).
         """
+        queue: collections.deque[tuple[int, dict[str, int | None], FecPacket | None]]
+        queue = collections.deque([(media_sequence, cross, fec)])
+        while queue:
+            media_sequence, cross, fec = queue.popleft()
+            for cascade_fec in self._recover_media_packet(media_sequence, cross, fec):
+                # > Cascade ! Stale events are skipped (e.g. media packet recovered by a FEC
+                #   packet of the other direction in the meantime).
+                if len(cascade_fec.missing) != 1:
+                    continue
+                if (cascade_cross := self.crosses.get(cascade_fec.missing[0])) is None:
+                    error = (
+                        self.ER_NULL_COL_CASCADE
+                        if cascade_fec.direction == FecPacket.COL
+                        else self.ER_NULL_ROW_CASCADE
+                    )
+                    raise NotImplementedError(
+                        f'{error}{os.linesep}'
+                        f'recover_media_packet({media_sequence}, {cross}, {fec}):{os.linesep}'
+                        f'media sequence : {cascade_fec.missing[0]}{os.linesep}'
+                        f'{cascade_fec}{os.linesep}',
+                    )
+                queue.append((cascade_fec.missing[0], cascade_cross, cascade_fec))
+
+    def _recover_media_packet(
+        self,
+        media_sequence: int,
+        cross: dict[str, int | None],
+        fec: FecPacket | None,
+    ) -> list[FecPacket]:
+        """Recover a missing media packet and return the FEC packets now able to recover one."""
+        if fec is not None:
+            # The FEC packet may be outdated since the event was queued
+            if self.crosses.get(media_sequence) is not cross:
+                return []
+            stored = self.cols if fec.direction == FecPacket.COL else self.rows
+            if stored.get(fec.sequence) is not fec:
+                return []
+
         # Read and remove "cross" it from the buffer
         col_sequence = cross['col_sequence']
         row_sequence = cross['row_sequence']
-        del self.crosses[media_sequence]
+        self._remove_cross(media_sequence, cross)
 
         # Recover the missing media packet and remove any useless linked fec packet
         if fec is not None:
@@ -409,131 +571,137 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
                 raise NotImplementedError(self.ER_ROW_MISMATCH.format(fec.sequence, row_sequence))
 
             # Media packet recovery
-            # > Copy fec packet fields into the media packet
-            media = RtpPacket.create(
-                media_sequence,
-                fec.timestamp_recovery,
-                fec.payload_type_recovery,
-                fec.payload_recovery,
-            )
-            payload_size = fec.length_recovery
-
-            # > recovered payload ^= all media packets linked to the fec packet
-            aborted = False
+            # > Gather the friend media packets, unable to recover the media packet if any of them
+            #   is missing
+            friends = []
             media_max = (fec.snbase + fec.na * fec.offset) & RtpPacket.S_MASK
             media_test = fec.snbase
             while media_test != media_max:
-                if media_test == media_sequence:
-                    media_test = (media_test + fec.offset) & RtpPacket.S_MASK
-                    continue
-                # Unable to recover the media packet if any of the friend media packets is missing
-                if not (friend := self.medias[media_test]):
-                    self.media_aborted_recovery += 1
-                    aborted = True
-                    break
-                media.payload_type ^= friend.payload_type
-                media.timestamp ^= friend.timestamp
-                payload_size ^= friend.payload_size
-                # TODO Optimize this
-                for index in range(min(len(media.payload), len(friend.payload))):
-                    media.payload[index] ^= friend.payload[index]
+                if media_test != media_sequence:
+                    if (friend := self.medias.get(media_test)) is None:
+                        self.media_aborted_recovery += 1
+                        break
+                    friends.append(friend)
                 media_test = (media_test + fec.offset) & RtpPacket.S_MASK
 
             # If the media packet is successfully recovered
-            if not aborted:
-                media.payload = media.payload[0:payload_size]
+            else:
+                # > Copy fec packet fields into the media packet
+                payload = RtpPacket.acquire_payload(len(fec.payload_recovery), zero=False)
+                payload[:] = fec.payload_recovery
+                media = RtpPacket.create(
+                    media_sequence,
+                    fec.timestamp_recovery,
+                    fec.payload_type_recovery,
+                    payload,
+                )
+                payload_size = fec.length_recovery
+
+                # > recovered fields ^= all media packets linked to the fec packet
+                for friend in friends:
+                    media.payload_type ^= friend.payload_type
+                    media.timestamp ^= friend.timestamp
+                    payload_size ^= friend.payload_size
+                xor_many_inplace(payload, [friend.payload for friend in friends])
+                del payload[payload_size:]
+
                 self.media_recovered += 1
-                if media.sequence in self.medias:
-                    self.media_overwritten += 1
-                self.medias[media.sequence] = media
-                self.max_media = max(self.max_media, len(self.medias))
-                if fec.direction == FecPacket.COL:
-                    del self.cols[fec.sequence]
-                else:
-                    del self.rows[fec.sequence]
+                self.store_media(media)
+                self.remove_fec(
+                    self.cols if fec.direction == FecPacket.COL else self.rows, fec.sequence
+                )
 
         # Check if a cascade effect happens ...
-        fec_col = self.cols.get(col_sequence) if col_sequence else None
-        fec_row = self.rows.get(row_sequence) if row_sequence else None
-
-        if fec_col:
-            fec_col.set_recovered(media_sequence)
-        if fec_row:
-            fec_row.set_recovered(media_sequence)
-
-        if fec_col:
-            if len(fec_col.missing) == 1:
-                # Cascade !
-                if cascade_media_sequence := fec_col.missing[0]:
-                    if cascade_cross := self.crosses.get(cascade_media_sequence):
-                        self.recover_media_packet(cascade_media_sequence, cascade_cross, fec_col)
-                    else:
-                        raise NotImplementedError(
-                            f'recover_media_packet({media_sequence}, {cross}, {fec}):{os.linesep}'
-                            f'{self.ER_NULL_COL_CASCADE}{os.linesep}'
-                            f'media sequence : {cascade_media_sequence}{os.linesep}'
-                            f'{fec_col}{os.linesep}',
-                        )
-                else:
-                    raise NotImplementedError(self.ER_GET_COL_CASCADE.format(os.linesep, fec_col))
-
-        if fec_row:
-            if len(fec_row.missing) == 1:
-                # Cascade !
-                if cascade_media_sequence := fec_row.missing[0]:
-                    if cascade_cross := self.crosses.get(cascade_media_sequence):
-                        self.recover_media_packet(cascade_media_sequence, cascade_cross, fec_row)
-                    else:
-                        raise NotImplementedError(
-                            f'{self.ER_NULL_ROW_CASCADE}{os.linesep}'
-                            f'recover_media_packet({media_sequence}, {cross}, {fec}):{os.linesep}'
-                            f'media sequence : {cascade_media_sequence}{os.linesep}'
-                            f'{fec_row}{os.linesep}',
-                        )
-                else:
-                    raise NotImplementedError(self.ER_GET_ROW_CASCADE.format(os.linesep, fec_row))
+        cascades = []
+        for sequence, fecs in ((col_sequence, self.cols), (row_sequence, self.rows)):
+            if sequence is not None and (linked := fecs.get(sequence)) is not None:
+                linked.set_recovered(media_sequence)
+                if len(linked.missing) == 1:
+                    cascades.append(linked)
+        return cascades
 
     def out(self) -> None:
         """Extract packets to output in order to keep a 'certain' amount of them in the buffer."""
         units = self.PACKETS if self.flushing else self.delay_units
         value = 0 if self.flushing else self.delay_value
-        lostogram_counter = 0
 
         # Extract packets to output in order to keep a 'certain' amount of them in the buffer
         if units == self.PACKETS:  # based on buffer size
             while len(self.medias) > value:
-                # Initialize or increment actual position (expected sequence number)
-                if self.startup:
-                    self.position = min(self.medias.keys()) & RtpPacket.S_MASK
-                else:
-                    self.position = (self.position + 1) & RtpPacket.S_MASK
-
-                self.startup = False
-
-                if media := self.medias.get(self.position):
-                    self.lostogram[lostogram_counter] += 1
-                    lostogram_counter = 0
-                    del self.medias[media.sequence]
-                    if self.output:
-                        self.output.write(media.payload)  # type: ignore[arg-type]
-                else:
-                    self.media_missing += 1
-                    lostogram_counter += 1
+                self.out_next()
 
-                # Remove any fec packet linked to current media packet
-                if cross := self.crosses.get(self.position):
-                    del self.crosses[self.position]
-                    if cross['col_sequence'] and cross['col_sequence'] in self.cols:
-                        del self.cols[cross['col_sequence']]
-                    if cross['row_sequence'] and cross['row_sequence'] in self.rows:
-                        del self.rows[cross['row_sequence']]
-
-        # Extract packets to output in order to keep a 'certain' amount of them in the buffer
+        # Extract packets to output in order to keep a 'certain' time span in the buffer
         elif units == self.SECONDS:  # based on time stamps
-            raise NotImplementedError()
+            while len(self.medias) > 0:
+                media = self.next_media()
+                if self.elapsed(media.timestamp) <= value:
+                    break
+                while self.out_next() is not media:
+                    pass  # Skip the missing media packets preceding the next one
         else:
             raise ValueError(self.ER_DELAY_UNITS.format(units))
 
+    def out_next(self) -> RtpPacket | None:
+        """Output the media packet at next position and return it (None if missing)."""
+        # Initialize or increment actual position (expected sequence number)
+        if self.startup:
+            assert self.head is not None
+            self.position = self.head
+        else:
+            self.position = (self.position + 1) & RtpPacket.S_MASK
+
+        self.startup = False
+
+        if media := self.medias.get(self.position):
+            self.lostogram[self.lostogram_counter] += 1
+            self.lostogram_counter = 0
+            latency = self.elapsed(media.timestamp)
+            if self.latency_count == 0:
+                self.latency_min = self.latency_max = latency
+            else:
+                self.latency_min = min(self.latency_min, latency)
+                self.latency_max = max(self.latency_max, latency)
+            self.latency_count += 1
+            self.latency_total += latency
+            del self.medias[media.sequence]
+            self.writer.write(media.payload)
+        else:
+            self.media_missing += 1
+            self.lostogram_counter += 1
+
+        # Remove any fec packet linked to current media packet
+        if cross := self.crosses.get(self.position):
+            if (col_sequence := cross['col_sequence']) is not None:
+                self.remove_fec(self.cols, col_sequence)
+            if (row_sequence := cross['row_sequence']) is not None:
+                self.remove_fec(self.rows, row_sequence)
+            self._remove_cross(self.position, cross)
+
+        # Forget the oldest crosses already removed (e.g. output or recovered)
+        order = self._crosses_order
+        while order and order[0] not in self.crosses:
+            order.popleft()
+
+        return media
+
+    def _add_cross(self, media_sequence: int) -> dict[str, int | None]:
+        """Create the cross of a missing media packet, reusing a removed one if any."""
+        cross: dict[str, int | None]
+        if self._spare_crosses:
+            cross = self._spare_crosses.pop()
+        else:
+            cross = {'col_sequence': None, 'row_sequence': None}
+        self.crosses[media_sequence] = cross
+        self._crosses_order.append(media_sequence)
+        self.max_cross = max(self.max_cross, len(self.crosses))
+        return cross
+
+    def _remove_cross(self, media_sequence: int, cross: dict[str, int | None]) -> None:
+        """Remove the cross of a media packet and keep it for reuse."""
+        del self.crosses[media_sequence]
+        cross['col_sequence'] = cross['row_sequence'] = None
+        self._spare_crosses.append(cross)
+
     def __str__(self) -> str:
         """
         Return a string representing this instance.
@@ -551,6 +719,7 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
                 0       0           0       0
         Current position (media sequence) : 0
         Current delay (can be set) : 0 packets
+        Output latency (min/avg/max) : 0.000/0.000/0.000 seconds
         FEC matrix size (LxD) : 0x0 = 0 packets
         """
         delay_format = '%.0f' if self.delay_units == self.PACKETS else '%.2f'
@@ -567,6 +736,7 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
             '%9d%8d%12d%8d{0}'
             'Current position (media sequence) : %s{0}'
             'Current delay (can be set) : %s{0}'
+            'Output latency (min/avg/max) : %.3f/%.3f/%.3f seconds{0}'
             'FEC matrix size (LxD) : %sx%s = %s packets'.format(os.linesep)
             % (
                 self.media_received,
@@ -588,6 +758,9 @@ class FecReceiver:  # pylint:disable=too-many-instance-attributes
                 self.media_missing,
                 self.position,
                 delay_msg,
+                self.latency_min,
+                self.latency_total / self.latency_count if self.latency_count else 0,
+                self.latency_max,
                 self.matrixL,
                 self.matrixD,
                 self.matrixL * self.matrixD,
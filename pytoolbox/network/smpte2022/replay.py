@@ -0,0 +1,170 @@
+"""
+Offline replay of SMPTE 2022-1 network captures (pcap or pcapng) through a FEC receiver.
+
+Can be used from the command line::
+
+    python -m pytoolbox.network.smpte2022.replay capture.pcap 239.232.0.222:5004 recovered.ts
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from pytoolbox.network.pcap import PcapReader, UdpDatagram
+
+from .receiver import FecReceiver
+from .service import COL, MEDIA, ROW, FecStream
+
+__all__ = ['replay', 'main']
+
+# Amount of media datagrams between two cleanups of the FEC packets that became useless
+CLEANUP_INTERVAL = 10_000
+
+
+def replay(  # pylint:disable=too-many-locals
+    path: Path | str,
+    media_socket: str,
+    output: BinaryIO,
+    *,
+    delay: float = 1000,
+    units: int = FecReceiver.PACKETS,
+    only_mp2ts: bool = True,
+) -> dict[str, Any]:
+    """
+    Stream the media and FEC datagrams of a capture through a :class:`FecReceiver` writing the
+    recovered stream to `output` and return a report of the losses and recoveries.
+
+    The datagrams are demultiplexed by destination: the media socket and the column (+2) and row
+    (+4) FEC sockets. An IP address ``0.0.0.0`` matches any destination address.
+
+    **Example usage**
+
+    >>> import io
+    >>> import tempfile
+    >>> from pytoolbox.network.pcap import build_udp_frame, write_pcap
+    >>> from pytoolbox.network.rtp import RtpPacket
+    >>> from pytoolbox.network.smpte2022.generator import FecGenerator
+    >>>
+    >>> source, frames = ('10.0.0.1', 1234), []
+    >>> def capture(fec, port):
+    ...     data = RtpPacket.create(fec.sequence, 0, RtpPacket.DYNAMIC_PT, fec.bytes).bytes
+    ...     frames.append((len(frames) / 100, build_udp_frame(source, ('239.0.0.1', port), data)))
+    >>> generator = FecGenerator(4, 5)
+    >>> generator.on_new_col = lambda col: capture(col, 5002)
+    >>> generator.on_new_row = lambda row: capture(row, 5004)
+    >>> generator.on_reset = lambda media: None
+    >>> for i in range(100):
+    ...     media = RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, bytearray([i] * 188))
+    ...     if i % 9:  # Simulate some losses
+    ...         frame = build_udp_frame(source, ('239.0.0.1', 5000), media.bytes)
+    ...         frames.append((len(frames) / 100, frame))
+    ...     generator.put_media(media)
+    >>>
+    >>> output = io.BytesIO()
+    >>> with tempfile.NamedTemporaryFile(suffix='.pcap') as f:
+    ...     write_pcap(f.name, frames)
+    ...     report = replay(f.name, '0.0.0.0:5000', output)
+    >>> output.getvalue() == b''.join(bytes([i] * 188) for i in range(100))
+    True
+    >>> report['datagrams'], report['media'], report['col'], report['row'], report['other']
+    (133, 88, 20, 25, 0)
+    >>> report['media_recovered'], report['media_missing'], report['media_lost_ratio']
+    (12, 0, 0.0)
+    """
+    receiver = FecReceiver(output)  # type: ignore[arg-type]
+    receiver.set_delay(delay, units)
+    stream = FecStream(media_socket, receiver, only_mp2ts=only_mp2ts)
+    kinds = {
+        (str(address['ip']), int(address['port'])): kind
+        for kind, address in stream.addresses.items()
+    }
+    counters = {MEDIA: 0, COL: 0, ROW: 0}
+    datagrams = other = 0
+    first_timestamp: float | None = None
+    last_timestamp = 0.0
+    datagram: UdpDatagram | None = None
+
+    start_time = time.perf_counter()
+    with PcapReader(path) as reader:
+        for datagram in reader.iter_udp_datagrams():
+            datagrams += 1
+            ip, port = datagram.destination
+            if (kind := kinds.get((ip, port)) or kinds.get(('0.0.0.0', port))) is None:
+                other += 1
+                continue
+            if first_timestamp is None:
+                first_timestamp = datagram.timestamp
+            last_timestamp = datagram.timestamp
+            counters[kind] += 1
+            stream.put(kind, bytearray(datagram.payload))  # Copy (the capture will be unmapped)
+            if kind == MEDIA and counters[MEDIA] % CLEANUP_INTERVAL == 0 and not receiver.startup:
+                receiver.cleanup()
+        datagram = None  # Release the last view of the capture before unmapping it
+        ignored = reader.ignored
+    receiver.flush()
+    elapsed = time.perf_counter() - start_time
+
+    duration = (last_timestamp - first_timestamp) if first_timestamp is not None else 0.0
+    expected = receiver.media_received + receiver.media_recovered + receiver.media_missing
+    return {
+        'datagrams': datagrams,
+        'ignored': ignored,
+        'other': other,
+        'media': counters[MEDIA],
+        'col': counters[COL],
+        'row': counters[ROW],
+        'invalid': stream.invalid,
+        'media_received': receiver.media_received,
+        'media_recovered': receiver.media_recovered,
+        'media_aborted_recovery': receiver.media_aborted_recovery,
+        'media_missing': receiver.media_missing,
+        'media_lost_ratio': receiver.media_missing / expected if expected else 0.0,
+        'col_dropped': receiver.col_dropped,
+        'row_dropped': receiver.row_dropped,
+        'lostogram': dict(sorted(receiver.lostogram.items())),
+        'duration': duration,
+        'elapsed': elapsed,
+        'speed': duration / elapsed if elapsed else 0.0,
+        'receiver': receiver,
+    }
+
+
+def main(args: list[str] | None = None) -> None:
+    """Replay a capture from the command line and print the report."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0].strip())
+    parser.add_argument('capture', type=Path, help='Network capture (pcap or pcapng).')
+    parser.add_argument('media_socket', help='Media socket (e.g. 239.232.0.222:5004).')
+    parser.add_argument('output', type=Path, help='Where to write the recovered stream.')
+    parser.add_argument('-d', '--delay', type=float, default=1000, help='Receiver delay.')
+    parser.add_argument(
+        '-u',
+        '--units',
+        choices=FecReceiver.DELAY_NAMES,
+        default=FecReceiver.DELAY_NAMES[FecReceiver.PACKETS],
+        help='Receiver delay units.',
+    )
+    parser.add_argument(
+        '--any-payload',
+        action='store_true',
+        help='Accept media packets without a MPEG2-TS payload.',
+    )
+    options = parser.parse_args(args)
+    with open(options.output, 'wb') as output:
+        report = replay(
+            options.capture,
+            options.media_socket,
+            output,
+            delay=options.delay,
+            units=FecReceiver.DELAY_NAMES.index(options.units),
+            only_mp2ts=not options.any_payload,
+        )
+    print(report.pop('receiver'))
+    for key, value in report.items():
+        print(f'{key:<24}: {value}')
+
+
+if __name__ == '__main__':
+    main()
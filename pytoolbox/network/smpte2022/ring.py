@@ -0,0 +1,159 @@
+"""
+Single-producer single-consumer ring buffer of datagrams in shared memory.
+"""
+
+from __future__ import annotations
+
+import struct
+from multiprocessing import shared_memory
+from typing import Final
+
+__all__ = ['SharedRing']
+
+
+class SharedRing:
+    r"""
+    A ring of fixed-size slots in shared memory to hand datagrams over to another process without
+    pickling them.
+
+    There must be one producer (calling :meth:`put`) and one consumer (calling :meth:`get`). The
+    write (head) and read (tail) indexes are 64-bit counters stored into their own cache line, each
+    one being updated by only one side (once the slots are written or read). A datagram is tagged
+    with a `channel` (an unsigned 32-bit integer) to identify its stream.
+
+    There is no lock nor memory barrier (Python does not expose any for shared memory), the ring
+    relies on the memory accesses of a side being seen in order by the other side: a slot is
+    written before the head is published and read before the tail is released. This is guaranteed
+    by the total store order of x86 processors, not by weakly-ordered architectures (e.g. ARM).
+
+    **Example usage**
+
+    >>> producer = SharedRing(slots=4, slot_size=16)
+    >>> consumer = SharedRing(producer.name, create=False)
+    >>> consumer.slots, consumer.slot_size, consumer.free
+    (4, 16, 4)
+    >>> [producer.put(bytes([i] * 3), channel=i) for i in range(5)]
+    [True, True, True, True, False]
+    >>> producer.dropped, len(consumer)
+    (1, 4)
+    >>> consumer.get(limit=3)
+    [(0, bytearray(b'\x00\x00\x00')), (1, bytearray(b'\x01\x01\x01')), ...]
+    >>> producer.put(b'a' * 11)
+    Traceback (most recent call last):
+        ...
+    ValueError: Datagram size 11 is larger than slot size 10
+    >>> producer.put(b'abc', channel=42)
+    True
+    >>> consumer.get()
+    [(3, bytearray(b'\x03\x03\x03')), (42, bytearray(b'abc'))]
+    >>> consumer.get()
+    []
+    >>> consumer.close()
+    >>> producer.close()
+    >>> producer.unlink()
+    """
+
+    # Layout of the shared memory: head, tail, slots and slot size then the slots
+    COUNTERS_SIZE: Final[int] = 128
+    HEAD_INDEX: Final[int] = 0
+    TAIL_INDEX: Final[int] = 8  # Another cache line than the head
+    SLOTS_INDEX: Final[int] = 1
+    SLOT_SIZE_INDEX: Final[int] = 2
+
+    # Header of a slot: size and channel of the datagram
+    SLOT_HEADER_STRUCT: Final[struct.Struct] = struct.Struct('<HI')
+
+    def __init__(
+        self,
+        name: str | None = None,
+        *,
+        create: bool = True,
+        slots: int = 4096,
+        slot_size: int = 1536,
+    ) -> None:
+        """
+        Create (or attach to) a ring buffer.
+
+        :param name: Name of the shared memory block (mandatory if attaching, the attaching
+            process must be the creator or one of its children to share its resource tracker).
+        :param create: Create the shared memory block or attach to an existing one.
+        :param slots: Amount of slots (ignored when attaching).
+        :param slot_size: Size of a slot, including a 6 bytes header (ignored when attaching).
+        """
+        if create:
+            if slots < 1 or not self.SLOT_HEADER_STRUCT.size < slot_size <= 65535:
+                raise ValueError(f'Invalid ring size: {slots} slots of {slot_size} bytes')
+            self.memory = shared_memory.SharedMemory(
+                name, create=True, size=self.COUNTERS_SIZE + slots * slot_size
+            )
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+        buffer = self.memory.buf
+        assert buffer is not None
+        self.buffer: memoryview = buffer
+        self._counters = self.buffer[: self.COUNTERS_SIZE].cast('Q')
+        if create:
+            self._counters[self.SLOTS_INDEX] = slots
+            self._counters[self.SLOT_SIZE_INDEX] = slot_size
+        self.slots = self._counters[self.SLOTS_INDEX]
+        self.slot_size = self._counters[self.SLOT_SIZE_INDEX]
+        self.dropped = 0  # Datagrams dropped by the producer because the ring was full
+
+    def __len__(self) -> int:
+        return self._counters[self.HEAD_INDEX] - self._counters[self.TAIL_INDEX]
+
+    @property
+    def name(self) -> str:
+        """Returns the name of the shared memory block."""
+        return self.memory.name
+
+    @property
+    def free(self) -> int:
+        """Returns the amount of free slots."""
+        return self.slots - len(self)
+
+    def put(self, data: bytes | bytearray | memoryview, channel: int = 0) -> bool:
+        """Append a datagram to the ring, return False if it was dropped (the ring is full)."""
+        size = len(data)
+        if size > self.slot_size - self.SLOT_HEADER_STRUCT.size:
+            raise ValueError(
+                f'Datagram size {size} is larger than slot size '
+                f'{self.slot_size - self.SLOT_HEADER_STRUCT.size}'
+            )
+        counters = self._counters
+        head = counters[self.HEAD_INDEX]
+        if head - counters[self.TAIL_INDEX] >= self.slots:
+            self.dropped += 1
+            return False
+        offset = self.COUNTERS_SIZE + (head % self.slots) * self.slot_size
+        self.SLOT_HEADER_STRUCT.pack_into(self.buffer, offset, size, channel)
+        offset += self.SLOT_HEADER_STRUCT.size
+        self.buffer[offset : offset + size] = data
+        counters[self.HEAD_INDEX] = head + 1  # Publish the datagram
+        return True
+
+    def get(self, limit: int | None = None) -> list[tuple[int, bytearray]]:
+        """Remove (at most `limit`) datagrams from the ring and return them with their channel."""
+        counters, buffer = self._counters, self.buffer
+        tail = counters[self.TAIL_INDEX]
+        count = counters[self.HEAD_INDEX] - tail
+        if limit is not None:
+            count = min(count, limit)
+        header, header_size = self.SLOT_HEADER_STRUCT, self.SLOT_HEADER_STRUCT.size
+        datagrams = []
+        for index in range(tail, tail + count):
+            offset = self.COUNTERS_SIZE + (index % self.slots) * self.slot_size
+            size, channel = header.unpack_from(buffer, offset)
+            offset += header_size
+            datagrams.append((channel, bytearray(buffer[offset : offset + size])))
+        counters[self.TAIL_INDEX] = tail + count  # Release the slots
+        return datagrams
+
+    def close(self) -> None:
+        """Release the views of the shared memory and close it (it is not destroyed)."""
+        self._counters.release()
+        self.memory.close()
+
+    def unlink(self) -> None:
+        """Destroy the shared memory block (only the creator should call it)."""
+        self.memory.unlink()
@@ -0,0 +1,182 @@
+"""
+SMPTE 2022-1 FEC packets sender with batched UDP output.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Protocol
+
+from pytoolbox import logging
+from pytoolbox.network.buffers import BufferPool
+from pytoolbox.network.rtp import RtpPacket
+
+from .base import FecPacket
+from .generator import FecGenerator
+from .receiver import FecReceiver
+
+log = logging.get_logger(__name__)
+
+__all__ = ['DatagramTransport', 'FecSender']
+
+
+class DatagramTransport(Protocol):  # pylint:disable=too-few-public-methods
+    """Anything able to send a datagram: a :class:`socket.socket` or an asyncio transport."""
+
+    def sendto(self, data: Any, address: Any, /) -> Any:
+        """Send `data` to `address`."""
+
+
+class FecSender:  # pylint:disable=too-many-instance-attributes
+    r"""
+    Serialize the FEC packets into a preallocated buffer pool and send them by batches.
+
+    The packets are written straight into the slots of the pool (see :meth:`FecPacket.pack_into`),
+    without intermediate buffers. The FEC packets are released once serialized (see
+    :meth:`FecPacket.release`), so their payload recovery is recycled if a payload pool is set.
+
+    The packets are encapsulated into RTP packets (dynamic payload type, timestamp set to 0) and
+    sent to the column (media port +2) and row (media port +4) destinations. The packets are sent
+    once `batch_size` packets are pending or when :meth:`flush` is called.
+
+    Python does not expose ``sendmmsg``, so a batch is sent with a tight loop of ``sendto`` calls on
+    views of the pool (no copy, no allocation per packet).
+
+    The sender is thread-safe and works with both a (blocking or not) :class:`socket.socket` or an
+    :class:`asyncio.DatagramTransport`.
+
+    **Example usage**
+
+    >>> class Transport(object):
+    ...     def __init__(self):
+    ...         self.datagrams = []
+    ...     def sendto(self, data, address):
+    ...         self.datagrams.append((bytes(data), address))
+    >>>
+    >>> transport = Transport()
+    >>> sender = FecSender(transport, '127.0.0.1:5000', batch_size=4)
+    >>> generator = FecGenerator(2, 3)
+    >>> sender.attach(generator)
+    >>> generator.on_reset = lambda media: None
+    >>> for i in range(6):
+    ...     generator.put_media(RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, bytearray([i])))
+    >>> sender.pending, len(transport.datagrams)
+    (1, 4)
+    >>> sender.flush()
+    >>> [address[1] for _, address in transport.datagrams]
+    [5004, 5004, 5002, 5004, 5002]
+    >>> data = bytearray(transport.datagrams[-1][0])
+    >>> col = FecPacket(data, len(data))
+    >>> col.direction == FecPacket.COL, col.snbase, col.sequence, col.payload_recovery
+    (True, 1, 2, bytearray(b'\x07'))
+    >>> sender.sent, sender.batches, sender.errors
+    (5, 2, 0)
+    """
+
+    # Size of a slot of the buffer pool (larger than any datagram sent over Ethernet)
+    slot_size: int = 1500
+
+    def __init__(
+        self,
+        transport: DatagramTransport,
+        media_socket: str,
+        *,
+        batch_size: int = 16,
+        ssrc: int = 0,
+    ) -> None:
+        """
+        Construct a FecSender.
+
+        :param transport: Used to send the datagrams, e.g. a socket or an asyncio transport.
+        :param media_socket: Media socket, e.g. ``239.232.0.222:5004``, used to compute FEC sockets.
+        :param batch_size: Amount of FEC packets sent per batch.
+        :param ssrc: Synchronization source of the FEC packets.
+        """
+        if batch_size < 1:
+            raise ValueError(f'Batch size must be positive, got {batch_size}')
+        self.transport = transport
+        self.col_address = self.to_address(FecReceiver.compute_col_address(media_socket))
+        self.row_address = self.to_address(FecReceiver.compute_row_address(media_socket))
+        self.batch_size = batch_size
+        self.ssrc = ssrc
+        self.pool = BufferPool(self.slot_size, batch_size)
+        self._slots: list[int] = []
+        self._sizes: list[int] = []
+        self._addresses: list[tuple[str, int]] = []
+        self._lock = threading.Lock()
+        # Statistics
+        self.sent = 0  # Sent FEC packets counter
+        self.batches = 0  # Sent batches counter
+        self.errors = 0  # Failed to send FEC packets counter
+
+    @property
+    def pending(self) -> int:
+        """Returns the amount of FEC packets waiting to be sent."""
+        return len(self._sizes)
+
+    def attach(self, generator: FecGenerator) -> None:
+        """Register this sender as the output of the FEC packets generated by `generator`."""
+        generator.on_new_col = self.put_col  # type: ignore[method-assign]
+        generator.on_new_row = self.put_row  # type: ignore[method-assign]
+
+    def put_col(self, col: FecPacket) -> None:
+        """Serialize a column FEC packet and send the pending packets if the batch is full."""
+        self.put(col, self.col_address)
+
+    def put_row(self, row: FecPacket) -> None:
+        """Serialize a row FEC packet and send the pending packets if the batch is full."""
+        self.put(row, self.row_address)
+
+    def put(self, fec: FecPacket, address: tuple[str, int]) -> None:
+        """Serialize a FEC packet and send the pending packets if the batch is full."""
+        size = RtpPacket.HEADER_LENGTH + fec.HEADER_LENGTH + fec.payload_size
+        if size > self.slot_size:
+            raise ValueError(f'FEC packet size {size} is larger than slot size {self.slot_size}')
+        with self._lock:
+            slot = self.pool.acquire()
+            buffer = self.pool[slot]
+            RtpPacket.HEADER_STRUCT.pack_into(
+                buffer,
+                0,
+                2 << RtpPacket.V_SHIFT,  # Version 2, no padding, extension and CSRC
+                RtpPacket.DYNAMIC_PT,
+                fec.sequence & RtpPacket.S_MASK,
+                0,
+                self.ssrc,
+            )
+            fec.pack_into(buffer, RtpPacket.HEADER_LENGTH)
+            fec.release()  # Serialized, its payload recovery can be recycled
+            self._slots.append(slot)
+            self._sizes.append(size)
+            self._addresses.append(address)
+            if len(self._sizes) == self.batch_size:
+                self._send()
+
+    def flush(self) -> None:
+        """Send the pending FEC packets."""
+        with self._lock:
+            self._send()
+
+    def _send(self) -> None:
+        if not self._sizes:
+            return
+        sendto, pool = self.transport.sendto, self.pool
+        errors = 0
+        for slot, size, address in zip(self._slots, self._sizes, self._addresses, strict=True):
+            try:
+                sendto(pool[slot][:size], address)
+            except OSError as exc:
+                errors += 1
+                log.warning('Unable to send FEC packet to %s: %s', address, exc)
+            pool.release(slot)
+        self.sent += len(self._sizes) - errors
+        self.errors += errors
+        self.batches += 1
+        self._slots.clear()
+        self._sizes.clear()
+        self._addresses.clear()
+
+    @staticmethod
+    def to_address(address: dict[str, str | int]) -> tuple[str, int]:
+        """Convert an address (see :func:`pytoolbox.network.ip.IPSocket`) for ``sendto``."""
+        return str(address['ip']), int(address['port'])
@@ -0,0 +1,282 @@
+"""
+Asynchronous (:mod:`asyncio`) UDP front-end feeding SMPTE 2022-1 FEC receivers.
+
+A single event loop drives any amount of streams (no threads), each stream being made of a media
+socket and the column (port +2) and row (port +4) FEC sockets.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import socket
+import struct
+from collections.abc import Callable
+from ipaddress import ip_address
+from typing import Any, Final
+
+from pytoolbox import logging
+from pytoolbox.network.ip import IPSocket
+from pytoolbox.network.rtp import RtpPacket
+
+from .base import FecPacket
+from .receiver import FecReceiver
+
+log = logging.get_logger(__name__)
+
+__all__ = [
+    'COL',
+    'MEDIA',
+    'ROW',
+    'FecDatagramProtocol',
+    'FecReceiverService',
+    'FecStream',
+    'StreamSocketsMixin',
+]
+
+MEDIA: Final[str] = 'media'
+COL: Final[str] = 'col'
+ROW: Final[str] = 'row'
+
+
+class FecDatagramProtocol(asyncio.DatagramProtocol):
+    """Parse the datagrams received on one of the sockets of a stream and feed its receiver."""
+
+    def __init__(self, stream: FecStream, kind: str) -> None:
+        self.stream = stream
+        self.kind = kind
+
+    def datagram_received(self, data: bytes, addr: tuple[str | Any, int]) -> None:
+        self.stream.put(self.kind, bytearray(data))
+
+    def error_received(self, exc: Exception) -> None:
+        log.warning('Stream %s, %s socket error: %s', self.stream.media_socket, self.kind, exc)
+
+
+class StreamSocketsMixin:
+    """
+    The media, column (port +2) and row (port +4) sockets of a stream.
+
+    A media socket of port 0 binds the 3 sockets to free ports (e.g. for testing), see
+    :attr:`bound_addresses`.
+    """
+
+    media_socket: str
+    transports: list[asyncio.DatagramTransport]
+
+    @property
+    def addresses(self) -> dict[str, dict[str, str | int]]:
+        """
+        Returns the addresses of the sockets of the stream.
+
+        **Example usage**
+
+        >>> from pytoolbox.unittest import asserts
+        >>> stream = FecStream('239.232.0.222:5004', None)
+        >>> asserts.dict_equal(stream.addresses, {
+        ...     'media': {'ip': '239.232.0.222', 'port': 5004},
+        ...     'col': {'ip': '239.232.0.222', 'port': 5006},
+        ...     'row': {'ip': '239.232.0.222', 'port': 5008}
+        ... })
+        >>> FecStream('127.0.0.1:0', None).addresses['row']
+        {'ip': '127.0.0.1', 'port': 0}
+        """
+        media = IPSocket(self.media_socket)
+        if media['port'] == 0:
+            return {MEDIA: media, COL: dict(media), ROW: dict(media)}
+        return {
+            MEDIA: media,
+            COL: FecReceiver.compute_col_address(self.media_socket),
+            ROW: FecReceiver.compute_row_address(self.media_socket),
+        }
+
+    @property
+    def bound_addresses(self) -> dict[str, tuple[str, int]]:
+        """Returns the addresses the sockets of the stream are bound to (once bound)."""
+        return {
+            kind: transport.get_extra_info('sockname')[:2]
+            for kind, transport in zip(self.addresses, self.transports)
+        }
+
+
+class FecStream(StreamSocketsMixin):
+    """
+    A stream (media + FEC column and row sockets) driving a :class:`FecReceiver`.
+
+    Invalid (or unsupported) datagrams are counted (``self.invalid``) and logged, they are not
+    breaking the stream.
+    """
+
+    def __init__(
+        self, media_socket: str, receiver: FecReceiver, *, only_mp2ts: bool = True
+    ) -> None:
+        self.media_socket = media_socket
+        self.receiver = receiver
+        self.only_mp2ts = only_mp2ts
+        self.invalid = 0
+        self.transports: list[asyncio.DatagramTransport] = []
+
+    def put(self, kind: str, data: bytearray) -> None:
+        """
+        Parse a datagram received on the `kind` socket and put it into the receiver.
+
+        **Example usage**
+
+        >>> import io
+        >>> stream = FecStream('239.232.0.222:5004', FecReceiver(io.BytesIO()))
+        >>> stream.put(MEDIA, bytearray.fromhex('83 21 00 06 00 00 03 09 00 00 00 00 11 11'))
+        >>> stream.put(COL, RtpPacket.create(1, 0, RtpPacket.DYNAMIC_PT, bytearray(8)).bytes)
+        >>> stream.invalid
+        2
+        """
+        try:
+            if kind == MEDIA:
+                self.receiver.put_media(RtpPacket(data, len(data)), self.only_mp2ts)
+            else:
+                self.receiver.put_fec(FecPacket(data, len(data)))
+        except (NotImplementedError, ValueError, struct.error) as exc:
+            self.invalid += 1
+            log.debug('Stream %s, dropped invalid %s packet: %s', self.media_socket, kind, exc)
+
+    def close(self) -> None:
+        """Close the sockets and flush the receiver."""
+        for transport in self.transports:
+            transport.close()
+        self.transports.clear()
+        self.receiver.flush()
+
+
+class FecReceiverService:
+    """
+    Receive any amount of SMPTE 2022-1 FEC streams with one :mod:`asyncio` event loop.
+
+    **Example usage**
+
+    >>> import asyncio
+    >>> import io
+    >>> import socket
+    >>> from pytoolbox.network.smpte2022.generator import FecGenerator
+    >>>
+    >>> async def main():
+    ...     output = io.BytesIO()
+    ...     async with FecReceiverService() as service:
+    ...         stream = await service.add_stream('127.0.0.1:0', output)  # Bound to free ports
+    ...         receiver, sender = stream.receiver, socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ...         sent = []
+    ...
+    ...         def send(kind, packet):
+    ...             sender.sendto(packet.bytes, stream.bound_addresses[kind])
+    ...             sent.append(kind)
+    ...
+    ...         def received():
+    ...             return receiver.media_received + receiver.col_received + receiver.row_received
+    ...
+    ...         def create_fec(fec):
+    ...             return RtpPacket.create(fec.sequence, 0, RtpPacket.DYNAMIC_PT, fec.bytes)
+    ...
+    ...         generator = FecGenerator(4, 5)
+    ...         generator.on_reset = lambda media: None
+    ...         generator.on_new_col = lambda col: send('col', create_fec(col))
+    ...         generator.on_new_row = lambda row: send('row', create_fec(row))
+    ...         for i in range(40):
+    ...             payload = bytearray([i] * 188)
+    ...             media = RtpPacket.create(1000 + i, i * 900, RtpPacket.MP2T_PT, payload)
+    ...             if i % 7:  # Simulate some losses
+    ...                 send('media', media)
+    ...             generator.put_media(media)
+    ...             # Wait for the packets to be received (in order)
+    ...             while received() < len(sent):
+    ...                 await asyncio.sleep(0)
+    ...         sender.close()
+    ...     return stream, output.getvalue()
+    >>>
+    >>> stream, data = asyncio.run(main())
+    >>> stream.receiver.media_recovered, stream.receiver.media_missing, stream.invalid
+    (6, 0, 0)
+    >>> data == b''.join(bytes([i] * 188) for i in range(40))
+    True
+    """
+
+    protocol_class: type[FecDatagramProtocol] = FecDatagramProtocol
+    receiver_class: type[FecReceiver] = FecReceiver
+    stream_class: type[FecStream] = FecStream
+
+    def __init__(self) -> None:
+        self.streams: dict[str, FecStream] = {}
+
+    async def __aenter__(self) -> FecReceiverService:
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        self.close()
+
+    async def add_stream(
+        self,
+        media_socket: str,
+        output: Any,
+        *,
+        delay: float = 100,
+        units: int = FecReceiver.PACKETS,
+        only_mp2ts: bool = True,
+    ) -> FecStream:
+        """
+        Bind the media, column and row sockets of a stream and return the stream.
+
+        :param media_socket: Media socket, e.g. ``239.232.0.222:5004`` (multicast groups are
+            joined), see :class:`StreamSocketsMixin` for the port 0.
+        :param output: Where to output payload of the recovered stream.
+        :param delay: Delay of the receiver, see :meth:`FecReceiver.set_delay`.
+        :param units: Units of the delay, see :meth:`FecReceiver.set_delay`.
+        :param only_mp2ts: Accept only RTP packets with a MPEG2-TS payload.
+        """
+        if media_socket in self.streams:
+            raise ValueError(f'Stream {media_socket} is already registered')
+        receiver = self.receiver_class(output)
+        receiver.set_delay(delay, units)
+        stream = self.stream_class(media_socket, receiver, only_mp2ts=only_mp2ts)
+        loop = asyncio.get_running_loop()
+        try:
+            for kind, address in stream.addresses.items():
+                transport, _ = await loop.create_datagram_endpoint(
+                    self.get_protocol_factory(stream, kind),
+                    sock=self.create_socket(address),
+                )
+                stream.transports.append(transport)  # type: ignore[arg-type]
+        except Exception:
+            stream.close()
+            raise
+        self.streams[media_socket] = stream
+        return stream
+
+    def remove_stream(self, media_socket: str) -> FecStream:
+        """Close the sockets of a stream, flush its receiver and return the stream."""
+        stream = self.streams.pop(media_socket)
+        stream.close()
+        return stream
+
+    def close(self) -> None:
+        """Close all streams."""
+        for media_socket in list(self.streams):
+            self.remove_stream(media_socket)
+
+    def get_protocol_factory(
+        self, stream: FecStream, kind: str
+    ) -> Callable[[], FecDatagramProtocol]:
+        """Return a factory of protocol instances for the `kind` socket of `stream`."""
+        return lambda: self.protocol_class(stream, kind)
+
+    @staticmethod
+    def create_socket(address: dict[str, str | int]) -> socket.socket:
+        """Return a non-blocking UDP socket bound to `address` (joining the multicast group)."""
+        ip, port = str(address['ip']), int(address['port'])  # pylint:disable=invalid-name
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setblocking(False)
+            sock.bind((ip, port))
+            if ip_address(ip).is_multicast:
+                request = socket.inet_aton(ip) + socket.inet_aton('0.0.0.0')
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, request)
+        except OSError:
+            sock.close()
+            raise
+        return sock
@@ -0,0 +1,136 @@
+"""
+Paged storage for SMPTE 2022-1 FEC buffers indexed by RTP sequence numbers.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator, MutableMapping
+from typing import Any, Final, TypeVar
+
+from pytoolbox.network.rtp import RtpPacket
+
+__all__ = ['SEQUENCE_RING_SIZE', 'SequenceRing']
+
+SEQUENCE_RING_SIZE: Final[int] = RtpPacket.S_MASK + 1
+SEQUENCE_RING_PAGE_BITS: Final[int] = 8
+SEQUENCE_RING_PAGE_SIZE: Final[int] = 1 << SEQUENCE_RING_PAGE_BITS
+SEQUENCE_RING_PAGE_MASK: Final[int] = SEQUENCE_RING_PAGE_SIZE - 1
+
+ValueType = TypeVar('ValueType')
+
+
+class SequenceRing(MutableMapping[int, ValueType]):
+    """
+    A mapping with one slot per RTP sequence number (65536 slots).
+
+    Insertion, lookup and removal are O(1) and do not rehash anything, unlike a :class:`dict` that
+    keeps growing and shrinking with the packets flowing through the buffer.
+
+    The slots are allocated by pages of 256 consecutive sequence numbers, a page is allocated when
+    its first slot is set and released when its last slot is freed. So the memory and the
+    iteration over the keys are proportional to the stored values (plus a scan of the 256 pages).
+    Up to `max_spare_pages` released pages are kept for reuse, a stream moving forward is then
+    not allocating a new page every 256 sequence numbers.
+
+    Values cannot be ``None`` as it marks a free slot.
+
+    **Example usage**
+
+    >>> ring = SequenceRing()
+    >>> ring[65535] = 'a'
+    >>> ring[3] = 'b'
+    >>> len(ring), 3 in ring, 4 in ring, ring.get(4), ring[65535 + 4]
+    (2, True, False, None, 'b')
+    >>> sorted(ring.items())
+    [(3, 'b'), (65535, 'a')]
+    >>> min(ring)
+    3
+    >>> del ring[3]
+    >>> del ring[3]
+    Traceback (most recent call last):
+        ...
+    KeyError: 3
+    >>> dict(ring)
+    {65535: 'a'}
+    >>> ring.pages
+    1
+    >>> ring[256] = 'c'
+    >>> del ring[65535]
+    >>> ring.pages, ring[256]
+    (1, 'c')
+    """
+
+    __slots__ = ('_count', '_pages', '_sizes', '_spares')
+
+    # Amount of released pages kept for reuse
+    max_spare_pages: int = 2
+
+    def __init__(self) -> None:
+        self._count = 0
+        pages = SEQUENCE_RING_SIZE >> SEQUENCE_RING_PAGE_BITS
+        self._pages: list[list[ValueType | None] | None] = [None] * pages
+        self._sizes: list[int] = [0] * pages
+        self._spares: list[list[ValueType | None]] = []
+
+    @property
+    def pages(self) -> int:
+        """Return the amount of allocated pages."""
+        return sum(page is not None for page in self._pages)
+
+    def __contains__(self, sequence: object) -> bool:
+        return isinstance(sequence, int) and self.get(sequence) is not None
+
+    def __delitem__(self, sequence: int) -> None:
+        index = sequence & RtpPacket.S_MASK
+        number = index >> SEQUENCE_RING_PAGE_BITS
+        if (page := self._pages[number]) is None or page[index & SEQUENCE_RING_PAGE_MASK] is None:
+            raise KeyError(sequence)
+        page[index & SEQUENCE_RING_PAGE_MASK] = None
+        self._count -= 1
+        self._sizes[number] -= 1
+        if self._sizes[number] == 0:
+            self._pages[number] = None
+            if len(self._spares) < self.max_spare_pages:
+                self._spares.append(page)  # All its slots are free
+
+    def __getitem__(self, sequence: int) -> ValueType:
+        if (value := self.get(sequence)) is None:
+            raise KeyError(sequence)
+        return value
+
+    def __iter__(self) -> Iterator[int]:
+        if self._count == 0:
+            return iter(())
+        return (
+            number << SEQUENCE_RING_PAGE_BITS | index
+            for number, page in enumerate(self._pages)
+            if page is not None
+            for index, value in enumerate(page)
+            if value is not None
+        )
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __setitem__(self, sequence: int, value: ValueType) -> None:
+        index = sequence & RtpPacket.S_MASK
+        number = index >> SEQUENCE_RING_PAGE_BITS
+        if (page := self._pages[number]) is None:
+            page = self._spares.pop() if self._spares else [None] * SEQUENCE_RING_PAGE_SIZE
+            self._pages[number] = page
+        if page[index & SEQUENCE_RING_PAGE_MASK] is None:
+            self._count += 1
+            self._sizes[number] += 1
+        page[index & SEQUENCE_RING_PAGE_MASK] = value
+
+    def clear(self) -> None:
+        self._pages[:] = [None] * len(self._pages)
+        self._sizes[:] = [0] * len(self._sizes)
+        self._count = 0
+
+    def get(self, key: int, default: Any = None) -> Any:
+        index = key & RtpPacket.S_MASK
+        if (page := self._pages[index >> SEQUENCE_RING_PAGE_BITS]) is None:
+            return default
+        value = page[index & SEQUENCE_RING_PAGE_MASK]
+        return default if value is None else value
@@ -0,0 +1,189 @@
+"""
+Buffered output of the payload of the media packets, written by batches with vectored writes.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+from typing import Any
+
+from pytoolbox.network.buffers import PayloadPool
+
+__all__ = ['IOV_MAX', 'PayloadWriter']
+
+
+def _get_iov_max() -> int:
+    try:
+        return os.sysconf('SC_IOV_MAX')
+    except (AttributeError, OSError, ValueError):
+        return 1024
+
+
+# Maximum amount of buffers per vectored write
+IOV_MAX: int = _get_iov_max()
+
+
+class PayloadWriter:
+    """
+    Collect the payloads written in order and write them by batches.
+
+    Payloads are written once `max_packets` payloads or `max_bytes` bytes are pending and when
+    :meth:`flush` is called. If `output` is a binary file (or pipe, socket, ...) backed by a file
+    descriptor, a batch is written with one :func:`os.writev` call (partial writes are handled),
+    otherwise the payloads are joined and written with one call to ``output.write``.
+
+    The writer is taking the ownership of the file descriptor of `output`: `output` is flushed
+    once when constructing the writer and must not be written directly afterwards.
+
+    If a `pool` is given, the payloads are released into it once written (see
+    :class:`pytoolbox.network.buffers.PayloadPool`), they must not be used anymore after
+    :meth:`write` (a partially written payload is not released).
+
+    **Example usage**
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryFile() as f:
+    ...     writer = PayloadWriter(f, max_packets=3)
+    ...     for i in range(7):
+    ...         writer.write(bytearray([65 + i] * 2))
+    ...     print(writer.vectored, writer.writes, writer.pending)
+    ...     writer.flush()
+    ...     print(writer.writes, writer.written)
+    ...     _ = f.seek(0)
+    ...     f.read()
+    True 2 1
+    3 14
+    b'AABBCCDDEEFFGG'
+
+    Any output with a ``write`` method is supported, including text outputs:
+
+    >>> output = io.StringIO()
+    >>> writer = PayloadWriter(output, max_bytes=4)
+    >>> for payload in ('a', 'bc', 'def', 'g'):
+    ...     writer.write(payload)
+    >>> writer.vectored, writer.writes, output.getvalue()
+    (False, 1, 'abcdef')
+    >>> writer.flush()
+    >>> output.getvalue()
+    'abcdefg'
+    """
+
+    def __init__(
+        self,
+        output: Any,
+        *,
+        max_bytes: int = 65536,
+        max_packets: int = 64,
+        pool: PayloadPool | None = None,
+    ) -> None:
+        """
+        Construct a PayloadWriter.
+
+        :param output: Where to write the payloads.
+        :param max_bytes: Write the pending payloads once they reach this size.
+        :param max_packets: Write the pending payloads once they reach this amount.
+        :param pool: Release the payloads into this pool once written.
+        """
+        if max_bytes < 1 or max_packets < 1:
+            raise ValueError(f'Thresholds must be positive, got {max_bytes} and {max_packets}')
+        self.output = output
+        self.max_bytes = max_bytes
+        self.max_packets = max_packets
+        self.pool = pool
+        self.fileno = self.get_fileno(output)
+        if self.fileno is not None:
+            output.flush()  # Data buffered by output must be written before ours
+        self._payloads: list[Any] = []
+        self._size = 0
+        # Statistics
+        self.writes = 0  # Write calls (system calls in vectored mode) counter
+        self.written = 0  # Written bytes (or characters) counter
+
+    @property
+    def pending(self) -> int:
+        """Returns the amount of payloads waiting to be written."""
+        return len(self._payloads)
+
+    @property
+    def vectored(self) -> bool:
+        """Returns True if the payloads are written with vectored writes."""
+        return self.fileno is not None
+
+    def write(self, payload: Any) -> None:
+        """Append a payload and write the pending payloads if a threshold is reached."""
+        self._payloads.append(payload)
+        self._size += len(payload)
+        if self._size >= self.max_bytes or len(self._payloads) >= self.max_packets:
+            self._write()
+
+    def on_write(self, payloads: list[Any]) -> None:
+        """Handle the payloads (in order) before they are written, e.g. to analyze the stream."""
+
+    def flush(self) -> None:
+        """Write the pending payloads and flush the output."""
+        self._write()
+        self.output.flush()
+
+    def _write(self) -> None:
+        if not self._payloads:
+            return
+        self.on_write(self._payloads)
+        if self.fileno is None:
+            # Payloads may be memoryviews (packets parsed without copy) that have no join method
+            data = ('' if isinstance(self._payloads[0], str) else b'').join(self._payloads)
+            self.output.write(data)
+            self.writes += 1
+            self.written += len(data)
+            self._release(self._payloads)
+        else:
+            self._writev(self.fileno, self._payloads)
+        self._payloads.clear()
+        self._size = 0
+
+    def _writev(self, fileno: int, payloads: list[Any]) -> None:
+        index = 0
+        try:  # pylint:disable=too-many-try-statements
+            while index < len(payloads):
+                buffers = payloads[index : index + IOV_MAX]
+                remaining = written = os.writev(fileno, buffers)
+                self.writes += 1
+                self.written += written
+                # Skip the payloads fully written, then keep the unwritten part of a partial one
+                for buffer in buffers:
+                    if remaining < len(buffer):
+                        break
+                    remaining -= len(buffer)
+                    index += 1
+                if remaining:
+                    payloads[index] = memoryview(payloads[index])[remaining:]
+        finally:
+            # Keep only what remains to be written if interrupted (e.g. non-blocking output)
+            self._release(payloads[:index])
+            del payloads[:index]
+            self._size = sum(len(payload) for payload in payloads)
+
+    def _release(self, payloads: list[Any]) -> None:
+        if (pool := self.pool) is not None:
+            for payload in payloads:
+                pool.release(payload)
+
+    @staticmethod
+    def get_fileno(output: Any) -> int | None:
+        """
+        Return the file descriptor of `output` if writable with :func:`os.writev` else None.
+
+        **Example usage**
+
+        >>> import sys
+        >>> PayloadWriter.get_fileno(io.BytesIO()) is None
+        True
+        >>> PayloadWriter.get_fileno(sys.stdout) is None  # Text output
+        True
+        """
+        if not hasattr(os, 'writev') or isinstance(output, io.TextIOBase):
+            return None
+        try:
+            return output.fileno()
+        except (AttributeError, OSError, ValueError):  # io.UnsupportedOperation included
+            return None
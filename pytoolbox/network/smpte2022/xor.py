@@ -0,0 +1,93 @@
+"""
+XOR engine used to compute and apply SMPTE 2022-1 FEC payload recovery.
+
+The fastest available implementation is selected at import time: :mod:`fastxor`, then NumPy and
+finally a pure Python implementation based on (big) integers.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from typing import Final
+
+try:
+    from fastxor import fast_xor_inplace
+except ImportError:
+    fast_xor_inplace = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
+
+__all__ = ['BACKEND', 'xor_inplace', 'xor_many_inplace']
+
+BACKEND: Final[str] = (
+    'fastxor' if fast_xor_inplace is not None else 'numpy' if np is not None else 'python'
+)
+
+
+def xor_inplace(target: bytearray, source: bytearray | bytes | memoryview) -> None:
+    r"""
+    XOR `source` into `target`.
+
+    The source may be shorter than the target (as if padded with zeros) or longer (truncated).
+
+    **Example usage**
+
+    >>> target = bytearray(b'salut')
+    >>> xor_inplace(target, b'sa')
+    >>> target
+    bytearray(b'\x00\x00lut')
+    >>> xor_inplace(target, b'\x00\x00\x00\x00\x00\x00\x00')
+    >>> target
+    bytearray(b'\x00\x00lut')
+    """
+    xor_many_inplace(target, (source,))
+
+
+def xor_many_inplace(
+    target: bytearray,
+    sources: Sequence[bytearray | bytes | memoryview],
+) -> None:
+    r"""
+    XOR all `sources` into `target` in one batch.
+
+    The sources may be shorter than the target (as if padded with zeros) or longer (truncated).
+
+    **Example usage**
+
+    >>> target = bytearray(4)
+    >>> sources = [b'\x01\x02\x03\x04', bytearray(b'\x01'), memoryview(b'\x00\x02')]
+    >>> xor_many_inplace(target, sources)
+    >>> target
+    bytearray(b'\x00\x00\x03\x04')
+    >>> xor_many_inplace(target, [])
+    >>> target
+    bytearray(b'\x00\x00\x03\x04')
+    >>> xor_many_inplace(target, [bytearray(b'\x00\x00\x03\x04\x05'), memoryview(bytearray(6))])
+    >>> target
+    bytearray(b'\x00\x00\x00\x00')
+    """
+    if not sources or not (size := len(target)):
+        return
+    if BACKEND == 'fastxor':
+        view = memoryview(target)
+        for source in sources:
+            if isinstance(source, memoryview) and source.readonly or isinstance(source, bytes):
+                source = bytearray(source[:size])  # fastxor requires a writable buffer
+            elif len(source) > size:
+                source = memoryview(source)[:size]  # fastxor requires buffers of the same length
+            fast_xor_inplace(view[: len(source)], source)
+    elif BACKEND == 'numpy':
+        matrix = np.zeros((len(sources), size), dtype=np.uint8)
+        for row, source in zip(matrix, sources, strict=True):
+            values = np.frombuffer(source, dtype=np.uint8)[:size]
+            row[: len(values)] = values
+        accumulator = np.frombuffer(target, dtype=np.uint8)
+        np.bitwise_xor(accumulator, np.bitwise_xor.reduce(matrix, axis=0), out=accumulator)
+    else:
+        value = int.from_bytes(target, 'little')
+        for source in sources:
+            value ^= int.from_bytes(source[:size], 'little')
+        target[:] = value.to_bytes(size, 'little')
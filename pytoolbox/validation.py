@@ -49,6 +49,8 @@ class CleanAttributesMixin:  # pylint:disable=too-few-public-methods
     AssertionError
     """
 
+    __slots__ = ()
+
     def __setattr__(self, name: str, value: Any) -> None:
         if cleanup_method := getattr(self, 'clean_' + name, None):
             value = cleanup_method(value)
@@ -3,9 +3,15 @@
 # pylint:disable=protected-access,use-implicit-booleaness-not-comparison,too-few-public-methods
 from __future__ import annotations
 
+import asyncio
 import datetime
+import hashlib
 import json
+import os
 import shutil
+import subprocess
+import sys
+import time
 import uuid
 from pathlib import Path
 from typing import Any, Final
@@ -60,6 +66,10 @@ def test_media(tmp_path: Path) -> None:
     assert media.is_pipe is False
     assert media.size == 0
 
+    media.size, media.duration, media.frame = 1024, datetime.timedelta(seconds=1), 25
+    assert media == ffmpeg.Media('test-file.mp4')  # Only the path and options are compared
+    assert media != ffmpeg.Media('test-file.mp4', '-f mp4')
+
     media = ffmpeg.Media(Path('other-file.mp4'))
     assert media.path == Path('other-file.mp4')
     assert media.is_pipe is False
@@ -444,3 +454,658 @@ def test_ffprobe_get_video_resolution(static_ffmpeg: type[ffmpeg.FFmpeg], small_
     assert probe.get_video_resolution(small_mp4) == [560, 320]
     assert probe.get_video_resolution(small_mp4, index=1) is None
     assert probe.get_video_resolution(small_mp4)[ffmpeg.HEIGHT] == 320
+
+
+def create_fake_ffprobe(directory: Path, delay: float = 0) -> Path:
+    """
+    Create an executable printing the information of small.mp4 (or the packets of its video stream)
+    after `delay` seconds and counting its calls. It fails if the path of the media contains "bad".
+    """
+    executable = directory / 'ffprobe'
+    executable.write_text(
+        f'#!/bin/sh\necho "$@" >> {directory / "calls"}\nsleep {delay}\n'
+        'case "$*" in *bad*) exit 1;; esac\n'
+        'case "$*" in *packet=*) printf "%s\\n" 0.000000,K_ 0.033333,__ N/A,K_ 4.000000,K_ '
+        '2.000000,K_ 2.033333,__; exit 0;; esac\n'
+        f'cat {Path(__file__).parent / "small.json"}\n',
+        encoding='utf-8',
+    )
+    executable.chmod(0o755)
+    return executable
+
+
+def test_media_info_cache(tmp_path: Path) -> None:
+    """MediaInfoCache is keyed by path, size and modification time and evicts the oldest entry."""
+    cache = ffmpeg.MediaInfoCache(maxsize=1)
+    media_path = tmp_path / 'a.mp4'
+    assert cache.get_key('ffprobe', media_path) is None  # Missing file
+    assert cache.get_key('ffprobe', tmp_path) is None  # Not a file
+    assert cache.get_key('ffprobe', 'pipe:0') is None
+    media_path.write_bytes(b'data')
+    key = cache.get_key('ffprobe', media_path)
+    assert key is not None
+    assert key == cache.get_key('ffprobe', tmp_path / '.' / 'a.mp4')
+    assert cache.get(key) is None
+    cache.set(key, json.dumps(SMALL_MP4_MEDIA_INFOS))
+    info = cache.get(key)
+    assert info == SMALL_MP4_MEDIA_INFOS
+    info['format'] = None  # type: ignore[index]
+    assert cache.get(key) == SMALL_MP4_MEDIA_INFOS
+    assert (cache.hits, cache.disk_hits, cache.misses) == (2, 0, 1)
+
+    # Modifying the file invalidates its entry
+    status = media_path.stat()
+    os.utime(media_path, ns=(status.st_atime_ns, status.st_mtime_ns + 1))
+    modified_key = cache.get_key('ffprobe', media_path)
+    assert modified_key is not None
+    assert cache.get(modified_key) is None
+    cache.set(modified_key, '{}')
+    assert len(cache) == 1
+    assert cache.get(key) is None  # Evicted
+
+
+def test_media_info_cache_on_disk(tmp_path: Path) -> None:
+    """MediaInfoCache on-disk tier is shared by the caches using the same database."""
+    media_path = tmp_path / 'a.mp4'
+    media_path.write_bytes(b'data')
+    first = ffmpeg.MediaInfoCache(path=tmp_path / 'cache.sqlite')
+    second = ffmpeg.MediaInfoCache(path=tmp_path / 'cache.sqlite')
+    key = first.get_key('ffprobe', media_path)
+    assert key is not None
+    first.set(key, json.dumps(SMALL_MP4_MEDIA_INFOS))
+    assert second.get(key) == SMALL_MP4_MEDIA_INFOS
+    assert second.get(key) == SMALL_MP4_MEDIA_INFOS
+    assert (second.hits, second.disk_hits, second.misses) == (1, 1, 0)
+    assert first.get_key('ffprobe-6.1', media_path) is not None
+    assert second.get(('ffprobe-6.1', *key[1:])) is None  # type: ignore[arg-type]
+    first.clear()
+    assert len(first) == 0
+    assert ffmpeg.MediaInfoCache(path=tmp_path / 'cache.sqlite').get(key) is None
+
+
+def test_ffprobe_cache(tmp_path: Path) -> None:
+    """FFprobe.get_*() methods probe a media file once until it is modified."""
+
+    class CachedFFprobe(ffmpeg.FFprobe):
+        """Test class."""
+
+        cache: ffmpeg.MediaInfoCache | None = ffmpeg.MediaInfoCache()
+        executable = create_fake_ffprobe(tmp_path)
+
+    media_path = tmp_path / 'a.mp4'
+    media_path.write_bytes(b'data')
+    probe = CachedFFprobe()
+    assert probe.get_media_duration(media_path, as_delta=True) == datetime.timedelta(seconds=5.568)
+    assert probe.get_video_resolution(media_path) == [560, 320]
+    assert CachedFFprobe().get_video_frame_rate(ffmpeg.Media(media_path)) == 30.0
+    assert len(probe.get_audio_streams(media_path)) == 1
+    assert len((tmp_path / 'calls').read_text(encoding='utf-8').splitlines()) == 1
+
+    media_path.write_bytes(b'other data')
+    assert probe.get_media_info(media_path) == SMALL_MP4_MEDIA_INFOS
+    assert len((tmp_path / 'calls').read_text(encoding='utf-8').splitlines()) == 2
+
+    CachedFFprobe.cache = None
+    assert probe.get_media_info(media_path) == SMALL_MP4_MEDIA_INFOS
+    assert len((tmp_path / 'calls').read_text(encoding='utf-8').splitlines()) == 3
+
+
+def test_ffprobe_entries(tmp_path: Path) -> None:
+    """FFprobe.get_*() methods probe only the requested entries and cache them apart."""
+
+    class CachedFFprobe(ffmpeg.FFprobe):
+        """Test class."""
+
+        cache: ffmpeg.MediaInfoCache | None = ffmpeg.MediaInfoCache()
+        executable = create_fake_ffprobe(tmp_path)
+
+    media_path = tmp_path / 'a.mp4'
+    media_path.write_bytes(b'data')
+    probe = CachedFFprobe()
+    entries = {'format': ['duration']}
+    assert probe.get_media_duration(media_path, as_delta=True, entries=entries) == (
+        datetime.timedelta(seconds=5.568)
+    )
+    assert probe.get_media_duration(media_path, as_delta=True, entries=entries) == (
+        datetime.timedelta(seconds=5.568)
+    )
+    entries = {'stream': ['width', 'height']}
+    assert probe.get_video_resolution(media_path, entries=entries) == [560, 320]
+    assert probe.get_media_info(media_path) == SMALL_MP4_MEDIA_INFOS
+    calls = (tmp_path / 'calls').read_text(encoding='utf-8').splitlines()
+    assert len(calls) == 3
+    assert '-show_entries format=duration ' in calls[0]
+    assert '-show_entries stream=width,height,codec_type ' in calls[1]
+    assert '-show_format -show_streams ' in calls[2]
+
+
+def test_info_lazy_attributes() -> None:
+    """BaseInfo subclasses are slotted and clean their attributes on first access."""
+    info = SMALL_MP4_MEDIA_INFOS['streams'][0]
+    stream = ffmpeg.VideoStream(info)
+    assert not hasattr(stream, '__dict__')
+    assert (stream.width, stream.height, stream.avg_frame_rate) == (560, 320, 30.0)
+    assert stream.codec.name == 'h264'
+    assert stream == ffmpeg.VideoStream({**info, 'width': 560})
+    assert stream != ffmpeg.AudioStream(info)
+    assert stream.clean() is stream
+    assert stream._info == stream.codec._info == {}  # pylint:disable=protected-access
+    assert stream == ffmpeg.VideoStream(info)
+    with pytest.raises(AttributeError):
+        stream.unknown  # pylint:disable=pointless-statement
+
+    media_format = ffmpeg.Format({'duration': 'N/A', 'size': '1024'})
+    assert media_format.size == 1024
+    with pytest.raises(ValueError):
+        media_format.duration  # pylint:disable=pointless-statement
+
+    probe = ffmpeg.FFprobe()
+    probe.format_class = ffmpeg.Format
+    probe.stream_classes = {**probe.stream_classes, 'video': ffmpeg.VideoStream}
+    bad_info = {'format': {'duration': 'N/A'}, 'streams': [{**info, 'width': 'N/A'}]}
+    assert probe.get_media_format(bad_info) is None
+    assert probe.get_media_streams(bad_info) == []
+    with pytest.raises(ValueError):
+        probe.get_media_format(bad_info, fail=True)
+    with pytest.raises(ValueError):
+        probe.get_media_streams(bad_info, fail=True)
+
+
+def test_ffprobe_get_media_infos(tmp_path: Path) -> None:
+    """FFprobe.get_media_infos() probes the medias concurrently."""
+
+    class BulkFFprobe(ffmpeg.FFprobe):
+        """Test class."""
+
+        cache = None
+        executable = create_fake_ffprobe(tmp_path, delay=0.5)
+
+    paths = [tmp_path / f'{i}.mp4' for i in range(8)] + [tmp_path / 'bad.mp4']
+    probe = BulkFFprobe()
+    start = time.monotonic()
+    results = dict(probe.get_media_infos(iter(paths), max_workers=len(paths)))
+    assert time.monotonic() - start < 2.5  # Sequentially: 4.5 seconds
+    assert list(sorted(results, key=str)) == sorted(paths, key=str)
+    assert results.pop(tmp_path / 'bad.mp4') is None
+    assert all(info == SMALL_MP4_MEDIA_INFOS for info in results.values())
+
+    with pytest.raises(subprocess.CalledProcessError):
+        list(probe.get_media_infos(paths[-2:], max_workers=1, fail=True))
+
+
+def test_ffprobe_get_media_infos_async(tmp_path: Path) -> None:
+    """FFprobe.get_media_infos_async() probes the medias concurrently with asyncio."""
+
+    class BulkFFprobe(ffmpeg.FFprobe):
+        """Test class."""
+
+        cache = None
+        executable = create_fake_ffprobe(tmp_path, delay=0.5)
+
+    async def collect(**kwargs: Any) -> dict[object, dict | None]:
+        return {media: info async for media, info in probe.get_media_infos_async(**kwargs)}
+
+    paths = [tmp_path / f'{i}.mp4' for i in range(8)] + [tmp_path / 'bad.mp4']
+    probe = BulkFFprobe()
+    start = time.monotonic()
+    results = asyncio.run(collect(medias=paths, max_workers=len(paths)))
+    assert time.monotonic() - start < 2.5  # Sequentially: 4.5 seconds
+    assert results.pop(tmp_path / 'bad.mp4') is None
+    assert len(results) == 8
+    assert all(info == SMALL_MP4_MEDIA_INFOS for info in results.values())
+    assert asyncio.run(probe.get_media_info_async({'format': {}})) == {'format': {}}
+
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(collect(medias=paths[-2:], max_workers=1, fail=True))
+
+
+def test_ffprobe_get_media_infos_none(tmp_path: Path) -> None:
+    """FFprobe.get_media_infos*() methods probe the medias following a None media."""
+
+    class BulkFFprobe(ffmpeg.FFprobe):
+        """Test class."""
+
+        cache = None
+        executable = create_fake_ffprobe(tmp_path)
+
+    async def collect() -> list[object]:
+        return [media async for media, _ in probe.get_media_infos_async(medias, max_workers=1)]
+
+    medias = [tmp_path / 'a.mp4', tmp_path / 'b.mp4', None, tmp_path / 'c.mp4']
+    probe = BulkFFprobe()
+    results = dict(probe.get_media_infos(medias, max_workers=1))
+    assert sorted(results, key=str) == sorted(medias, key=str)
+    assert results[None] is None
+    assert sorted(asyncio.run(collect()), key=str) == sorted(medias, key=str)
+
+
+def test_ffprobe_get_media_info_async_cancel(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """FFprobe.get_media_info_async() kills FFprobe when cancelled."""
+
+    class SlowFFprobe(ffmpeg.FFprobe):
+        """Test class."""
+
+        cache = None
+        executable = tmp_path / 'ffprobe'
+
+    SlowFFprobe.executable.write_text('#!/bin/sh\nexec sleep 60\n', encoding='utf-8')
+    SlowFFprobe.executable.chmod(0o755)
+
+    async def create_subprocess_exec(*args: Any, **kwargs: Any) -> asyncio.subprocess.Process:
+        processes.append(await create_function(*args, **kwargs))
+        return processes[-1]
+
+    async def main() -> None:
+        task = asyncio.create_task(SlowFFprobe().get_media_info_async(tmp_path / 'a.mp4'))
+        while not processes:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    processes: list[asyncio.subprocess.Process] = []
+    create_function = asyncio.create_subprocess_exec
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', create_subprocess_exec)
+    start = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - start < 10
+    assert processes[0].returncode == -9  # Killed (and reaped)
+
+
+FAKE_FFMPEG: Final[str] = """
+import os, subprocess, sys, time
+arguments = sys.argv[1:]
+fd = int(arguments[arguments.index('-progress') + 1].split(':')[1])
+sys.stderr.write('ffmpeg version fake ça marche\\n')
+with open(os.path.join(os.path.dirname(sys.argv[0]), 'ffmpeg.calls'), 'a') as f:
+    f.write(' '.join(arguments) + '\\n')
+for frame in (30, 90, 167):
+    time.sleep(0.05)
+    state = 'end' if frame == 167 else 'continue'
+    os.write(fd, (
+        f'frame={frame}\\nfps=60.0\\nstream_0_0_q=28.0\\nbitrate=N/A\\ntotal_size={frame * 1000}\\n'
+        f'out_time_us={frame * 33333}\\nspeed=2x\\nprogress={state}\\n'
+    ).encode())
+    if 'slow' in arguments[-1]:
+        time.sleep(60)
+if 'orphan' in arguments[-1]:  # A child process keeping the pipes open
+    subprocess.Popen(['sleep', '60'], pass_fds=(fd,))
+with open(arguments[-1], 'wb') as f:
+    f.write(b'data')
+sys.exit(1 if 'fail' in arguments[-1] else 0)
+"""
+
+
+def create_fake_ffmpeg(directory: Path) -> type[ffmpeg.FFmpeg]:
+    """Create a FFmpeg class calling an executable reporting its progress (fake encoding)."""
+    executable = directory / 'ffmpeg'
+    executable.write_text(f'#!{sys.executable}\n{FAKE_FFMPEG}', encoding='utf-8')
+    executable.chmod(0o755)
+
+    class FakeFFprobe(ffmpeg.FFprobe):
+        """Test class."""
+
+        cache = None
+        executable = create_fake_ffprobe(directory)
+
+    class FakeEncodeStatistics(ffmpeg.EncodeStatistics):
+        """Test class."""
+
+        ffprobe_class = FakeFFprobe
+
+    class FakeFFmpeg(ffmpeg.FFmpeg):
+        """Test class."""
+
+        ffprobe_class = FakeFFprobe
+        statistics_class = FakeEncodeStatistics
+
+    FakeFFmpeg.executable = executable
+    return FakeFFmpeg
+
+
+def test_statistics_progress_values(tmp_path: Path) -> None:
+    """progress_values() updates the statistics from -progress key=value pairs."""
+    statistics = create_fake_ffmpeg(tmp_path).statistics_class(
+        [ffmpeg.Media(tmp_path / 'input.mp4')], [ffmpeg.Media(tmp_path / 'output.mp4')], [], []
+    )
+    statistics.start('process')
+    statistics.progress_values(
+        {
+            'frame': '84',
+            'fps': '41.5',
+            'stream_0_0_q': '28.0',
+            'stream_0_1_q': '-1.0',
+            'bitrate': ' 367.9kbits/s',
+            'total_size': '131072',
+            'out_time_us': '2784000',
+            'out_time': '00:00:02.784000',
+            'progress': 'continue',
+        }
+    )
+    assert statistics.state == statistics.states.PROCESSING
+    assert (statistics.frame, statistics.frame_rate, statistics.qscale) == (84, 41.5, 28.0)
+    assert (statistics.bit_rate, statistics.output.size) == (367900, 131072)
+    assert statistics.output.duration == datetime.timedelta(seconds=2.784)
+    assert statistics.ratio == 0.5
+
+    statistics.progress_values({'frame': '85', 'total_size': 'N/A', 'out_time_us': 'broken'})
+    assert statistics.frame == 85
+    assert statistics.output.size == 131072
+    assert statistics.output.duration == datetime.timedelta(seconds=2.784)
+
+
+def test_ffmpeg_encode_progress(tmp_path: Path) -> None:
+    """FFmpeg.encode(progress=True) yields the statistics reported by FFmpeg without polling."""
+    encoder = create_fake_ffmpeg(tmp_path)(encode_poll_delay=5)
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+    start = time.monotonic()
+    results = [
+        (statistics.state, statistics.frame, statistics.output.duration)
+        for statistics in encoder.encode(
+            tmp_path / 'input.mp4', tmp_path / 'output.mp4', progress=True
+        )
+    ]
+    assert time.monotonic() - start < 2  # Polling: at least 5 seconds
+    assert results == [
+        ('STARTED', 0, datetime.timedelta(0)),
+        ('PROCESSING', 30, datetime.timedelta(seconds=0.99999)),
+        ('PROCESSING', 90, datetime.timedelta(seconds=2.99997)),
+        ('PROCESSING', 167, datetime.timedelta(seconds=5.566611)),
+        ('SUCCESS', 167, datetime.timedelta(seconds=5.568)),
+    ]
+    statistics = list(encoder.encode(tmp_path / 'input.mp4', tmp_path / 'fail.mp4', progress=True))
+    assert statistics[-1].state == ffmpeg.EncodeState.FAILURE
+    assert statistics[-1].returncode == 1
+    assert statistics[-1].process_output == 'ffmpeg version fake ça marche\n'
+
+
+def test_process_output(tmp_path: Path) -> None:
+    """ProcessOutput keeps the head and tail of the output and spills it in full to a file."""
+    output = ffmpeg.ProcessOutput(head_size=100, tail_size=1000, path=tmp_path / 'log.txt')
+    lines = [
+        f'frame={i} fps=25 q=28.0 size={i}kB time=00:00:00.00 bitrate=N/A\n' for i in range(5000)
+    ]
+    for line in lines:
+        output.write(line)
+    output.close()
+    assert output.head == ''.join(lines)[:100]
+    assert output.tail == ''.join(lines)[-1000:]
+    assert len(output) == len(''.join(lines))
+    assert output.dropped == len(output) - 1100
+    assert str(output).endswith(lines[-1])
+    assert (tmp_path / 'log.txt').read_text(encoding='utf-8') == ''.join(lines)
+
+    output = ffmpeg.ProcessOutput(head_size=100, tail_size=10)
+    output.write('short')
+    assert (output.head, output.tail, output.dropped, str(output)) == ('short', '', 0, 'short')
+
+
+def test_ffmpeg_encode_process_output_path(tmp_path: Path) -> None:
+    """FFmpeg.encode() writes the full output of FFmpeg to process_output_path."""
+    encoder = create_fake_ffmpeg(tmp_path)()
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+    statistics = list(
+        encoder.encode(
+            tmp_path / 'input.mp4',
+            tmp_path / 'fail.mp4',
+            progress=True,
+            statistics_kwargs={'process_output_path': tmp_path / 'ffmpeg.log'},
+        )
+    )[-1]
+    assert statistics.state == ffmpeg.EncodeState.FAILURE
+    assert (tmp_path / 'ffmpeg.log').read_text(encoding='utf-8') == statistics.process_output
+
+
+def test_ffmpeg_encode_async(tmp_path: Path) -> None:
+    """FFmpeg.encode_async() yields the statistics reported by FFmpeg."""
+    encoder = create_fake_ffmpeg(tmp_path)()
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+
+    async def encode(output: Path) -> list[tuple[str, int, object]]:
+        return [
+            (statistics.state, statistics.frame, statistics.output.duration)
+            async for statistics in encoder.encode_async(tmp_path / 'input.mp4', output)
+        ]
+
+    assert asyncio.run(encode(tmp_path / 'output.mp4')) == [
+        ('STARTED', 0, datetime.timedelta(0)),
+        ('PROCESSING', 30, datetime.timedelta(seconds=0.99999)),
+        ('PROCESSING', 90, datetime.timedelta(seconds=2.99997)),
+        ('PROCESSING', 167, datetime.timedelta(seconds=5.566611)),
+        ('SUCCESS', 167, datetime.timedelta(seconds=5.568)),
+    ]
+    assert asyncio.run(encode(tmp_path / 'fail.mp4'))[-1][0] == 'FAILURE'
+
+
+def test_ffmpeg_encode_async_cancel(tmp_path: Path) -> None:
+    """FFmpeg.encode_async() kills FFmpeg when cancelled."""
+    encoder = create_fake_ffmpeg(tmp_path)()
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+    processes = []
+
+    async def encode() -> None:
+        async for statistics in encoder.encode_async(tmp_path / 'input.mp4', tmp_path / 'slow.mp4'):
+            processes.append(statistics.process)
+
+    async def main() -> None:
+        task = asyncio.create_task(encode())
+        while len(processes) < 2:  # Started, then first progress block
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - start < 10
+    assert processes[0].returncode == -9  # Killed
+
+
+def test_ffmpeg_encode_async_orphan(tmp_path: Path) -> None:
+    """FFmpeg.encode_async() ends when FFmpeg exits even if a child process keeps its pipes open."""
+    encoder = create_fake_ffmpeg(tmp_path)(chunk_read_timeout=0.1)
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+
+    async def encode() -> list[tuple[str, int, str]]:
+        return [
+            (statistics.state, statistics.frame, statistics.process_output)
+            async for statistics in encoder.encode_async(
+                tmp_path / 'input.mp4', tmp_path / 'orphan.mp4'
+            )
+        ]
+
+    start = time.monotonic()
+    states = asyncio.run(encode())
+    assert time.monotonic() - start < 10
+    assert [(state, frame) for state, frame, _ in states] == [
+        ('STARTED', 0),
+        ('PROCESSING', 30),
+        ('PROCESSING', 90),
+        ('PROCESSING', 167),
+        ('SUCCESS', 167),
+    ]
+    assert 'ffmpeg version fake ça marche' in states[-1][2]
+
+
+def test_encode_scheduler(tmp_path: Path) -> None:
+    """EncodeScheduler runs the jobs by priority within its CPU budget and retries failures."""
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+    started, used_threads = [], []
+
+    class Scheduler(ffmpeg.EncodeScheduler):
+        """Test class."""
+
+        def on_progress(self, job: ffmpeg.EncodeJob) -> None:
+            if job.statistics.state == ffmpeg.EncodeState.STARTED:
+                started.append(job)
+            used_threads.append(self.used_threads)
+
+    scheduler = Scheduler(create_fake_ffmpeg(tmp_path)(), cpu_budget=4, threads_per_job=2)
+    low = scheduler.submit(tmp_path / 'input.mp4', tmp_path / 'low.mp4')
+    fail = scheduler.submit(tmp_path / 'input.mp4', tmp_path / 'fail.mp4', priority=1)
+    high = scheduler.submit(tmp_path / 'input.mp4', tmp_path / 'high.mp4', priority=2)
+    big = scheduler.submit(tmp_path / 'input.mp4', tmp_path / 'big.mp4', threads=8)
+    assert big.threads == 4  # Capped by the budget
+    assert scheduler.get_out_options(low) == ['-threads', '2']
+    assert scheduler.get_out_options(
+        scheduler.job_class('in', 'out', out_options='-threads 1 -c:v copy')
+    ) == ['-threads', '1', '-c:v', 'copy']
+    assert scheduler.ratio == 0
+
+    asyncio.run(scheduler.run())
+    assert set(started[:2]) == {high, fail}
+    assert started.index(low) < started.index(big)
+    assert max(used_threads) == 4
+    assert scheduler.used_threads == 0
+    assert [job.state for job in (low, fail, high, big)] == [
+        'SUCCESS',
+        'FAILURE',
+        'SUCCESS',
+        'SUCCESS',
+    ]
+    assert [job.attempts for job in (low, fail, high, big)] == [1, 2, 1, 1]
+    assert scheduler.count(ffmpeg.JobState.SUCCESS) == 3
+    assert scheduler.ratio == 1
+    assert len(scheduler.statistics) == 4
+
+
+def test_encode_scheduler_cancel(tmp_path: Path) -> None:
+    """EncodeScheduler cancels the queued and running jobs (FFmpeg is killed)."""
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+    scheduler = ffmpeg.EncodeScheduler(create_fake_ffmpeg(tmp_path)(), cpu_budget=1)
+    running = scheduler.submit(tmp_path / 'input.mp4', tmp_path / 'slow.mp4')
+    queued = scheduler.submit(tmp_path / 'input.mp4', tmp_path / 'output.mp4')
+
+    async def main() -> None:
+        task = asyncio.create_task(scheduler.run())
+        while running.statistics is None or running.statistics.frame == 0:
+            await asyncio.sleep(0.01)
+        assert running.state == ffmpeg.JobState.RUNNING
+        assert queued.state == ffmpeg.JobState.QUEUED
+        assert 0 < scheduler.ratio < 1
+        assert scheduler.cancel(queued)
+        assert scheduler.cancel(running)
+        await task
+
+    start = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - start < 10
+    assert running.state == queued.state == ffmpeg.JobState.CANCELLED
+    assert running.statistics.process.returncode == -9  # Killed
+    assert not scheduler.cancel(running)
+    assert not (tmp_path / 'output.mp4').exists()
+
+
+def test_encode_scheduler_cancel_not_started(tmp_path: Path) -> None:
+    """EncodeScheduler releases a running job cancelled before its task has started."""
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+    scheduler = ffmpeg.EncodeScheduler(create_fake_ffmpeg(tmp_path)(), cpu_budget=1)
+    job = scheduler.submit(tmp_path / 'input.mp4', tmp_path / 'output.mp4')
+
+    async def main() -> None:
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0)  # The job is started but its task has not run yet
+        assert job.state == ffmpeg.JobState.RUNNING
+        assert scheduler.cancel(job)
+        await asyncio.wait_for(task, timeout=10)
+
+    asyncio.run(main())
+    assert job.state == ffmpeg.JobState.CANCELLED
+    assert job.statistics is None
+    assert scheduler.used_threads == 0
+    assert not (tmp_path / 'output.mp4').exists()
+
+
+def test_ffprobe_get_video_keyframes(tmp_path: Path) -> None:
+    """FFprobe.get_video_keyframes() returns the sorted timestamps of the key frames."""
+    probe = ffmpeg.FFprobe(create_fake_ffprobe(tmp_path))
+    assert probe.get_video_keyframes(tmp_path / 'input.mp4') == [0.0, 2.0, 4.0]
+    assert probe.get_video_keyframes(tmp_path / 'bad.mp4') == []
+    with pytest.raises(subprocess.CalledProcessError):
+        probe.get_video_keyframes(tmp_path / 'bad.mp4', fail=True)
+
+
+def test_chunked_encoder(tmp_path: Path) -> None:
+    """ChunkedEncoder encodes the segments in parallel then concatenates them."""
+    (tmp_path / 'input.mp4').write_bytes(b'data')
+    encoder = ffmpeg.ChunkedEncoder(
+        create_fake_ffmpeg(tmp_path)(),
+        segment_duration=2,
+        cpu_budget=4,
+        threads_per_job=2,
+    )
+
+    async def encode(output: Path) -> list[tuple[str, float]]:
+        return [
+            (statistics.state, statistics.ratio)
+            async for statistics in encoder.encode_async(
+                tmp_path / 'input.mp4', output, out_options='-c:v libx264'
+            )
+        ]
+
+    states = asyncio.run(encode(tmp_path / 'output' / 'output.mp4'))
+    assert states[0] == ('STARTED', 0.0)
+    assert states[-1] == ('SUCCESS', 1.0)
+    ratios = [ratio for _, ratio in states]
+    assert ratios == sorted(ratios)
+    assert (tmp_path / 'output' / 'output.mp4').read_bytes() == b'data'
+    assert list((tmp_path / 'output').iterdir()) == [tmp_path / 'output' / 'output.mp4']
+
+    calls = (tmp_path / 'ffmpeg.calls').read_text(encoding='utf-8').splitlines()
+    assert sorted(call.split(' -y ')[1].split(' -i ')[0] for call in calls[:3]) == [
+        '-ss 0.0 -t 2.0',
+        '-ss 2.0 -t 2.0',
+        '-ss 4.0',
+    ]
+    assert all('-threads 2 -c:v libx264' in call for call in calls[:3])
+    assert '-f concat -safe 0 -i' in calls[3] and '-map 0 -c copy' in calls[3]
+    assert asyncio.run(encode(tmp_path / 'fail.mp4'))[-1][0] == 'FAILURE'  # Concatenation
+
+
+FAKE_FRAMEMD5: Final[str] = """
+import hashlib, sys, time
+arguments = sys.argv[1:]
+filename = arguments[arguments.index('-i') + 1]
+if 'missing' in filename:
+    sys.exit(1)
+print('#format: frame checksums\\n#version: 2\\n#hash: MD5\\n#tb 0: 1/30')
+print('#stream#, dts,        pts, duration,     size, hash')
+for frame in range(5):
+    print(f'0, {frame:10}, {frame:10}, 1, 100, {hashlib.md5(bytes([frame])).hexdigest()}')
+    sys.stdout.flush()
+    if 'slow' in filename and frame == 2:
+        time.sleep(60)
+sys.exit(1 if 'fail' in filename else 0)
+"""
+
+
+def test_ffmpeg_frames_md5(tmp_path: Path) -> None:
+    """FFmpeg.iter_frames_md5() streams the checksums of the frames, stopping FFmpeg if asked."""
+    executable = tmp_path / 'ffmpeg'
+    executable.write_text(f'#!{sys.executable}\n{FAKE_FRAMEMD5}', encoding='utf-8')
+    executable.chmod(0o755)
+
+    class FakeFFmpeg(ffmpeg.FFmpeg):
+        """Test class."""
+
+        executable = tmp_path / 'ffmpeg'
+
+    encoder = FakeFFmpeg()
+    checksums = [hashlib.md5(bytes([frame])).hexdigest() for frame in range(5)]
+    frames = list(encoder.iter_frames_md5(tmp_path / 'input.mp4'))
+    assert [frame.checksum for frame in frames] == checksums
+    assert frames[4] == ffmpeg.FrameChecksum(0, 4, 4, 1, 100, checksums[4])
+    with pytest.raises(subprocess.CalledProcessError):
+        list(encoder.iter_frames_md5(tmp_path / 'fail.mp4'))
+
+    start = time.monotonic()
+    assert FakeFFmpeg.get_frames_md5_checksum(tmp_path / 'slow.mp4') == checksums[0]
+    assert FakeFFmpeg.get_frames_md5_checksum(tmp_path / 'missing.mp4') is None
+    assert encoder.get_frames_md5_mismatch(tmp_path / 'input.mp4', frames) is None
+    assert encoder.get_frames_md5_mismatch(tmp_path / 'input.mp4', checksums) is None
+    assert encoder.get_frames_md5_mismatch(tmp_path / 'input.mp4', checksums[:3]) == 3
+    assert encoder.get_frames_md5_mismatch(tmp_path / 'input.mp4', [*checksums, 'extra']) == 5
+    assert encoder.get_frames_md5_mismatch(tmp_path / 'slow.mp4', checksums[::-1]) == 0
+    assert time.monotonic() - start < 10  # FFmpeg is killed
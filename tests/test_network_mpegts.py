@@ -0,0 +1,71 @@
+"""Tests for the network.mpegts module."""
+
+from __future__ import annotations
+
+import random
+
+from pytoolbox.network.mpegts import NULL_PID, PACKET_SIZE, TsAnalyzer, TsPacketBatch
+
+
+def reference_cc_errors(packets: list[tuple[int, int]]) -> dict[int, int]:
+    """Count the continuity counter errors of (PID, CC) packets the slow way."""
+    last: dict[int, int] = {}
+    errors: dict[int, int] = {}
+    for pid, cc in packets:
+        if pid in last and cc not in {last[pid], (last[pid] + 1) & 0x0F}:
+            errors[pid] = errors.get(pid, 0) + 1
+        last[pid] = cc
+    return errors
+
+
+def test_analyzer_matches_reference() -> None:
+    """Continuity errors are detected across chunk boundaries, as a packet by packet check does."""
+    rng = random.Random(42)
+    counters = {pid: rng.randrange(16) for pid in (0, 0x100, 0x101, 0x1FFE)}
+    packets = []
+    for _ in range(5000):
+        pid = rng.choice(list(counters))
+        counters[pid] = (counters[pid] + (1 if rng.random() > 0.02 else rng.randrange(16))) & 0x0F
+        packets.append((pid, counters[pid]))
+    data = b''.join(TsPacketBatch.create(pid, cc) for pid, cc in packets)
+
+    analyzer = TsAnalyzer()
+    position = 0
+    while position < len(data):
+        size = rng.randrange(1, 60) * PACKET_SIZE
+        analyzer.put(data[position : position + size])
+        position += size
+
+    expected = reference_cc_errors(packets)
+    assert analyzer.packets == 5000
+    assert analyzer.cc_errors == sum(expected.values()) > 0
+    assert {pid: s['cc_errors'] for pid, s in analyzer.statistics.items() if s['cc_errors']} == (
+        expected
+    )
+
+
+def test_analyzer_ignored_packets() -> None:
+    """Null, erroneous and payload-less packets do not break the continuity of a PID."""
+    corrupted = bytearray(TsPacketBatch.create(0x100, 9))
+    corrupted[1] |= 0x80  # Transport error indicator
+    analyzer = TsAnalyzer()
+    analyzer.put_payloads(
+        [
+            TsPacketBatch.create(0x100, 0),
+            TsPacketBatch.create(NULL_PID, 7),
+            corrupted,
+            TsPacketBatch.create(0x100, 0, payload=False),  # Counter not incremented
+            TsPacketBatch.create(0x100, 1) + b'\x47',
+        ]
+    )
+    assert (analyzer.packets, analyzer.tei_errors, analyzer.remainder) == (5, 1, 1)
+    assert analyzer.cc_errors == 0
+    assert analyzer.statistics == {0x100: {'packets': 3, 'cc_errors': 0, 'pcr': 0}}
+
+
+def test_packet_batch_pcr() -> None:
+    """The PCR is decoded (33 bits base and 9 bits extension)."""
+    pcrs = [0, 299, 300, (2**33 - 1) * 300 + 299]
+    batch = TsPacketBatch(b''.join(TsPacketBatch.create(0x42, 0, pcr=pcr) for pcr in pcrs))
+    assert batch.has_pcr.all()
+    assert batch.pcr.tolist() == pcrs
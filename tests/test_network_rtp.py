@@ -0,0 +1,57 @@
+"""Tests for the network.rtp module."""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from pytoolbox.network.rtp import RtpPacket, RtpPacketBatch
+
+pytest.importorskip('numpy')
+
+
+def random_datagrams(rng: random.Random, count: int) -> list[bytearray]:
+    """Return random headers (mostly version 2, any flags) and truncated valid packets."""
+    datagrams = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            data = bytearray(rng.randbytes(rng.randrange(40)))
+            if data and rng.random() < 0.8:
+                data[0] = 0x80 | (data[0] & 0x3F)  # Version 2
+        else:
+            data = bytearray(RtpPacket.create(0, 0, RtpPacket.MP2T_PT, bytearray(16)).bytes)
+            data[0] |= rng.choice([0x00, 0x10, 0x20, 0x30]) | rng.randrange(4)  # X, P, CC
+            data[rng.randrange(12, len(data))] = rng.randrange(8)  # Extension or padding length
+            data = data[: rng.randrange(len(data) + 1)]
+        datagrams.append(data)
+    return datagrams
+
+
+def test_batch_matches_packet() -> None:
+    """Errors and payloads of a batch are the ones of the packets parsed one by one."""
+    datagrams = random_datagrams(random.Random(42), 5000)
+    batch = RtpPacketBatch.from_datagrams(datagrams)
+    kinds = set()
+    for index, data in enumerate(datagrams):
+        packet = RtpPacket(data, len(data))
+        assert batch.errors(index) == packet.errors, data.hex()
+        assert batch.valid[index] == packet.valid
+        assert batch.payload(index) == packet.payload
+        kinds.add(tuple(packet.errors))
+    assert len(kinds) > 5  # Every error was covered, alone or along the others
+
+
+def test_packet_copy() -> None:
+    """The payload is copied out of a memoryview unless asked not to (as done by batches)."""
+    data = bytearray(RtpPacket.create(1, 2, RtpPacket.MP2T_PT, bytearray(b'abcd')).bytes)
+    packet = RtpPacket(memoryview(data), len(data))
+    data[-4:] = b'efgh'
+    assert isinstance(packet.payload, bytearray)
+    assert packet.payload == b'abcd'
+
+    batch = RtpPacketBatch(data, [0], [len(data)])
+    view = batch[0].payload
+    assert isinstance(view, memoryview)
+    assert view.obj is data
+    assert view == b'efgh'
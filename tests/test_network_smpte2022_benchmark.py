@@ -0,0 +1,71 @@
+"""Tests for the network.smpte2022.benchmark module."""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from pytoolbox.network.rtp import RtpPacket
+from pytoolbox.network.smpte2022.benchmark import (
+    ColumnBurstLoss,
+    GilbertElliottLoss,
+    LossModel,
+    UniformLoss,
+    benchmark,
+    create_medias,
+    main,
+)
+
+MEDIAS: list[RtpPacket] = create_medias(2000, start=65000)  # Sequence wraps around
+
+
+@pytest.mark.parametrize(
+    'loss',
+    [LossModel(), UniformLoss(0.005), GilbertElliottLoss(0.002, 0.5), ColumnBurstLoss(5, 400)],
+    ids=repr,
+)
+def test_benchmark_recovers_everything(loss: LossModel) -> None:
+    """Losses the FEC matrix can handle are fully recovered."""
+    result = benchmark(MEDIAS, 5, 5, loss)
+    assert result.medias == 2000
+    assert result.missing == 0
+    assert result.recovered == result.lost
+    assert result.recovery_ratio == 1.0
+    assert result.generator_rate > 0
+    assert result.receiver_rate > 0
+    assert result.max_media >= 50
+
+
+def test_benchmark_column_killing_burst() -> None:
+    """A burst longer than L kills a column: the media packets of the column cannot be recovered."""
+    result = benchmark(MEDIAS, 5, 5, ColumnBurstLoss(11, 1000))
+    assert result.lost == 22
+    assert 0 < result.missing < result.lost
+    assert result.recovery_ratio < 1.0
+
+
+def test_benchmark_incremental_generator() -> None:
+    """Both generator modes lead to the same recovery."""
+    loss = UniformLoss(0.01, seed=3)
+    stored = benchmark(MEDIAS, 4, 6, loss)
+    incremental = benchmark(MEDIAS, 4, 6, UniformLoss(0.01, seed=3), incremental=True)
+    assert (stored.lost, stored.recovered) == (incremental.lost, incremental.recovered)
+
+
+def test_benchmark_trace_memory() -> None:
+    """The peak memory usage of the receiver is reported when tracing memory."""
+    assert benchmark(MEDIAS[:500], 4, 4).peak_bytes_per_packet is None
+    peak = benchmark(MEDIAS[:500], 4, 4, trace_memory=True).peak_bytes_per_packet
+    assert peak is not None
+    assert peak > 0
+
+
+def test_main(capsys: pytest.CaptureFixture[str]) -> None:
+    """The command line outputs one JSON line per combination of matrix and loss model."""
+    results = main(['-c', '500', '-m', '4x5', '-m', '5x4', '-l', 'none', '-l', 'uniform:0.01'])
+    assert len(results) == 4
+    assert len(capsys.readouterr().out.splitlines()) == 4
+    main(['-c', '500', '-m', '4x5', '-l', 'gilbert:0.01:0.5', '--json'])
+    result = json.loads(capsys.readouterr().out)
+    assert (result['L'], result['D'], result['medias']) == (4, 5, 500)
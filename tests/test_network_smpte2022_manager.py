@@ -0,0 +1,122 @@
+"""Tests for the network.smpte2022.manager module."""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import signal
+from pathlib import Path
+
+import pytest
+
+from pytoolbox.network.rtp import RtpPacket
+from pytoolbox.network.smpte2022 import service
+from pytoolbox.network.smpte2022.manager import FecReceiverManager, FecWorker
+from pytoolbox.network.smpte2022.ring import SharedRing
+
+
+def test_worker(tmp_path: Path) -> None:
+    """The worker puts the datagrams of the ring into the receiver of their stream."""
+    ring = SharedRing(slots=64)
+    connection, _ = multiprocessing.Pipe()
+    worker = FecWorker(ring, connection)
+    try:  # pylint:disable=too-many-try-statements
+        worker.add_stream(3, '127.0.0.1:5000', str(tmp_path / 'output.ts'), 10, 0, True)
+        for i in range(30):
+            media = RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, bytearray([i] * 188))
+            assert ring.put(media.bytes, channel=3 << 2)
+        ring.put(b'not a media packet', channel=3 << 2)
+        ring.put(media.bytes, channel=4 << 2)  # Unknown stream
+        assert worker.process(limit=10) == 10
+        assert worker.process() == 22
+        assert worker.get_statistics()[3]['media_received'] == 30
+        statistics = worker.remove_stream(3)
+    finally:
+        ring.close()
+        ring.unlink()
+    assert statistics['media_received'] == 30
+    assert statistics['invalid'] == 1
+    assert statistics['media_missing'] == 0
+    assert (tmp_path / 'output.ts').read_bytes() == b''.join(bytes([i] * 188) for i in range(30))
+    assert isinstance(worker.execute('run', ()), ValueError)
+
+
+def test_worker_isolates_errors(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A datagram breaking the receiver is counted as invalid, the following are processed."""
+
+    def put(self: service.FecStream, kind: str, data: bytearray) -> None:
+        if data == b'boom':
+            raise RuntimeError('boom')
+        put_function(self, kind, data)
+
+    put_function = service.FecStream.put
+    monkeypatch.setattr(service.FecStream, 'put', put)
+    ring = SharedRing(slots=64)
+    connection, _ = multiprocessing.Pipe()
+    worker = FecWorker(ring, connection)
+    try:
+        worker.add_stream(1, '127.0.0.1:5000', str(tmp_path / 'output.ts'), 10, 0, True)
+        ring.put(b'boom', channel=1 << 2)
+        for i in range(10):
+            media = RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, bytearray([i] * 188))
+            assert ring.put(media.bytes, channel=1 << 2)
+        assert worker.process() == 11
+        statistics = worker.remove_stream(1)
+    finally:
+        ring.close()
+        ring.unlink()
+    assert statistics['invalid'] == 1
+    assert statistics['media_received'] == 10
+
+
+def test_manager_errors(tmp_path: Path) -> None:
+    """Errors raised by the workers are raised by the manager, a stream can be added once."""
+
+    async def main() -> None:
+        async with FecReceiverManager(1) as manager:
+            with pytest.raises(FileNotFoundError):
+                await manager.add_stream('127.0.0.1:0', tmp_path / 'missing' / 'output.ts')
+            await manager.add_stream('127.0.0.1:0', tmp_path / 'output.ts')
+            with pytest.raises(ValueError):
+                await manager.add_stream('127.0.0.1:0', tmp_path / 'output.ts')
+            statistics = manager.remove_stream('127.0.0.1:0')
+            assert statistics['media_received'] == statistics['dropped'] == 0
+            assert not manager.streams
+
+    asyncio.run(main())
+
+
+def test_manager_dead_worker(tmp_path: Path) -> None:
+    """A command sent to a worker that is gone raises RuntimeError, closing does not."""
+
+    async def main() -> None:
+        async with FecReceiverManager(1) as manager:
+            await manager.add_stream('127.0.0.1:0', tmp_path / 'output.ts')
+            assert not manager.get_dead_workers()
+            process = manager.workers[0].process
+            process.kill()
+            process.join()
+            assert manager.get_dead_workers() == [0]
+            with pytest.raises(RuntimeError):
+                manager.get_statistics()
+
+    asyncio.run(main())
+
+
+def test_manager_request_timeout() -> None:
+    """A command not answered in time raises RuntimeError and the worker is killed."""
+    manager = FecReceiverManager(1)
+    manager.request_timeout = 0.5
+    manager.start()
+    process = manager.workers[0].process
+    assert process.pid is not None
+    try:
+        assert not manager.get_statistics()
+        os.kill(process.pid, signal.SIGSTOP)
+        with pytest.raises(RuntimeError, match='did not answer'):
+            manager.get_statistics()
+        process.join(5)
+    finally:
+        manager.close()
+    assert process.exitcode == -signal.SIGKILL
@@ -0,0 +1,201 @@
+"""Tests for the network.smpte2022.writer module."""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+
+import pytest
+
+from pytoolbox.network.buffers import PayloadPool
+from pytoolbox.network.rtp import RtpPacket
+from pytoolbox.network.smpte2022 import writer as writer_module
+from pytoolbox.network.smpte2022.base import FecPacket
+from pytoolbox.network.smpte2022.generator import FecGenerator
+from pytoolbox.network.smpte2022.receiver import FecReceiver
+from pytoolbox.network.smpte2022.writer import PayloadWriter
+
+PAYLOADS: list[bytes] = [bytes([i]) * 188 for i in range(100)]
+
+
+def test_payload_writer_pipe() -> None:
+    """Payloads are written to a pipe with vectored writes, in order."""
+    read_fd, write_fd = os.pipe()
+    chunks: list[bytes] = []
+    reader = threading.Thread(
+        target=lambda: chunks.extend(iter(lambda: os.read(read_fd, 4096), b''))
+    )
+    reader.start()
+    with open(write_fd, 'wb') as output:
+        output.write(b'header')  # Buffered by output, must be written before the payloads
+        writer = PayloadWriter(output, max_bytes=188 * 10)
+        for payload in PAYLOADS:
+            writer.write(payload)
+        writer.flush()
+    reader.join()
+    os.close(read_fd)
+    assert writer.vectored
+    assert writer.writes == 10
+    assert writer.written == 188 * 100
+    assert b''.join(chunks) == b'header' + b''.join(PAYLOADS)
+
+
+def test_payload_writer_partial_writes(tmp_path, monkeypatch) -> None:
+    """Partial writes and the limit of buffers per vectored write are handled."""
+    writev = os.writev
+
+    def partial_writev(fileno: int, buffers: list) -> int:
+        return writev(fileno, [memoryview(b''.join(buffers))[:300]])
+
+    monkeypatch.setattr(writer_module, 'IOV_MAX', 3)
+    monkeypatch.setattr(os, 'writev', partial_writev)
+    path = tmp_path / 'output.ts'
+    with path.open('wb') as output:
+        writer = PayloadWriter(output, max_packets=len(PAYLOADS))
+        for payload in PAYLOADS:
+            writer.write(payload)
+        assert writer.pending == 0
+    assert writer.written == 188 * 100
+    assert writer.writes == 63  # 18800 bytes by 300 bytes (at most) chunks, 2 or 3 buffers each
+    assert path.read_bytes() == b''.join(PAYLOADS)
+
+
+def test_payload_writer_interrupted(tmp_path, monkeypatch) -> None:
+    """The payloads already written are not written again after an interrupted vectored write."""
+    writev, calls = os.writev, []
+
+    def failing_writev(fileno: int, buffers: list) -> int:
+        calls.append(len(buffers))
+        if len(calls) == 2:
+            raise BlockingIOError
+        return writev(fileno, buffers)
+
+    monkeypatch.setattr(writer_module, 'IOV_MAX', 4)
+    monkeypatch.setattr(os, 'writev', failing_writev)
+    path = tmp_path / 'output.ts'
+    with path.open('wb') as output:
+        writer = PayloadWriter(output, max_packets=10)
+        for payload in PAYLOADS[:9]:
+            writer.write(payload)
+        with pytest.raises(BlockingIOError):
+            writer.write(PAYLOADS[9])
+        assert writer.pending == 6
+        writer.flush()
+    assert path.read_bytes() == b''.join(PAYLOADS[:10])
+
+
+def test_payload_writer_thresholds() -> None:
+    """Thresholds must be positive."""
+    with pytest.raises(ValueError):
+        PayloadWriter(None, max_bytes=0)
+    with pytest.raises(ValueError):
+        PayloadWriter(None, max_packets=0)
+
+
+def test_payload_writer_pool(tmp_path) -> None:
+    """The payloads are released into the pool once written."""
+    pool = PayloadPool(sizes=(188,))
+    with (tmp_path / 'output.ts').open('wb') as output:
+        writer = PayloadWriter(output, max_packets=10, pool=pool)
+        for payload in PAYLOADS[:25]:
+            writer.write(bytearray(payload))
+        assert pool.available(188) == 20
+        writer.flush()
+    assert pool.available(188) == 25
+    assert (tmp_path / 'output.ts').read_bytes() == b''.join(PAYLOADS[:25])
+
+
+def test_payload_writer_memoryviews() -> None:
+    """Payloads of packets parsed without copy (memoryviews) are joined for a non-file output."""
+    output = io.BytesIO()
+    receiver = FecReceiver(output)  # type: ignore[arg-type]
+    for i, payload in enumerate(PAYLOADS):
+        data = bytearray(RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, bytearray(payload)).bytes)
+        media = RtpPacket(data, len(data), copy=False)
+        assert isinstance(media.payload, memoryview)
+        receiver.put_media(media, True)
+    receiver.flush()
+    assert not receiver.writer.vectored
+    assert output.getvalue() == b''.join(PAYLOADS)
+
+
+def run_receiver(loss_modulo: int) -> tuple[FecReceiver, io.BytesIO]:
+    """Send the payloads through a FEC generator and receiver (parsing the packets)."""
+    generator = FecGenerator(4, 4)
+    fecs: list[FecPacket] = []
+    generator.on_new_col = generator.on_new_row = fecs.append  # type: ignore[assignment,method-assign]
+    output = io.BytesIO()
+    receiver = FecReceiver(output)  # type: ignore[arg-type]
+    for i, payload in enumerate(PAYLOADS):
+        media = RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, bytearray(payload))
+        data = media.bytes
+        count = len(fecs)
+        generator.put_media(media)
+        if i % loss_modulo != loss_modulo // 2:  # Lost packets (recovered)
+            receiver.put_media(RtpPacket(data, len(data)), True)
+        for fec in fecs[count:]:
+            data = RtpPacket.create(fec.sequence, 0, RtpPacket.DYNAMIC_PT, fec.bytes).bytes
+            receiver.put_fec(FecPacket(data, len(data)))
+    receiver.flush()
+    return receiver, output
+
+
+def test_fec_receiver_payload_pool() -> None:
+    """The payloads recycled by the receiver are reused by the parsed and recovered packets."""
+    pool = RtpPacket.payload_pool = PayloadPool(sizes=(188,))
+    try:
+        receiver, output = run_receiver(10)
+    finally:
+        RtpPacket.payload_pool = None
+    assert receiver.media_recovered == 10
+    assert output.getvalue() == b''.join(PAYLOADS)
+    assert pool.hits > 0
+
+
+def test_fec_receiver_crosses() -> None:
+    """The crosses of the unrecoverable media packets are expired in order, then reused."""
+    generator = FecGenerator(4, 4)
+    fecs: list[FecPacket] = []
+    generator.on_new_col = generator.on_new_row = fecs.append  # type: ignore[assignment,method-assign]
+    receiver = FecReceiver(io.BytesIO())  # type: ignore[arg-type]
+    receiver.set_delay(20, FecReceiver.PACKETS)
+    for i, payload in enumerate(PAYLOADS[:68]):
+        media = RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, bytearray(payload))
+        count = len(fecs)
+        generator.put_media(media)
+        if i not in {5, 6, 9, 10, 53, 54, 57, 58}:  # Squares lost in two matrices
+            receiver.put_media(RtpPacket(media.bytes, len(media.bytes)), True)
+        for fec in fecs[count:]:
+            data = RtpPacket.create(fec.sequence, 0, RtpPacket.DYNAMIC_PT, fec.bytes).bytes
+            receiver.put_fec(FecPacket(data, len(data)))
+    # The crosses of the first matrix were removed when output, then reused for the second one
+    assert receiver.media_missing == 4
+    assert list(receiver.crosses) == [53, 54, 57, 58]
+    assert list(receiver._crosses_order) == [53, 54, 57, 58]  # pylint:disable=protected-access
+    assert not receiver._spare_crosses  # pylint:disable=protected-access
+    assert len(receiver.cols) == len(receiver.rows) == 2
+
+    receiver.position = 55  # Skip (not output) the first row of the last matrix
+    receiver.cleanup()
+    assert list(receiver.crosses) == [57, 58]
+    assert (len(receiver.cols), len(receiver.rows)) == (0, 1)  # Linked to the removed crosses
+    assert len(receiver._spare_crosses) == 2  # pylint:disable=protected-access
+
+
+def test_fec_generator_payload_pool() -> None:
+    """The accumulators of shorter payloads are moved to pooled buffers of the longest size."""
+    pool = RtpPacket.payload_pool = PayloadPool(sizes=(100, 188))
+    fecs: dict[bool, list[FecPacket]] = {False: [], True: []}
+    try:
+        for incremental, output in fecs.items():
+            generator = FecGenerator(2, 2, incremental=incremental)
+            generator.on_new_col = generator.on_new_row = output.append  # type: ignore[assignment,method-assign]
+            for i, size in enumerate((100, 188, 188, 100)):
+                payload = bytearray(PAYLOADS[i + 1][:size])
+                generator.put_media(RtpPacket.create(i, i * 900, RtpPacket.MP2T_PT, payload))
+    finally:
+        RtpPacket.payload_pool = None
+    assert fecs[False] == fecs[True]
+    assert [len(fec.payload_recovery) for fec in fecs[True]] == [188] * 4
+    assert pool.available(100) == 2  # The accumulators of the first column and row